@@ -0,0 +1 @@
+"""Benchmarks for RRVA MCP Server"""
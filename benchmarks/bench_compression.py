@@ -0,0 +1,184 @@
+"""
+Audit Compression Benchmark
+Measures write throughput, read throughput and compression ratio for each
+audit codec on transcripts, decision logs and receipts.
+
+The stored samples in storage/ are scaled up to --docs documents per segment
+with varied IDs, timestamps and conversation turns. Dictionaries are trained
+on the first --train-fraction of the documents and measured on the rest, so
+the ratios are for content the dictionary has not seen. Every document is
+written as its own file (as AuditLogger does) into a temporary directory.
+
+Usage:
+    python -m benchmarks.bench_compression
+    python -m benchmarks.bench_compression --docs 20000 --output compression.json
+"""
+
+from typing import Any, Dict, List
+from pathlib import Path
+import argparse
+import gzip
+import json
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from tools.compression import (  # noqa: E402
+    ZSTD_AVAILABLE, Compressor, canonical_json, collect_samples, train_dictionaries
+)
+
+_DIGITS = re.compile(r"\d")
+
+
+def _vary(value: Any, rng: random.Random) -> Any:
+    """Copy of a sample with new digits in every string (IDs, amounts, timestamps)."""
+    if isinstance(value, dict):
+        return {key: _vary(item, rng) for key, item in value.items()}
+    if isinstance(value, list):
+        items = [_vary(item, rng) for item in value]
+        if len(items) > 2 and rng.random() < 0.5:
+            # Conversations of different lengths
+            del items[rng.randrange(len(items)):]
+        return items
+    if isinstance(value, str) and any(ch.isdigit() for ch in value):
+        return _DIGITS.sub(lambda _: str(rng.randrange(10)), value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return type(value)(value * rng.uniform(0.5, 1.5))
+    return value
+
+
+def scale_samples(samples: List[bytes], count: int, seed: int) -> List[Any]:
+    rng = random.Random(seed)
+    parsed = [json.loads(sample) for sample in samples]
+    return [_vary(rng.choice(parsed), rng) for _ in range(count)]
+
+
+def _allocated_bytes(path: Path) -> int:
+    stat = path.stat()
+    return getattr(stat, "st_blocks", 0) * 512 or stat.st_size
+
+
+def measure(name: str, docs: List[Any], directory: Path, serialize) -> Dict[str, Any]:
+    """Write each document as a file, then read them all back."""
+    directory.mkdir(parents=True)
+    raw_bytes = 0
+    stored_bytes = 0
+    started = time.perf_counter()
+    paths = []
+    for i, doc in enumerate(docs):
+        data, raw = serialize(doc)
+        path = directory / f"{i}.bin"
+        with open(path, "wb") as f:
+            f.write(data)
+        raw_bytes += raw
+        stored_bytes += len(data)
+        paths.append(path)
+    write_seconds = time.perf_counter() - started
+    allocated = sum(_allocated_bytes(path) for path in paths)
+    return {
+        "codec": name,
+        "docs": len(docs),
+        "json_bytes": raw_bytes,
+        "stored_bytes": stored_bytes,
+        "allocated_bytes": allocated,
+        "write_docs_per_sec": round(len(docs) / write_seconds, 1),
+        "write_mb_per_sec": round(raw_bytes / write_seconds / 1e6, 2),
+        "paths": paths
+    }
+
+
+def run_suite(docs_per_segment: int, train_fraction: float, seed: int, dict_size: int) -> Dict[str, Any]:
+    samples = collect_samples(REPO_ROOT / "storage", Compressor("none", REPO_ROOT / "storage" / "dictionaries"))
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory(prefix="rrva-compression-") as workdir:
+        workdir = Path(workdir)
+        for segment, segment_samples in samples.items():
+            if not segment_samples:
+                continue
+            docs = scale_samples(segment_samples, docs_per_segment, seed)
+            split = max(1, int(len(docs) * train_fraction))
+            training, evaluation = docs[:split], docs[split:]
+
+            dict_dir = workdir / segment / "dictionaries"
+            train_dictionaries({segment: [canonical_json(doc) for doc in training]}, dict_dir, dict_size)
+
+            codecs = {
+                # The previous format: indented, uncompressed JSON
+                "json-indent": lambda doc: _plain(json.dumps(doc, indent=2).encode("utf-8")),
+                "gzip": lambda doc: _gzip(canonical_json(doc)),
+                "deflate": _codec(Compressor("deflate", workdir / "none"), None),
+                "deflate+dict": _codec(Compressor("deflate", dict_dir), segment),
+            }
+            if ZSTD_AVAILABLE:
+                codecs["zstd"] = _codec(Compressor("zstd", workdir / "none"), None)
+                codecs["zstd+dict"] = _codec(Compressor("zstd", dict_dir), segment)
+
+            baseline_bytes = None
+            segment_results = {}
+            for name, serialize in codecs.items():
+                result = measure(name, evaluation, workdir / segment / name, serialize)
+                paths = result.pop("paths")
+                reader = Compressor("none", dict_dir)
+                started = time.perf_counter()
+                for path in paths:
+                    json.loads(reader.decompress(path.read_bytes()))
+                result["read_docs_per_sec"] = round(len(paths) / (time.perf_counter() - started), 1)
+                if baseline_bytes is None:
+                    baseline_bytes = result["stored_bytes"]
+                result["ratio"] = round(baseline_bytes / result["stored_bytes"], 2)
+                segment_results[name] = result
+                print(f"  {segment:<13} {name:<13} ratio={result['ratio']:>6.2f}x "
+                      f"write={result['write_docs_per_sec']:>9.0f} docs/s read={result['read_docs_per_sec']:>9.0f} docs/s "
+                      f"disk={result['allocated_bytes'] / 1e6:.1f}MB", file=sys.stderr)
+            results[segment] = segment_results
+
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "docs_per_segment": docs_per_segment,
+        "train_fraction": train_fraction,
+        "results": results
+    }
+
+
+def _plain(data: bytes):
+    return data, len(data)
+
+
+def _gzip(data: bytes):
+    return gzip.compress(data, mtime=0), len(data)
+
+
+def _codec(compressor: Compressor, segment):
+    def serialize(doc):
+        data = canonical_json(doc)
+        return compressor.compress(data, segment), len(data)
+    return serialize
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark audit artifact compression")
+    parser.add_argument("--docs", type=int, default=5000, help="Documents per segment (scaled from storage/)")
+    parser.add_argument("--train-fraction", type=float, default=0.2, help="Share of documents used to train dictionaries")
+    parser.add_argument("--dict-size", type=int, default=16 * 1024)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Write results JSON to this file")
+    args = parser.parse_args()
+
+    results = run_suite(args.docs, args.train_fraction, args.seed, args.dict_size)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
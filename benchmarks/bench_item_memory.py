@@ -0,0 +1,96 @@
+"""
+Line Item Memory Benchmark
+Compares list-of-dicts order items with the compact LineItems representation.
+
+Usage:
+    python -m benchmarks.bench_item_memory --items 2000000
+"""
+
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+from typing import Any, Dict, Iterator, List
+
+from tools.items import LineItems
+
+CONDITION_MIX = [("unopened", 70), ("used", 15), ("defective", 10), ("wrong_item", 5)]
+
+
+def _generate_orders(total_items: int, seed: int) -> Iterator[List[Dict[str, Any]]]:
+    """Yield per-order item lists (1-5 items each) until total_items is reached."""
+    rng = random.Random(seed)
+    conditions = [name for name, weight in CONDITION_MIX for _ in range(weight)]
+    catalog = [f"Product {n}" for n in range(5000)]
+    produced = 0
+    while produced < total_items:
+        count = min(rng.randint(1, 5), total_items - produced)
+        yield [
+            {
+                "item_id": f"ITEM{produced + n:09d}",
+                "product_name": rng.choice(catalog),
+                "quantity": rng.randint(1, 3),
+                "price": round(rng.uniform(5, 500), 2),
+                "condition": rng.choice(conditions),
+                "fulfillment_status": "delivered"
+            }
+            for n in range(count)
+        ]
+        produced += count
+
+
+def _measure(build) -> Dict[str, Any]:
+    """Run build() under tracemalloc and report retained bytes and build time."""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    data = build()
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    if isinstance(data[0], LineItems):
+        total = sum(items.subtotal() for items in data)
+    else:
+        total = sum(item["price"] * item["quantity"] for items in data for item in items)
+    scan_seconds = time.perf_counter() - started
+
+    del data
+    gc.collect()
+    return {
+        "retained_bytes": current,
+        "build_seconds": round(elapsed, 3),
+        "scan_seconds": round(scan_seconds, 3),
+        "scan_total": round(total, 2)
+    }
+
+
+def run(total_items: int, seed: int = 42) -> Dict[str, Any]:
+    """Measure both representations on the same generated catalog."""
+    dicts = _measure(lambda: list(_generate_orders(total_items, seed)))
+    compact = _measure(lambda: [LineItems.from_dicts(items) for items in _generate_orders(total_items, seed)])
+    return {
+        "items": total_items,
+        "dict_items": dicts,
+        "line_items": compact,
+        "bytes_per_item": {
+            "dict_items": round(dicts["retained_bytes"] / total_items, 1),
+            "line_items": round(compact["retained_bytes"] / total_items, 1)
+        },
+        "memory_reduction": round(1 - compact["retained_bytes"] / dicts["retained_bytes"], 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare order item memory layouts")
+    parser.add_argument("--items", type=int, default=2_000_000, help="Total line items to generate")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    print(json.dumps(run(args.items, args.seed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Cold Start Benchmark
+Measures how long the MCP servers take to become useful after a restart:
+- import time of each server module (`python -X importtime`), with the
+  heaviest top-level imports
+- wall-clock time from spawning the server to the first tools/list response
+  (HTTP: POST /mcp; stdio: initialize + tools/list over stdin)
+
+Each measurement is the median of --runs fresh processes. Servers run from a
+temporary working directory, so nothing is written to the repository's storage/.
+
+Usage:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --save-baseline benchmarks/startup_baseline.json
+    python -m benchmarks.bench_startup --compare benchmarks/startup_baseline.json --tolerance 0.25
+"""
+
+from typing import Any, Dict, List, Optional
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+SERVERS = {
+    "http": "mcp_server_http",
+    "stdio": "mcp_server",
+}
+
+# Metrics compared against the baseline (higher is worse)
+COMPARED_METRICS = ("import_ms", "first_tools_list_ms")
+
+
+def _env(**extra: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(REPO_ROOT), env.get("PYTHONPATH")]))
+    env.pop("RESEND_API_KEY", None)
+    env.update(extra)
+    return env
+
+
+def parse_importtime(stderr: str, module: str, top: int = 10) -> Dict[str, Any]:
+    """
+    Summarize `python -X importtime` output.
+
+    Returns:
+        Dict with the module's cumulative import time and the heaviest
+        top-level imports it triggered (cumulative microseconds)
+    """
+    total_us = 0
+    top_level: List[Dict[str, Any]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue  # header line
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        if name == module and depth == 0:
+            total_us = cumulative_us
+        elif depth <= 1:
+            top_level.append({"module": name, "cumulative_ms": round(cumulative_us / 1000, 2), "self_us": self_us})
+    top_level.sort(key=lambda entry: entry["cumulative_ms"], reverse=True)
+    return {"import_ms": round(total_us / 1000, 2), "top_imports": top_level[:top]}
+
+
+def measure_import(module: str, workdir: str) -> Dict[str, Any]:
+    """Import a server module in a fresh interpreter and time it."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=workdir, env=_env(), capture_output=True, text=True, timeout=120
+    )
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "import failed"}
+    return parse_importtime(completed.stderr, module)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def first_tools_list_http(workdir: str, timeout: float = 60.0) -> Dict[str, Any]:
+    """Spawn the HTTP server and poll POST /mcp tools/list until it answers."""
+    port = _free_port()
+    payload = json.dumps({"jsonrpc": "2.0", "id": 1, "method": "tools/list"}).encode()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, str(REPO_ROOT / "mcp_server_http.py")],
+        cwd=workdir, env=_env(PORT=str(port), HOST="127.0.0.1"),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                return {"error": process.stderr.read().decode(errors="replace").strip()[-300:] or "server exited"}
+            request = urllib.request.Request(
+                f"http://127.0.0.1:{port}/mcp", data=payload, headers={"Content-Type": "application/json"}
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=1) as response:
+                    message = json.load(response)
+            except OSError:
+                time.sleep(0.005)
+                continue
+            if "result" not in message:
+                return {"error": json.dumps(message.get("error"))}
+            return {
+                "first_tools_list_ms": round((time.perf_counter() - started) * 1000, 2),
+                "tools": len(message["result"]["tools"])
+            }
+        return {"error": f"no tools/list response within {timeout}s"}
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def first_tools_list_stdio(workdir: str, timeout: float = 60.0) -> Dict[str, Any]:
+    """Spawn the stdio server, send initialize and tools/list, and wait for the tool list."""
+    messages = [
+        {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {},
+            "clientInfo": {"name": "bench_startup", "version": "1.0"}
+        }},
+        {"jsonrpc": "2.0", "method": "notifications/initialized"},
+        {"jsonrpc": "2.0", "id": 2, "method": "tools/list"},
+    ]
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, str(REPO_ROOT / "mcp_server.py")],
+        cwd=workdir, env=_env(),
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    try:
+        # The requests wait in the pipe until the server starts reading
+        process.stdin.write("".join(json.dumps(m) + "\n" for m in messages).encode())
+        process.stdin.flush()
+        for line in process.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if message.get("id") == 2:
+                if "result" not in message:
+                    return {"error": json.dumps(message.get("error"))}
+                return {
+                    "first_tools_list_ms": round((time.perf_counter() - started) * 1000, 2),
+                    "tools": len(message["result"]["tools"])
+                }
+            if time.perf_counter() - started > timeout:
+                break
+        process.kill()
+        stderr = process.stderr.read().decode(errors="replace").strip()
+        return {"error": stderr.splitlines()[-1] if stderr else "no tools/list response"}
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+
+def _median(runs: List[Dict[str, Any]], key: str) -> Optional[float]:
+    values = [run[key] for run in runs if key in run]
+    return round(statistics.median(values), 2) if values else None
+
+
+def run_suite(runs: int, servers: List[str]) -> Dict[str, Any]:
+    """Measure import and first-tools/list time for each server (median of fresh processes)."""
+    results: Dict[str, Any] = {}
+    probes = {"http": first_tools_list_http, "stdio": first_tools_list_stdio}
+    with tempfile.TemporaryDirectory(prefix="rrva-startup-") as workdir:
+        for server in servers:
+            module = SERVERS[server]
+            imports = [measure_import(module, workdir) for _ in range(runs)]
+            starts = [probes[server](workdir) for _ in range(runs)]
+            errors = sorted({run["error"] for run in imports + starts if "error" in run})
+            summary = {
+                "import_ms": _median(imports, "import_ms"),
+                "first_tools_list_ms": _median(starts, "first_tools_list_ms"),
+                "top_imports": next((run["top_imports"] for run in imports if "top_imports" in run), []),
+            }
+            if errors:
+                summary["errors"] = errors
+            results[server] = summary
+            print(f"  {server:<6} import={summary['import_ms']}ms "
+                  f"first tools/list={summary['first_tools_list_ms']}ms", file=sys.stderr)
+            for error in errors:
+                print(f"  {server:<6} error: {error}", file=sys.stderr)
+
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "runs": runs,
+        "results": results
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return a description of every startup metric that regressed beyond the tolerance."""
+    regressions = []
+    for server, metrics in current["results"].items():
+        base = baseline.get("results", {}).get(server)
+        if not base:
+            continue
+        for metric in COMPARED_METRICS:
+            if base.get(metric) and metrics.get(metric) and metrics[metric] > base[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{server} {metric}: {metrics[metric]:.1f}ms vs baseline "
+                    f"{base[metric]:.1f}ms (+{metrics[metric] / base[metric] - 1:.0%})"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MCP server cold start")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per measurement")
+    parser.add_argument("--servers", default="http,stdio", help="Comma-separated subset of http,stdio")
+    parser.add_argument("--output", default=None, help="Write results JSON to this file")
+    parser.add_argument("--save-baseline", default=None, help="Write results as the new baseline")
+    parser.add_argument("--compare", default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before failing")
+    args = parser.parse_args()
+
+    results = run_suite(args.runs, [s.strip() for s in args.servers.split(",") if s.strip()])
+
+    output_paths = [Path(p) for p in (args.output, args.save_baseline) if p]
+    for path in output_paths:
+        path.write_text(json.dumps(results, indent=2))
+    if not output_paths:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        regressions = compare(results, json.loads(Path(args.compare).read_text()), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} of {args.compare}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Tool Handler Benchmark Suite
+Measures p50/p99 latency and throughput for every handler behind call_tool,
+at several dataset sizes, and compares against a stored JSON baseline.
+
+The benchmark runs from a temporary working directory, so audit writes
+(decision logs, transcripts, receipts) never touch the repository's storage/.
+OTP emails are never sent: the Resend client is disabled for the run.
+
+An event loop watchdog (tools/watchdog.py) runs during the suite. It reports
+every call that blocks the loop longer than --block-threshold-ms, per tool.
+--fail-on-blocking turns any such stall into a failing exit status.
+
+Usage:
+    python -m benchmarks.bench_tools --sizes 0,10000,100000
+    python -m benchmarks.bench_tools --save-baseline benchmarks/baseline.json
+    python -m benchmarks.bench_tools --compare benchmarks/baseline.json --tolerance 0.25
+    python -m benchmarks.bench_tools --fail-on-blocking --block-threshold-ms 50
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Metrics compared against the baseline (higher is worse)
+COMPARED_METRICS = ("p50_ms", "p99_ms")
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies_ns: List[int], elapsed_s: float) -> Dict[str, float]:
+    """Summarize per-call latencies (ns) into ms percentiles and ops/sec."""
+    values = sorted(ns / 1e6 for ns in latencies_ns)
+    return {
+        "iterations": len(values),
+        "p50_ms": round(_percentile(values, 50), 4),
+        "p90_ms": round(_percentile(values, 90), 4),
+        "p99_ms": round(_percentile(values, 99), 4),
+        "mean_ms": round(statistics.fmean(values), 4) if values else 0.0,
+        "max_ms": round(values[-1], 4) if values else 0.0,
+        "ops_per_sec": round(len(values) / elapsed_s, 1) if elapsed_s > 0 else 0.0
+    }
+
+
+class NoArgumentBuilder(ValueError):
+    """Raised for a tool the suite has no argument builder for (the tool is skipped)."""
+
+
+class ToolBench:
+    """Builds arguments for each tool and times call_tool."""
+
+    def __init__(self, server, seed: int = 7, watchdog=None):
+        self.server = server
+        self.watchdog = watchdog
+        self.rng = random.Random(seed)
+        self.customers: List[Dict[str, Any]] = []
+        self.refund_ids: List[str] = []
+
+    def refresh_targets(self) -> None:
+        """Collect customers with at least one order to draw arguments from."""
+        from tools.identity import _customer_db
+        self.customers = [c for c in _customer_db.values() if c.get("orders")]
+
+    def _customer(self) -> Tuple[Dict[str, Any], str]:
+        customer = self.rng.choice(self.customers)
+        return customer, self.rng.choice(customer["orders"])
+
+    async def _prime_otp(self, customer_id: str) -> str:
+        """Send an OTP (untimed setup) and return the code."""
+        result = await self.server.identity_verifier.send_otp(customer_id=customer_id)
+        return result["_debug_otp"]
+
+    async def arguments(self, tool: str) -> Dict[str, Any]:
+        """Build arguments for one call (setup work here is not timed)."""
+        customer, order_id = self._customer()
+        customer_id = customer["customer_id"]
+        session_id = f"BENCH{self.rng.randrange(10 ** 9)}"
+
+        if tool == "verify_by_order_and_name":
+            return {"order_id": order_id, "name": customer["name"]}
+        if tool == "verify_customer_identity":
+            return {
+                "order_id": order_id,
+                "customer_id": customer_id,
+                "otp_code": await self._prime_otp(customer_id)
+            }
+        if tool == "send_otp":
+            return {"customer_id": customer_id, "method": "email"}
+        if tool == "verify_otp":
+            return {"customer_id": customer_id, "otp_code": await self._prime_otp(customer_id)}
+        if tool == "get_order_history":
+            return {"customer_id": customer_id, "limit": 10}
+        if tool == "get_transaction_history":
+            return {"order_id": order_id, "customer_id": customer_id}
+        if tool == "check_refund_eligibility":
+            return {"order_id": order_id, "customer_id": customer_id, "reason": "benchmark"}
+        if tool == "execute_refund":
+            # An order is refunded once: release its claim so every call executes a refund
+            self.server.refund_executor._order_refunds.pop(order_id.replace("-", ""), None)
+            return {"order_id": order_id, "customer_id": customer_id, "reason": "benchmark"}
+        if tool == "query_decisions":
+            return {"customer_id": customer_id, "limit": 20}
+        if tool == "log_decision":
+            return {
+                "session_id": session_id,
+                "customer_id": customer_id,
+                "decision_type": "refund_approved",
+                "inputs": {"order_id": order_id, "reason": "benchmark"},
+                "policy_checks": [{"check": "time_window", "passed": True}],
+                "outcome": {"amount": 10.0, "currency": "USD"}
+            }
+        if tool == "store_artifact":
+            return {
+                "session_id": session_id,
+                "artifact_type": "transcript",
+                "content": json.dumps({"conversation": _TRANSCRIPT}),
+                "metadata": {"call_duration_seconds": 120}
+            }
+        if tool == "get_refund_receipt":
+            if not self.refund_ids:
+                result = await self.server.refund_executor.execute(
+                    order_id=order_id, customer_id=customer_id, reason="benchmark"
+                )
+                self.refund_ids.append(result["refund_id"])
+            return {"refund_id": self.rng.choice(self.refund_ids)}
+        if tool == "end_call":
+            return {
+                "session_id": session_id,
+                "customer_id": customer_id,
+                "decision_type": "refund_denied",
+                "transcript": _TRANSCRIPT,
+                "inputs": {"order_id": order_id},
+                "outcome": {"action": "none"},
+                "metadata": {"call_duration_seconds": 120}
+            }
+        raise NoArgumentBuilder(f"No argument builder for tool: {tool}")
+
+    async def run_tool(self, tool: str, iterations: int, warmup: int) -> Dict[str, Any]:
+        """Time call_tool for one tool and return its summary."""
+        for _ in range(warmup):
+            await self.server.call_tool(tool, await self.arguments(tool))
+
+        if self.watchdog is not None:
+            self.watchdog.events.clear()
+        latencies: List[int] = []
+        errors = 0
+        busy_ns = 0
+        for _ in range(iterations):
+            arguments = await self.arguments(tool)
+            started = time.perf_counter_ns()
+            result = await self.server.call_tool(tool, arguments)
+            elapsed = time.perf_counter_ns() - started
+            latencies.append(elapsed)
+            busy_ns += elapsed
+            if isinstance(result, dict) and "error" in result and "tool" in result:
+                errors += 1
+            # Let the watchdog heartbeat run between calls
+            await asyncio.sleep(0)
+
+        summary = summarize(latencies, busy_ns / 1e9)
+        summary["errors"] = errors
+        if self.watchdog is not None:
+            stalls = [event for event in self.watchdog.events if event.tool == tool]
+            summary["blocked_calls"] = len(stalls)
+            summary["max_blocked_ms"] = round(max((e.blocked_seconds for e in stalls), default=0.0) * 1000, 3)
+            summary["blocking_locations"] = sorted({e.location for e in stalls})
+        return summary
+
+
+# Short agent/customer exchange used by transcript-writing tools
+_TRANSCRIPT = [
+    {"speaker": "customer", "text": "Hi, I would like to refund my order."},
+    {"speaker": "agent", "text": "I can help with that. Could you give me your order ID and name?"},
+    {"speaker": "customer", "text": "Sure, it's ORD001, Sanjyot Sathe."},
+    {"speaker": "agent", "text": "Thanks. I've sent a verification code to your email."},
+]
+
+
+async def run_suite(
+    sizes: List[int],
+    iterations: int,
+    warmup: int,
+    tools: Optional[List[str]] = None,
+    seed: int = 42,
+    block_threshold_ms: float = 50.0
+) -> Dict[str, Any]:
+    """Run every tool at each dataset size (synthetic customers on top of the samples)."""
+    import mcp_server_http as server
+    from tools.synthetic import load_customers
+    from tools.watchdog import LoopWatchdog
+
+    # Never send real OTP emails from a benchmark
+    server.identity_verifier.resend_configured = False
+
+    watchdog = LoopWatchdog(threshold=block_threshold_ms / 1000, interval=min(0.02, block_threshold_ms / 2000))
+    watchdog.start()
+    bench = ToolBench(server, watchdog=watchdog)
+    tool_names = tools or [tool.name for tool in server.AVAILABLE_TOOLS]
+    results: Dict[str, Any] = {}
+    loaded = 0
+    for size in sorted(sizes):
+        if size > loaded:
+            load_customers(size - loaded, seed=seed, start=loaded)
+            loaded = size
+        bench.refresh_targets()
+        size_results = {}
+        for tool in tool_names:
+            try:
+                size_results[tool] = await bench.run_tool(tool, iterations, warmup)
+            except NoArgumentBuilder as e:
+                print(f"Warning: {e}, skipping", file=sys.stderr)
+                continue
+            print(f"  size={size:<8} {tool:<28} p50={size_results[tool]['p50_ms']:.3f}ms "
+                  f"p99={size_results[tool]['p99_ms']:.3f}ms {size_results[tool]['ops_per_sec']:.0f} ops/s",
+                  file=sys.stderr)
+        results[str(size)] = size_results
+    await watchdog.stop()
+
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "iterations": iterations,
+        "block_threshold_ms": block_threshold_ms,
+        "results": results
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return a description of every metric that regressed beyond the tolerance."""
+    regressions = []
+    for size, tools in current["results"].items():
+        for tool, metrics in tools.items():
+            base = baseline.get("results", {}).get(size, {}).get(tool)
+            if not base:
+                continue
+            for metric in COMPARED_METRICS:
+                if base[metric] > 0 and metrics[metric] > base[metric] * (1 + tolerance):
+                    regressions.append(
+                        f"size={size} {tool} {metric}: {metrics[metric]:.4f} vs baseline "
+                        f"{base[metric]:.4f} (+{metrics[metric] / base[metric] - 1:.0%})"
+                    )
+    return regressions
+
+
+def blocking_handlers(results: Dict[str, Any]) -> List[str]:
+    """Describe every tool that blocked the event loop during the run."""
+    lines = []
+    for size, tools in results["results"].items():
+        for tool, summary in tools.items():
+            if summary.get("blocked_calls"):
+                lines.append(
+                    f"size={size} {tool}: {summary['blocked_calls']} stalls, max {summary['max_blocked_ms']}ms "
+                    f"at {', '.join(summary['blocking_locations'])}"
+                )
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every MCP tool handler")
+    parser.add_argument("--sizes", default="0,10000", help="Comma-separated synthetic customer counts")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--tools", default=None, help="Comma-separated subset of tools")
+    parser.add_argument("--output", default=None, help="Write results JSON to this file")
+    parser.add_argument("--save-baseline", default=None, help="Write results as the new baseline")
+    parser.add_argument("--compare", default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before failing")
+    parser.add_argument("--block-threshold-ms", type=float, default=50.0, help="Event loop stall reported as blocking")
+    parser.add_argument("--fail-on-blocking", action="store_true", help="Exit 1 if any handler blocks the event loop")
+    args = parser.parse_args()
+
+    output_paths = [Path(p).resolve() for p in (args.output, args.save_baseline) if p]
+    baseline_path = Path(args.compare).resolve() if args.compare else None
+
+    # Run from a scratch directory so audit artifacts don't land in storage/
+    sys.path.insert(0, str(REPO_ROOT))
+    workdir = tempfile.mkdtemp(prefix="rrva-bench-")
+    os.chdir(workdir)
+    os.environ.pop("RESEND_API_KEY", None)
+
+    results = asyncio.run(run_suite(
+        sizes=[int(s) for s in args.sizes.split(",") if s.strip()],
+        iterations=args.iterations,
+        warmup=args.warmup,
+        tools=args.tools.split(",") if args.tools else None,
+        block_threshold_ms=args.block_threshold_ms
+    ))
+
+    for path in output_paths:
+        path.write_text(json.dumps(results, indent=2))
+    if not output_paths:
+        print(json.dumps(results, indent=2))
+
+    failed = False
+    if baseline_path:
+        regressions = compare(results, json.loads(baseline_path.read_text()), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        failed = bool(regressions)
+        if not regressions:
+            print(f"No regressions beyond {args.tolerance:.0%} of {baseline_path}", file=sys.stderr)
+
+    if args.fail_on_blocking:
+        blocking = blocking_handlers(results)
+        for line in blocking:
+            print(f"BLOCKING {line}", file=sys.stderr)
+        failed = failed or bool(blocking)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
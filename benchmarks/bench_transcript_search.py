@@ -0,0 +1,208 @@
+"""
+Transcript Search Benchmark
+Measures full-text query latency over a large transcript index.
+
+Builds a TranscriptIndex of --transcripts synthetic calls (default one
+million) in a temporary directory. Turns are sentences from the stored
+transcripts in storage/, with words swapped for others from a Zipf-weighted
+vocabulary. Review phrases are planted at known rates: "chargeback" in 1% of
+calls and "talk to a lawyer" in 0.1%, mostly in customer turns. Each query
+runs --runs times against the warm index. Grepping the same number of JSON
+files is reported for a small sample as a baseline.
+
+Usage:
+    python -m benchmarks.bench_transcript_search
+    python -m benchmarks.bench_transcript_search --transcripts 100000 --output search.json
+    python -m benchmarks.bench_transcript_search --keep storage_bench/transcript_index.db
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from pathlib import Path
+import argparse
+import itertools
+import json
+import platform
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from tools.compression import Compressor, read_json  # noqa: E402
+from tools.transcript_search import TranscriptIndex, extract_turns  # noqa: E402
+
+BUILD_BATCH = 2000
+
+# (name, query, speaker, match)
+QUERIES = [
+    ("rare term", "chargeback", None, "all"),
+    ("rare term, customer turns", "chargeback", "customer", "all"),
+    ("phrase", '"talk to a lawyer"', None, "all"),
+    ("phrase, customer turns", '"talk to a lawyer"', "customer", "all"),
+    ("any of two", 'chargeback "talk to a lawyer"', "customer", "any"),
+    ("two common terms", "refund eligible", None, "all"),
+    ("common term", "refund", None, "all"),
+]
+
+# Planted review phrases: (text, share of calls)
+PLANTED = [
+    ("I am going to file a chargeback with my bank", 0.01),
+    ("if this is not fixed I will talk to a lawyer", 0.001),
+]
+
+_WORD = re.compile(r"[A-Za-z']+")
+
+
+def load_sentences() -> List[Tuple[str, str]]:
+    """(speaker, text) turns of the transcripts in storage/."""
+    compressor = Compressor("none", REPO_ROOT / "storage" / "dictionaries")
+    turns = []
+    for path in sorted((REPO_ROOT / "storage" / "transcripts").glob("*.json*")):
+        turns.extend(extract_turns(read_json(path, compressor)))
+    if not turns:
+        turns = [("customer", "I would like a refund for my order"), ("agent", "Let me check if the order is eligible")]
+    return turns
+
+
+class TranscriptGenerator:
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        self.turns = load_sentences()
+        words = sorted({word.lower() for _, text in self.turns for word in _WORD.findall(text)})
+        # Extra vocabulary so term frequencies follow a long tail
+        words += [f"term{i}" for i in range(20000)]
+        self.words = words
+        self.cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(words))))
+
+    def _vary(self, text: str) -> str:
+        tokens = text.split()
+        for _ in range(max(1, len(tokens) // 5)):
+            tokens[self.rng.randrange(len(tokens))] = self.rng.choices(self.words, cum_weights=self.cum_weights)[0]
+        return " ".join(tokens)
+
+    def transcript(self) -> Dict[str, Any]:
+        count = self.rng.randint(6, 16)
+        conversation = []
+        for i in range(count):
+            _, text = self.rng.choice(self.turns)
+            conversation.append({"speaker": "customer" if i % 2 == 0 else "agent", "text": self._vary(text)})
+        for phrase, share in PLANTED:
+            if self.rng.random() < share:
+                # Mostly said by the customer; sometimes repeated back by the agent
+                turn = self.rng.randrange(count)
+                if self.rng.random() < 0.8:
+                    turn -= turn % 2
+                conversation[turn]["text"] += " " + phrase
+        return {"conversation": conversation}
+
+
+def build_index(index: TranscriptIndex, count: int, seed: int) -> Dict[str, Any]:
+    generator = TranscriptGenerator(seed)
+    started = time.perf_counter()
+    batch = []
+    for i in range(count):
+        batch.append((f"BENCH{i:07d}", generator.transcript(), {"customer_id": f"CUST{i % 5000:04d}"}, None, None))
+        if len(batch) >= BUILD_BATCH:
+            index.add_many(batch)
+            batch = []
+        if (i + 1) % 100000 == 0:
+            print(f"  indexed {i + 1} transcripts ({time.perf_counter() - started:.0f}s)", file=sys.stderr)
+    if batch:
+        index.add_many(batch)
+    build_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    index.optimize()
+    return {
+        "transcripts": count,
+        "build_seconds": round(build_seconds, 1),
+        "transcripts_per_sec": round(count / build_seconds, 1),
+        "optimize_seconds": round(time.perf_counter() - started, 1),
+    }
+
+
+def time_queries(index: TranscriptIndex, runs: int, limit: int) -> Dict[str, Any]:
+    results = {}
+    for name, query, speaker, match in QUERIES:
+        latencies = []
+        response = None
+        for _ in range(runs):
+            started = time.perf_counter()
+            response = index.search(query, speaker, match=match, limit=limit)
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        results[name] = {
+            "query": query,
+            "speaker": speaker,
+            "match": match,
+            "matching_transcripts": response["total_count"],
+            "p50_ms": round(statistics.median(latencies), 2),
+            "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+            "max_ms": round(latencies[-1], 2),
+        }
+        print(f"  {name:<26} matches={response['total_count']:>8} p50={results[name]['p50_ms']:>9.2f}ms "
+              f"p95={results[name]['p95_ms']:>9.2f}ms", file=sys.stderr)
+    return results
+
+
+def time_grep(count: int, seed: int, directory: Path) -> Dict[str, Any]:
+    """Baseline: scan transcript JSON files for a phrase, as before the index."""
+    generator = TranscriptGenerator(seed)
+    directory.mkdir(parents=True)
+    for i in range(count):
+        (directory / f"BENCH{i:07d}.json").write_text(json.dumps(generator.transcript(), indent=2))
+    started = time.perf_counter()
+    hits = 0
+    for path in directory.glob("*.json"):
+        transcript = json.loads(path.read_text())
+        hits += any("talk to a lawyer" in text.lower() for _, text in extract_turns(transcript))
+    seconds = time.perf_counter() - started
+    return {"files": count, "matches": hits, "seconds": round(seconds, 3), "ms_per_1000_files": round(seconds / count * 1e6, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transcript full-text search")
+    parser.add_argument("--transcripts", type=int, default=1_000_000, help="Synthetic transcripts to index")
+    parser.add_argument("--runs", type=int, default=20, help="Runs per query")
+    parser.add_argument("--limit", type=int, default=20, help="Results per query")
+    parser.add_argument("--grep-files", type=int, default=10000, help="Files in the grep baseline (0 to skip)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", default=None, help="Keep the index at this path (reused if it exists)")
+    parser.add_argument("--output", default=None, help="Write results JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="rrva-search-") as workdir:
+        path = Path(args.keep) if args.keep else Path(workdir) / "transcript_index.db"
+        index = TranscriptIndex(path)
+        build: Optional[Dict[str, Any]] = None
+        if index.count() == 0:
+            print(f"Building index of {args.transcripts} transcripts", file=sys.stderr)
+            build = build_index(index, args.transcripts, args.seed)
+        indexed = index.count()
+        print(f"Querying {indexed} transcripts", file=sys.stderr)
+        results = {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "transcripts": indexed,
+            "index_bytes": path.stat().st_size,
+            "build": build,
+            "queries": time_queries(index, args.runs, args.limit),
+        }
+        if args.grep_files:
+            results["grep_baseline"] = time_grep(args.grep_files, args.seed, Path(workdir) / "files")
+            estimate = results["grep_baseline"]["ms_per_1000_files"] * indexed / 1000
+            print(f"  grep baseline: {results['grep_baseline']['ms_per_1000_files']}ms per 1000 files "
+                  f"(~{estimate / 1000:.0f}s for {indexed} files)", file=sys.stderr)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+End-to-End Load Generator
+Replays per-session tool-call sequences rebuilt from storage/decision_logs
+against a running mcp_server_http.py, and reports latency histograms per
+tool and per step.
+
+Recorded sessions used the old verification flow (verify_customer_identity
+with email only). Those steps are replayed through the current OTP flow:
+send_otp -> verify_customer_identity with the code returned by the server's
+fake email sender. Start the server with OTP_EMAIL_SENDER=fake so no real
+emails are sent:
+
+    OTP_EMAIL_SENDER=fake python mcp_server_http.py
+    python -m benchmarks.loadgen --url http://localhost:8000 --rate 20 --concurrency 50 --duration 60
+
+Each session ends with end_call carrying the matching stored transcript,
+so audit writes are part of the load.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from pathlib import Path
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import sys
+import time
+
+import httpx
+
+from tools.compression import read_json
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_LOG_DIR = REPO_ROOT / "storage" / "decision_logs"
+DEFAULT_TRANSCRIPT_DIR = REPO_ROOT / "storage" / "transcripts"
+
+# Prefix added to tool names by the voice platform
+TOOL_PREFIX = "RRVA_"
+# Placeholder replaced with the OTP returned by the preceding send_otp step
+OTP_PLACEHOLDER = "{otp}"
+
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram (ms) with percentile estimates."""
+
+    # Bucket upper bounds: 0.25ms doubling up to ~65s
+    BOUNDS = [0.25 * 2 ** i for i in range(19)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.samples: List[float] = []
+        self.errors = 0
+
+    def record(self, ms: float, error: bool = False) -> None:
+        for i, bound in enumerate(self.BOUNDS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.samples.append(ms)
+        if error:
+            self.errors += 1
+
+    def percentile(self, pct: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": len(self.samples),
+            "errors": self.errors,
+            "p50_ms": round(self.percentile(50), 3),
+            "p90_ms": round(self.percentile(90), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "max_ms": round(max(self.samples), 3) if self.samples else 0.0,
+            "buckets": {
+                (f"<={bound:g}ms" if i < len(self.BOUNDS) else f">{self.BOUNDS[-1]:g}ms"): count
+                for i, (bound, count) in enumerate(zip(self.BOUNDS + [math.inf], self.counts))
+                if count
+            }
+        }
+
+    def render(self, width: int = 40) -> str:
+        peak = max(self.counts) or 1
+        lines = []
+        for i, count in enumerate(self.counts):
+            if not count:
+                continue
+            label = f"<={self.BOUNDS[i]:g}ms" if i < len(self.BOUNDS) else f">{self.BOUNDS[-1]:g}ms"
+            lines.append(f"    {label:>12} {'#' * max(1, int(width * count / peak)):<{width}} {count}")
+        return "\n".join(lines)
+
+
+def _find_transcript(transcript_dir: Path, log: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """Find the transcript stored alongside a decision log (same session and second)."""
+    stamp = log.get("log_id", "")[-14:]
+    if len(stamp) != 14 or not stamp.isdigit():
+        return None
+    # Plain or compressed (.json.zst / .json.zz), see tools/compression.py
+    for path in transcript_dir.glob(f"{log['session_id']}_{stamp[:8]}_{stamp[8:]}.json*"):
+        return read_json(path).get("conversation")
+    return None
+
+
+def build_session(log: Dict[str, Any], transcript: Optional[List[Dict[str, Any]]]) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Rebuild the tool-call sequence of one recorded session.
+
+    Returns:
+        List of (tool_name, arguments) steps
+    """
+    calls = log.get("tool_calls") or []
+    # Customer ID for steps recorded without one (old verification flow)
+    customer_id = next(
+        (c.get("parameters", {}).get("customer_id") for c in calls if c.get("parameters", {}).get("customer_id")),
+        log.get("customer_id")
+    )
+
+    steps: List[Tuple[str, Dict[str, Any]]] = []
+    for call in calls:
+        tool = call.get("tool_name", "")
+        if tool.startswith(TOOL_PREFIX):
+            tool = tool[len(TOOL_PREFIX):]
+        params = dict(call.get("parameters") or {})
+
+        if tool == "verify_customer_identity" and not params.get("otp_code"):
+            steps.append(("send_otp", {"customer_id": customer_id, "method": "email"}))
+            steps.append(("verify_customer_identity", {
+                "order_id": params.get("order_id"),
+                "customer_id": customer_id,
+                "otp_code": OTP_PLACEHOLDER
+            }))
+        else:
+            steps.append((tool, params))
+
+    steps.append(("end_call", {
+        "customer_id": log.get("customer_id"),
+        "decision_type": "no_action",
+        "transcript": transcript or [],
+        "inputs": log.get("inputs", {}),
+        "policy_checks": log.get("policy_checks", []),
+        "outcome": log.get("outcome", {}),
+        "tool_calls": calls,
+        "metadata": {"source": "loadgen"}
+    }))
+    return steps
+
+
+def load_sessions(log_dir: Path, transcript_dir: Path) -> List[List[Tuple[str, Dict[str, Any]]]]:
+    """Build replayable sessions from every decision log that recorded tool calls."""
+    sessions = []
+    for path in sorted(log_dir.glob("*.json*")):
+        log = read_json(path)
+        if log.get("tool_calls"):
+            sessions.append(build_session(log, _find_transcript(transcript_dir, log)))
+    return sessions
+
+
+class LoadGenerator:
+    """Drives sessions against the HTTP server at a target arrival rate."""
+
+    def __init__(self, url: str, sessions, concurrency: int, rate: float, timeout: float = 30.0):
+        self.url = url.rstrip("/") + "/mcp"
+        self.sessions = sessions
+        self.concurrency = asyncio.Semaphore(concurrency)
+        self.rate = rate
+        self.timeout = timeout
+        self.by_tool: Dict[str, LatencyHistogram] = {}
+        self.by_step: Dict[str, LatencyHistogram] = {}
+        self.session_latency = LatencyHistogram()
+        self._ids = itertools.count(1)
+        self.completed = 0
+        self.failed = 0
+
+    async def _call(self, client: httpx.AsyncClient, tool: str, arguments: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """Call one tool via JSON-RPC; returns (parsed result, error flag)."""
+        response = await client.post(self.url, json={
+            "jsonrpc": "2.0",
+            "id": next(self._ids),
+            "method": "tools/call",
+            "params": {"name": tool, "arguments": arguments}
+        })
+        if response.status_code != 200:
+            return {}, True
+        body = response.json()
+        if "error" in body:
+            return {}, True
+        result = json.loads(body["result"]["content"][0]["text"])
+        return result, ("error" in result and "tool" in result)
+
+    async def run_session(self, client: httpx.AsyncClient, index: int, slot_held: bool = False) -> None:
+        """Replay one session; slot_held means the caller already acquired a concurrency slot."""
+        steps = self.sessions[index % len(self.sessions)]
+        session_id = f"LOAD{index:08d}"
+        otp_code = None
+        started = time.perf_counter()
+        failed = False
+        if not slot_held:
+            await self.concurrency.acquire()
+        try:
+            for step, (tool, arguments) in enumerate(steps, start=1):
+                arguments = dict(arguments)
+                if tool == "end_call":
+                    arguments["session_id"] = session_id
+                if arguments.get("otp_code") == OTP_PLACEHOLDER:
+                    arguments["otp_code"] = otp_code or ""
+
+                call_started = time.perf_counter()
+                try:
+                    result, error = await self._call(client, tool, arguments)
+                except httpx.HTTPError:
+                    result, error = {}, True
+                elapsed_ms = (time.perf_counter() - call_started) * 1000
+
+                self.by_tool.setdefault(tool, LatencyHistogram()).record(elapsed_ms, error)
+                self.by_step.setdefault(f"{step:02d} {tool}", LatencyHistogram()).record(elapsed_ms, error)
+                failed = failed or error
+                if tool == "send_otp":
+                    otp_code = result.get("_debug_otp")
+        finally:
+            self.concurrency.release()
+
+        self.session_latency.record((time.perf_counter() - started) * 1000, failed)
+        self.completed += 1
+        self.failed += int(failed)
+
+    async def run(self, duration: float, max_sessions: Optional[int] = None) -> Dict[str, Any]:
+        """Start sessions with Poisson arrivals (or back-to-back if rate is 0)."""
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits) as client:
+            tasks = []
+            started = time.perf_counter()
+            for index in itertools.count():
+                if time.perf_counter() - started >= duration:
+                    break
+                if max_sessions is not None and index >= max_sessions:
+                    break
+                if self.rate > 0:
+                    await asyncio.sleep(random.expovariate(self.rate))
+                    slot_held = False
+                else:
+                    # Closed loop: only start a session when a slot is free (the session releases it)
+                    await self.concurrency.acquire()
+                    slot_held = True
+                tasks.append(asyncio.create_task(self.run_session(client, index, slot_held)))
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - started
+
+        return {
+            "sessions": self.completed,
+            "failed_sessions": self.failed,
+            "elapsed_seconds": round(elapsed, 3),
+            "sessions_per_second": round(self.completed / elapsed, 2) if elapsed else 0.0,
+            "session_latency": self.session_latency.summary(),
+            "by_tool": {tool: h.summary() for tool, h in sorted(self.by_tool.items())},
+            "by_step": {step: h.summary() for step, h in sorted(self.by_step.items())}
+        }
+
+    def render(self) -> str:
+        lines = []
+        for title, histograms in (("Per tool", self.by_tool), ("Per step", self.by_step)):
+            lines.append(f"== {title} ==")
+            for name, histogram in sorted(histograms.items()):
+                s = histogram.summary()
+                lines.append(
+                    f"  {name}: n={s['count']} err={s['errors']} "
+                    f"p50={s['p50_ms']}ms p90={s['p90_ms']}ms p99={s['p99_ms']}ms max={s['max_ms']}ms"
+                )
+                lines.append(histogram.render())
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded sessions against the HTTP MCP server")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--rate", type=float, default=10.0, help="Session arrivals per second (0 = closed loop)")
+    parser.add_argument("--concurrency", type=int, default=20, help="Maximum concurrent sessions")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to keep starting sessions")
+    parser.add_argument("--sessions", type=int, default=None, help="Stop after this many sessions")
+    parser.add_argument("--log-dir", default=str(DEFAULT_LOG_DIR))
+    parser.add_argument("--transcript-dir", default=str(DEFAULT_TRANSCRIPT_DIR))
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    sessions = load_sessions(Path(args.log_dir), Path(args.transcript_dir))
+    if not sessions:
+        sys.exit(f"No decision logs with tool_calls found in {args.log_dir}")
+    print(f"Replaying {len(sessions)} recorded session shapes against {args.url}", file=sys.stderr)
+
+    generator = LoadGenerator(args.url, sessions, args.concurrency, args.rate)
+    report = asyncio.run(generator.run(args.duration, args.sessions))
+    print(generator.render())
+    print(json.dumps({k: v for k, v in report.items() if k not in ("by_tool", "by_step")}, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -34,19 +34,30 @@ from mcp.types import (
 )
 import mcp.server.stdio
 
-# Import our tool implementations
-from tools.identity import IdentityVerifier
-from tools.orders import OrderHistoryService
-from tools.policy import RefundPolicyEngine
-from tools.refunds import RefundExecutor
-from tools.audit import AuditLogger
+# Tool implementations are imported on first use (see tools/lazy.py)
+from tools.lazy import LazyService
+from tools.tracing import span, tracer
+from tools.admission import Overloaded
+from tools.lifecycle import Lifecycle
+from tools.state import flush as flush_state
 
-# Initialize services
-identity_verifier = IdentityVerifier()
-order_service = OrderHistoryService()
-policy_engine = RefundPolicyEngine()
-refund_executor = RefundExecutor()
-audit_logger = AuditLogger()
+# Initialize services (constructed by the first tool call that uses them)
+identity_verifier = LazyService("tools.identity", "IdentityVerifier")
+order_service = LazyService("tools.orders", "OrderHistoryService")
+policy_engine = LazyService("tools.policy", "RefundPolicyEngine")
+refund_executor = LazyService("tools.refunds", "RefundExecutor")
+audit_logger = LazyService("tools.audit", "AuditLogger")
+
+# Optionally load a generated dataset on top of the sample data (see tools/synthetic.py)
+if os.getenv("RRVA_DATASET_DIR"):
+    from tools.synthetic import load_dataset
+    load_dataset(os.getenv("RRVA_DATASET_DIR"))
+
+# Draining and flushing at shutdown (see tools/lifecycle.py)
+lifecycle = Lifecycle.from_env()
+lifecycle.add_flush_hook("audit", lambda: audit_logger.flush() if audit_logger.loaded else None)
+lifecycle.add_flush_hook("state", flush_state)
+lifecycle.add_flush_hook("traces", lambda: {"unsent": tracer.flush()})
 
 # Create MCP server instance
 app = Server("rrva-mcp-server")
@@ -161,7 +172,22 @@ async def list_tools() -> List[Tool]:
                     },
                     "limit": {
                         "type": "integer",
-                        "description": "Maximum number of orders to return (default: 10)"
+                        "minimum": 1,
+                        "description": "Maximum number of orders to return (default: 10, at least 1)"
+                    },
+                    "cursor": {
+                        "type": "string",
+                        "description": "next_cursor from a previous response to fetch the following page (optional)"
+                    },
+                    "view": {
+                        "type": "string",
+                        "enum": ["summary", "full", "custom"],
+                        "description": "summary returns only order_id, order_date, status and total (recommended for reading orders aloud); full returns complete orders (default)"
+                    },
+                    "fields": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Custom list of order fields to return (optional, implies view=custom)"
                     }
                 },
                 "required": ["customer_id"]
@@ -169,20 +195,32 @@ async def list_tools() -> List[Tool]:
         ),
         Tool(
             name="get_transaction_history",
-            description="Retrieve transaction/payment history for a specific order.",
+            description="Retrieve transaction/payment history for a specific order, or for all of a customer's orders within an optional date range.",
             inputSchema={
                 "type": "object",
                 "properties": {
                     "order_id": {
                         "type": "string",
-                        "description": "Order ID"
+                        "description": "Order ID (optional, returns all of the customer's transactions if not provided)"
                     },
                     "customer_id": {
                         "type": "string",
                         "description": "Verified customer ID"
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "description": "Inclusive start date or ISO timestamp (optional)"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "Inclusive end date or ISO timestamp (optional)"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of transactions for customer-wide queries (default: 100)"
                     }
                 },
-                "required": ["order_id", "customer_id"]
+                "required": ["customer_id"]
             }
         ),
         Tool(
@@ -289,6 +327,53 @@ async def list_tools() -> List[Tool]:
                 "required": ["session_id", "customer_id", "decision_type", "outcome"]
             }
         ),
+        Tool(
+            name="query_decisions",
+            description="Query a verified customer's logged decisions by session, decision type, date range and outcome amount. Answered from the audit index, newest first.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "session_id": {
+                        "type": "string",
+                        "description": "Session/Interaction ID"
+                    },
+                    "customer_id": {
+                        "type": "string",
+                        "description": "Verified customer ID (only this customer's decisions are returned)"
+                    },
+                    "decision_type": {
+                        "type": "string",
+                        "enum": ["refund_approved", "refund_denied", "partial_refund", "escalated"],
+                        "description": "Type of decision made"
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "description": "Inclusive start date (YYYY-MM-DD) or ISO timestamp"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "Inclusive end date (YYYY-MM-DD) or ISO timestamp"
+                    },
+                    "min_amount": {
+                        "type": "number",
+                        "description": "Minimum outcome amount"
+                    },
+                    "max_amount": {
+                        "type": "number",
+                        "description": "Maximum outcome amount"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum decisions to return (default: 50, max: 1000)"
+                    },
+                    "cursor": {
+                        "type": "string",
+                        "description": "next_cursor from a previous response"
+                    }
+                },
+                "required": ["customer_id"]
+            }
+        ),
         Tool(
             name="store_artifact",
             description="Store audit artifacts (audio, transcript, decision log, receipt) to persistent storage.",
@@ -308,6 +393,10 @@ async def list_tools() -> List[Tool]:
                         "type": "string",
                         "description": "Artifact content (base64 for audio, JSON/text for others)"
                     },
+                    "customer_id": {
+                        "type": "string",
+                        "description": "Customer ID (kept in the metadata, so transcripts can be searched by customer)"
+                    },
                     "metadata": {
                         "type": "object",
                         "description": "Additional metadata (timestamps, customer_id, etc.)"
@@ -396,7 +485,16 @@ async def list_tools() -> List[Tool]:
 
 @app.call_tool()
 async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
-    """Handle tool calls from the voice agent."""
+    """Handle tool calls from the voice agent inside a trace span (refused while shutting down)."""
+    try:
+        with lifecycle.track(name), span(f"tool.{name}", tool=name):
+            return await _dispatch_tool(name, arguments)
+    except Overloaded as e:
+        return [TextContent(type="text", text=json.dumps(e.to_dict(), indent=2))]
+
+
+async def _dispatch_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
+    """Dispatch a tool call to its handler."""
     try:
         if name == "verify_by_order_and_name":
             result = await identity_verifier.verify_by_order_and_name(
@@ -434,14 +532,20 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
             result = await order_service.get_order_history(
                 customer_id=arguments["customer_id"],
                 order_id=arguments.get("order_id"),
-                limit=arguments.get("limit", 10)
+                limit=arguments.get("limit", 10),
+                cursor=arguments.get("cursor"),
+                view=arguments.get("view"),
+                fields=arguments.get("fields")
             )
             return [TextContent(type="text", text=json.dumps(result, indent=2))]
         
         elif name == "get_transaction_history":
             result = await order_service.get_transaction_history(
-                order_id=arguments["order_id"],
-                customer_id=arguments["customer_id"]
+                order_id=arguments.get("order_id"),
+                customer_id=arguments["customer_id"],
+                start_date=arguments.get("start_date"),
+                end_date=arguments.get("end_date"),
+                limit=arguments.get("limit", 100)
             )
             return [TextContent(type="text", text=json.dumps(result, indent=2))]
         
@@ -477,12 +581,32 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
             )
             return [TextContent(type="text", text=json.dumps(result, indent=2))]
         
+        elif name == "query_decisions":
+            # Agents only see the verified customer's decisions (back-office queries use /audit/decisions)
+            if not arguments.get("customer_id"):
+                return [TextContent(type="text", text=json.dumps({"error": "customer_id is required"}, indent=2))]
+            result = await audit_logger.query_decisions(
+                session_id=arguments.get("session_id"),
+                customer_id=arguments["customer_id"],
+                decision_type=arguments.get("decision_type"),
+                start_date=arguments.get("start_date"),
+                end_date=arguments.get("end_date"),
+                min_amount=arguments.get("min_amount"),
+                max_amount=arguments.get("max_amount"),
+                limit=arguments.get("limit", 50),
+                cursor=arguments.get("cursor")
+            )
+            return [TextContent(type="text", text=json.dumps(result, indent=2))]
+        
         elif name == "store_artifact":
+            metadata = {**arguments.get("metadata", {})}
+            if arguments.get("customer_id"):
+                metadata["customer_id"] = arguments["customer_id"]
             result = await audit_logger.store_artifact(
                 session_id=arguments["session_id"],
                 artifact_type=arguments["artifact_type"],
                 content=arguments["content"],
-                metadata=arguments.get("metadata", {})
+                metadata=metadata
             )
             return [TextContent(type="text", text=json.dumps(result, indent=2))]
         
@@ -499,6 +623,10 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
             customer_id = arguments.get("customer_id", "unknown")
             decision_type = arguments["decision_type"]
             transcript = arguments["transcript"]
+            # Artifacts carry the customer, so transcript search can filter by it
+            metadata = {**arguments.get("metadata", {})}
+            if arguments.get("customer_id"):
+                metadata["customer_id"] = arguments["customer_id"]
             
             results = {
                 "session_id": session_id,
@@ -514,7 +642,7 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
                     session_id=session_id,
                     artifact_type="transcript",
                     content=transcript_content,
-                    metadata=arguments.get("metadata", {})
+                    metadata=metadata
                 )
                 results["actions_taken"].append("transcript_stored")
                 results["transcript_path"] = transcript_result.get("file_path")
@@ -530,7 +658,8 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
                     inputs=arguments.get("inputs", {}),
                     policy_checks=arguments.get("policy_checks", []),
                     outcome=arguments.get("outcome", {}),
-                    tool_calls=arguments.get("tool_calls", [])
+                    tool_calls=arguments.get("tool_calls", []),
+                    deduplicate=True
                 )
                 results["actions_taken"].append("decision_logged")
                 results["log_id"] = decision_result.get("log_id")
@@ -541,15 +670,17 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
             # 3. Store receipt if refund was processed
             if decision_type == "refund_approved" and arguments.get("outcome", {}).get("refund_id"):
                 try:
+                    # Unstamped, so a retried end_call stores the same receipt blob
                     receipt = await refund_executor.get_receipt(
-                        refund_id=arguments["outcome"]["refund_id"]
+                        refund_id=arguments["outcome"]["refund_id"],
+                        stamp=False
                     )
                     receipt_content = json.dumps(receipt)
                     receipt_result = await audit_logger.store_artifact(
                         session_id=session_id,
                         artifact_type="receipt",
                         content=receipt_content,
-                        metadata=arguments.get("metadata", {})
+                        metadata=metadata
                     )
                     results["actions_taken"].append("receipt_stored")
                     results["receipt_path"] = receipt_result.get("file_path")
@@ -574,20 +705,27 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
 
 
 async def main():
-    """Run the MCP server using stdio transport."""
-    async with stdio_server() as (read_stream, write_stream):
-        await app.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="rrva-mcp-server",
-                server_version="1.0.0",
-                capabilities=app.get_capabilities(
-                    notification_options=NotificationOptions(),
-                    experimental_capabilities={},
+    """Run the MCP server using stdio transport (SIGTERM drains in-flight calls and flushes first)."""
+    lifecycle.install_signal_handlers(asyncio.current_task())
+    lifecycle.mark_ready()
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await app.run(
+                read_stream,
+                write_stream,
+                InitializationOptions(
+                    server_name="rrva-mcp-server",
+                    server_version="1.0.0",
+                    capabilities=app.get_capabilities(
+                        notification_options=NotificationOptions(),
+                        experimental_capabilities={},
+                    ),
                 ),
-            ),
-        )
+            )
+    except asyncio.CancelledError:
+        pass  # stopped by a signal after draining
+    finally:
+        await lifecycle.drain()
 
 
 if __name__ == "__main__":
@@ -12,11 +12,14 @@ This server provides tools for:
 
 import asyncio
 import json
+import math
 import os
+import secrets
 import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
@@ -26,39 +29,94 @@ load_dotenv()
 from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
 from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
 import time
 
-# MCP server components
-from mcp.server.models import InitializationOptions
-from mcp.server import NotificationOptions, Server
-from mcp.types import (
-    Tool,
-    TextContent,
-    ImageContent,
-    EmbeddedResource,
-    LoggingLevel,
-)
+# Tool implementations are imported on first use (see tools/lazy.py)
+from tools.lazy import LazyService
+from tools.metrics import metrics
+from tools.tracing import TracingMiddleware, span, tracer
+from tools.profiler import profile_event_loop, profile_in_progress, DEFAULT_INTERVAL
+from tools.watchdog import LoopWatchdog
+from tools.admission import AdmissionController, Overloaded, CLASS_LIMITS
+from tools.lifecycle import Lifecycle
+from tools.state import flush as flush_state
+from tools.paths import load_config_section
+
+# Initialize services (constructed by the first tool call that uses them)
+identity_verifier = LazyService("tools.identity", "IdentityVerifier")
+order_service = LazyService("tools.orders", "OrderHistoryService")
+policy_engine = LazyService("tools.policy", "RefundPolicyEngine")
+refund_executor = LazyService("tools.refunds", "RefundExecutor")
+audit_logger = LazyService("tools.audit", "AuditLogger")
+
+# Optionally load a generated dataset on top of the sample data (see tools/synthetic.py)
+if os.getenv("RRVA_DATASET_DIR"):
+    from tools.synthetic import load_dataset
+    load_dataset(os.getenv("RRVA_DATASET_DIR"))
+
+# Per-tool concurrency limits and load shedding (registry in tools/admission.py)
+admission = AdmissionController.from_config()
+
+def _otp_store_size() -> int:
+    if not identity_verifier.loaded:
+        return 0
+    from tools.identity import _otp_storage
+    return len(_otp_storage)
+
+
+# Gauges read at scrape time (they report zero until the service is first used)
+metrics.register_gauge("otp_store_size", "OTPs currently stored.", _otp_store_size)
+for priority_class in CLASS_LIMITS:
+    metrics.register_gauge(
+        f"admission_{priority_class}_queued",
+        f"{priority_class.capitalize()} tool calls waiting for a slot.",
+        lambda priority_class=priority_class: admission.queue_depth(priority_class)
+    )
+
+# Event loop blocking detector (RRVA_WATCHDOG_THRESHOLD_MS=0 disables it)
+watchdog_threshold_ms = float(os.getenv("RRVA_WATCHDOG_THRESHOLD_MS", "100"))
+watchdog = LoopWatchdog(threshold=watchdog_threshold_ms / 1000) if watchdog_threshold_ms > 0 else None
+if watchdog is not None:
+    metrics.register_gauge("event_loop_lag_seconds", "Event loop lag at the last heartbeat.", lambda: watchdog.last_lag)
+
+# Readiness, draining and flushing at shutdown (see tools/lifecycle.py)
+lifecycle = Lifecycle.from_env()
+lifecycle.add_flush_hook("audit", lambda: audit_logger.flush() if audit_logger.loaded else None)
+lifecycle.add_flush_hook("state", flush_state)
+lifecycle.add_flush_hook("traces", lambda: {"unsent": tracer.flush()})
+metrics.register_gauge("ready", "1 while the worker accepts tool calls.", lambda: int(lifecycle.ready))
+
+# Rotation, archival and expiry of storage/ ("retention" in mcp_config.json, see tools/retention.py)
+retention = LazyService("tools.retention", "RetentionManager")
+
 
-# Import our tool implementations
-from tools.identity import IdentityVerifier
-from tools.orders import OrderHistoryService
-from tools.policy import RefundPolicyEngine
-from tools.refunds import RefundExecutor
-from tools.audit import AuditLogger
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background monitors and storage retention; drain and flush at shutdown."""
+    if watchdog is not None:
+        watchdog.start()
+    # Read from the config, so tools.retention is only imported when it runs
+    retention_enabled = bool(load_config_section("retention").get("enabled"))
+    if retention_enabled:
+        retention.start()
+    # uvicorn's signal handlers are installed by now: drain before they stop the server
+    lifecycle.drain_on_signals()
+    lifecycle.mark_ready()
+    yield
+    lifecycle.restore_signal_handlers()
+    await lifecycle.drain()
+    if retention_enabled:
+        await asyncio.to_thread(retention.stop)
+    if watchdog is not None:
+        await watchdog.stop()
 
-# Initialize services
-identity_verifier = IdentityVerifier()
-order_service = OrderHistoryService()
-policy_engine = RefundPolicyEngine()
-refund_executor = RefundExecutor()
-audit_logger = AuditLogger()
 
 # Create FastAPI app
 app = FastAPI(
     title="RRVA MCP Server",
     description="MCP Server for Request Resolution Voice Agent",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware for ElevenLabs
@@ -70,8 +128,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create MCP server instance
-mcp_server = Server("rrva-mcp-server")
+# Root span per request (sampled via RRVA_TRACE_SAMPLE_RATE)
+app.add_middleware(TracingMiddleware)
+
+
+class Tool(NamedTuple):
+    """Tool definition as listed to MCP clients (same fields as mcp.types.Tool)."""
+    name: str
+    description: str
+    inputSchema: Dict[str, Any]
 
 # Store available tools
 AVAILABLE_TOOLS = []
@@ -185,7 +250,22 @@ def get_tools() -> List[Tool]:
                     },
                     "limit": {
                         "type": "integer",
-                        "description": "Maximum number of orders to return (default: 10)"
+                        "minimum": 1,
+                        "description": "Maximum number of orders to return (default: 10, at least 1)"
+                    },
+                    "cursor": {
+                        "type": "string",
+                        "description": "next_cursor from a previous response to fetch the following page (optional)"
+                    },
+                    "view": {
+                        "type": "string",
+                        "enum": ["summary", "full", "custom"],
+                        "description": "summary returns only order_id, order_date, status and total (recommended for reading orders aloud); full returns complete orders (default)"
+                    },
+                    "fields": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Custom list of order fields to return (optional, implies view=custom)"
                     }
                 },
                 "required": ["customer_id"]
@@ -193,20 +273,32 @@ def get_tools() -> List[Tool]:
         ),
         Tool(
             name="get_transaction_history",
-            description="Retrieve transaction/payment history for a specific order.",
+            description="Retrieve transaction/payment history for a specific order, or for all of a customer's orders within an optional date range.",
             inputSchema={
                 "type": "object",
                 "properties": {
                     "order_id": {
                         "type": "string",
-                        "description": "Order ID"
+                        "description": "Order ID (optional, returns all of the customer's transactions if not provided)"
                     },
                     "customer_id": {
                         "type": "string",
                         "description": "Verified customer ID"
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "description": "Inclusive start date or ISO timestamp (optional)"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "Inclusive end date or ISO timestamp (optional)"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of transactions for customer-wide queries (default: 100)"
                     }
                 },
-                "required": ["order_id", "customer_id"]
+                "required": ["customer_id"]
             }
         ),
         Tool(
@@ -313,6 +405,53 @@ def get_tools() -> List[Tool]:
                 "required": ["session_id", "customer_id", "decision_type", "outcome"]
             }
         ),
+        Tool(
+            name="query_decisions",
+            description="Query a verified customer's logged decisions by session, decision type, date range and outcome amount. Answered from the audit index, newest first.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "session_id": {
+                        "type": "string",
+                        "description": "Session/Interaction ID"
+                    },
+                    "customer_id": {
+                        "type": "string",
+                        "description": "Verified customer ID (only this customer's decisions are returned)"
+                    },
+                    "decision_type": {
+                        "type": "string",
+                        "enum": ["refund_approved", "refund_denied", "partial_refund", "escalated"],
+                        "description": "Type of decision made"
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "description": "Inclusive start date (YYYY-MM-DD) or ISO timestamp"
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "Inclusive end date (YYYY-MM-DD) or ISO timestamp"
+                    },
+                    "min_amount": {
+                        "type": "number",
+                        "description": "Minimum outcome amount"
+                    },
+                    "max_amount": {
+                        "type": "number",
+                        "description": "Maximum outcome amount"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum decisions to return (default: 50, max: 1000)"
+                    },
+                    "cursor": {
+                        "type": "string",
+                        "description": "next_cursor from a previous response"
+                    }
+                },
+                "required": ["customer_id"]
+            }
+        ),
         Tool(
             name="store_artifact",
             description="Store audit artifacts (audio, transcript, decision log, receipt) to persistent storage.",
@@ -332,6 +471,10 @@ def get_tools() -> List[Tool]:
                         "type": "string",
                         "description": "Artifact content (base64 for audio, JSON/text for others)"
                     },
+                    "customer_id": {
+                        "type": "string",
+                        "description": "Customer ID (kept in the metadata, so transcripts can be searched by customer)"
+                    },
                     "metadata": {
                         "type": "object",
                         "description": "Additional metadata (timestamps, customer_id, etc.)"
@@ -421,9 +564,76 @@ def get_tools() -> List[Tool]:
 # Initialize tools
 AVAILABLE_TOOLS = get_tools()
 
+# Record calls to any other name as tool="unknown" ("none" is the watchdog's label outside tool calls)
+metrics.known_tools = {tool.name for tool in AVAILABLE_TOOLS} | {"none"}
+
 
 async def call_tool(name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
-    """Handle tool calls from the voice agent."""
+    """
+    Handle tool calls from the voice agent, recording per-tool metrics and a trace span.
+    
+    Raises:
+        Overloaded: if admission control sheds the call or the server is draining
+    """
+    try:
+        with lifecycle.track(name):
+            return await _admitted_call(name, arguments)
+    except Overloaded as e:
+        metrics.increment("tool_calls_shed_total", "Tool calls shed by admission control.", tool=name, reason=e.reason)
+        raise
+
+
+async def _admitted_call(name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    await admission.acquire(name)
+    metrics.in_flight += 1
+    started = time.perf_counter()
+    error = True
+    try:
+        with span(f"tool.{name}", tool=name) as tool_span:
+            result = await _dispatch_tool(name, arguments)
+            error = isinstance(result, dict) and "error" in result
+            tool_span.set_attribute("tool.error", error)
+        return result
+    finally:
+        metrics.in_flight -= 1
+        metrics.observe(name, time.perf_counter() - started, error)
+        admission.release(name)
+
+
+@asynccontextmanager
+async def _admission_slot(name: str):
+    """Hold an admission slot for an HTTP endpoint (raises Overloaded like a tool call)."""
+    await admission.acquire(name)
+    try:
+        yield
+    finally:
+        admission.release(name)
+
+
+def _overloaded_response(e: Overloaded, request_id: Any = None, jsonrpc: bool = True) -> JSONResponse:
+    """Fast 503 for a shed call (JSON-RPC error body for the MCP endpoints)."""
+    content = e.to_dict()
+    if jsonrpc:
+        content = {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "error": {
+                "code": -32000,
+                "message": "Server overloaded",
+                "data": content
+            }
+        }
+    return JSONResponse(status_code=503, content=content, headers={"Retry-After": str(math.ceil(e.retry_after))})
+
+
+def _serialize_result(result: Dict[str, Any]) -> str:
+    """Serialize a tool result for an MCP text content block."""
+    with span("serialize"):
+        return json.dumps(result, indent=2)
+
+
+async def _dispatch_tool(name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """Dispatch a tool call to its handler."""
     try:
         if name == "verify_by_order_and_name":
             result = await identity_verifier.verify_by_order_and_name(
@@ -461,14 +671,20 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
             result = await order_service.get_order_history(
                 customer_id=arguments["customer_id"],
                 order_id=arguments.get("order_id"),
-                limit=arguments.get("limit", 10)
+                limit=arguments.get("limit", 10),
+                cursor=arguments.get("cursor"),
+                view=arguments.get("view"),
+                fields=arguments.get("fields")
             )
             return result
         
         elif name == "get_transaction_history":
             result = await order_service.get_transaction_history(
-                order_id=arguments["order_id"],
-                customer_id=arguments["customer_id"]
+                order_id=arguments.get("order_id"),
+                customer_id=arguments["customer_id"],
+                start_date=arguments.get("start_date"),
+                end_date=arguments.get("end_date"),
+                limit=arguments.get("limit", 100)
             )
             return result
         
@@ -504,12 +720,32 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
             )
             return result
         
+        elif name == "query_decisions":
+            # Agents only see the verified customer's decisions (back-office queries use /audit/decisions)
+            if not arguments.get("customer_id"):
+                return {"error": "customer_id is required"}
+            result = await audit_logger.query_decisions(
+                session_id=arguments.get("session_id"),
+                customer_id=arguments["customer_id"],
+                decision_type=arguments.get("decision_type"),
+                start_date=arguments.get("start_date"),
+                end_date=arguments.get("end_date"),
+                min_amount=arguments.get("min_amount"),
+                max_amount=arguments.get("max_amount"),
+                limit=arguments.get("limit", 50),
+                cursor=arguments.get("cursor")
+            )
+            return result
+        
         elif name == "store_artifact":
+            metadata = {**arguments.get("metadata", {})}
+            if arguments.get("customer_id"):
+                metadata["customer_id"] = arguments["customer_id"]
             result = await audit_logger.store_artifact(
                 session_id=arguments["session_id"],
                 artifact_type=arguments["artifact_type"],
                 content=arguments["content"],
-                metadata=arguments.get("metadata", {})
+                metadata=metadata
             )
             return result
         
@@ -526,6 +762,10 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
             customer_id = arguments.get("customer_id", "unknown")
             decision_type = arguments["decision_type"]
             transcript = arguments["transcript"]
+            # Artifacts carry the customer, so transcript search can filter by it
+            metadata = {**arguments.get("metadata", {})}
+            if arguments.get("customer_id"):
+                metadata["customer_id"] = arguments["customer_id"]
             
             results = {
                 "session_id": session_id,
@@ -541,7 +781,7 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
                     session_id=session_id,
                     artifact_type="transcript",
                     content=transcript_content,
-                    metadata=arguments.get("metadata", {})
+                    metadata=metadata
                 )
                 results["actions_taken"].append("transcript_stored")
                 results["transcript_path"] = transcript_result.get("file_path")
@@ -557,7 +797,8 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
                     inputs=arguments.get("inputs", {}),
                     policy_checks=arguments.get("policy_checks", []),
                     outcome=arguments.get("outcome", {}),
-                    tool_calls=arguments.get("tool_calls", [])
+                    tool_calls=arguments.get("tool_calls", []),
+                    deduplicate=True
                 )
                 results["actions_taken"].append("decision_logged")
                 results["log_id"] = decision_result.get("log_id")
@@ -568,15 +809,17 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
             # 3. Store receipt if refund was processed
             if decision_type == "refund_approved" and arguments.get("outcome", {}).get("refund_id"):
                 try:
+                    # Unstamped, so a retried end_call stores the same receipt blob
                     receipt = await refund_executor.get_receipt(
-                        refund_id=arguments["outcome"]["refund_id"]
+                        refund_id=arguments["outcome"]["refund_id"],
+                        stamp=False
                     )
                     receipt_content = json.dumps(receipt)
                     receipt_result = await audit_logger.store_artifact(
                         session_id=session_id,
                         artifact_type="receipt",
                         content=receipt_content,
-                        metadata=arguments.get("metadata", {})
+                        metadata=metadata
                     )
                     results["actions_taken"].append("receipt_stored")
                     results["receipt_path"] = receipt_result.get("file_path")
@@ -613,6 +856,84 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def ready():
+    """Readiness check: 503 while starting or draining, so load balancers stop routing here first."""
+    if not lifecycle.ready:
+        return JSONResponse(status_code=503, content={"status": lifecycle.state, "in_flight": lifecycle.in_flight})
+    return {"status": lifecycle.state, "in_flight": lifecycle.in_flight}
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics for this worker."""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def _require_admin(request: Request) -> None:
+    """Reject requests without the admin token (admin endpoints are off when RRVA_ADMIN_TOKEN is unset)."""
+    admin_token = os.getenv("RRVA_ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(request.headers.get("X-Admin-Token", ""), admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@app.get("/admin/profile")
+async def profile_endpoint(
+    request: Request,
+    seconds: float = 10.0,
+    interval_ms: float = DEFAULT_INTERVAL * 1000,
+    format: str = "json"
+):
+    """
+    Sample the event loop thread for N seconds while serving traffic.
+    
+    format=collapsed returns a flamegraph.pl/speedscope-compatible file;
+    the default JSON adds top frames and event loop lag.
+    """
+    _require_admin(request)
+    if profile_in_progress():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    if format not in ("json", "collapsed"):
+        raise HTTPException(status_code=400, detail="format must be json or collapsed")
+    
+    result = await profile_event_loop(seconds, max(interval_ms, 1.0) / 1000)
+    if format == "collapsed":
+        lag = result["loop_lag"]
+        return Response(
+            content=result["collapsed"],
+            media_type="text/plain",
+            headers={
+                "Content-Disposition": f"attachment; filename=profile-{result['pid']}-{int(time.time())}.collapsed",
+                "X-Samples": str(result["samples"]),
+                "X-Loop-Lag-P99-Ms": str(lag["p99_ms"]),
+                "X-Loop-Lag-Max-Ms": str(lag["max_ms"])
+            }
+        )
+    return result
+
+
+@app.post("/admin/drain")
+async def drain_endpoint(request: Request):
+    """
+    Drain this worker before it is stopped (e.g. from a pre-stop hook).
+    
+    /ready turns 503 and new tool calls are shed. Returns once in-flight calls
+    have finished (or RRVA_DRAIN_TIMEOUT_SECONDS passed) and audit and state
+    writes are flushed, with the drain report.
+    """
+    _require_admin(request)
+    return await lifecycle.drain()
+
+
+@app.get("/admin/retention")
+async def retention_endpoint(request: Request):
+    """Stored files and archives per artifact type, retention windows and the last retention pass."""
+    _require_admin(request)
+    return await asyncio.to_thread(retention.status)
+
+
 @app.get("/tools")
 async def list_tools_endpoint():
     """List all available tools (MCP-compatible format)."""
@@ -645,13 +966,16 @@ async def call_tool_endpoint(request: Request):
             raise HTTPException(status_code=404, detail=f"Tool '{tool_name}' not found")
         
         # Call the tool
-        result = await call_tool(tool_name, arguments)
+        try:
+            result = await call_tool(tool_name, arguments)
+        except Overloaded as e:
+            return _overloaded_response(e, jsonrpc=False)
         
         return {
             "content": [
                 {
                     "type": "text",
-                    "text": json.dumps(result, indent=2)
+                    "text": _serialize_result(result)
                 }
             ]
         }
@@ -662,6 +986,301 @@ async def call_tool_endpoint(request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/refunds/bulk")
+async def bulk_refund_endpoint(
+    request: Request,
+    reason: str,
+    refund_method: str = "original_payment",
+    customer_id: Optional[str] = None,
+    chunk_size: Optional[int] = None
+):
+    """
+    Bulk refund endpoint for back-office operations (NDJSON in, NDJSON out).
+
+    The request body is newline-delimited: each line is either a bare order ID
+    or a JSON object with order_id and optional customer_id, refund_amount and
+    item_ids. Results are streamed back one JSON line per order as each chunk
+    is committed, followed by a summary line with throughput.
+
+    Requires the X-Admin-Token header. Every entry needs a customer_id (its own
+    or the customer_id parameter); orders already refunded are skipped.
+    """
+    _require_admin(request)
+
+    async def read_entries():
+        buffer = b""
+        async for data in request.stream():
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                entry = _parse_bulk_line(line)
+                if entry is not None:
+                    yield entry
+        entry = _parse_bulk_line(buffer)
+        if entry is not None:
+            yield entry
+
+    async def result_stream():
+        async for result in refund_executor.execute_bulk(
+            read_entries(),
+            reason=reason,
+            refund_method=refund_method,
+            customer_id=customer_id,
+            chunk_size=chunk_size
+        ):
+            yield json.dumps(result) + "\n"
+
+    def release():
+        admission.release("execute_bulk_refund")
+        lifecycle.end()
+
+    # Bulk-class admission limits
+    try:
+        lifecycle.begin("execute_bulk_refund")
+    except Overloaded as e:
+        return _overloaded_response(e, jsonrpc=False)
+    try:
+        await admission.acquire("execute_bulk_refund")
+    except Overloaded as e:
+        lifecycle.end()
+        return _overloaded_response(e, jsonrpc=False)
+
+    return _DuplexStreamingResponse(
+        result_stream(),
+        on_close=release,
+        media_type="application/x-ndjson"
+    )
+
+
+class _ClosingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that calls on_close once the response is over.
+
+    on_close runs however the response ends: completed, failed, or cancelled
+    by a client disconnect before the generator ever started. Endpoints use it
+    to give back admission slots (and end in-flight tracking) taken before the
+    response was returned.
+    """
+
+    def __init__(self, content, on_close: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+
+class _DuplexStreamingResponse(_ClosingStreamingResponse):
+    """
+    Streaming response whose generator is still reading the request body.
+
+    The default implementation listens for client disconnects on receive(),
+    which would compete with request.stream() for body chunks.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self.stream_response(send)
+        finally:
+            self.on_close()
+
+
+def _parse_bulk_line(line: bytes) -> Optional[Any]:
+    """Parse one NDJSON line of a bulk refund request (JSON value or bare order ID)."""
+    text = line.decode("utf-8").strip()
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+@app.post("/artifacts/audio")
+async def upload_audio_endpoint(
+    request: Request,
+    session_id: str,
+    encoding: str = "base64",
+    metadata: Optional[str] = None
+):
+    """
+    Chunked audio upload for call recordings.
+
+    The body is streamed to disk as it arrives: base64 text (the default) is
+    decoded chunk by chunk, and encoding=binary stores the bytes as sent.
+    metadata is an optional JSON object. Returns the stored file's path,
+    SHA-256, format and duration.
+
+    Requires the X-Admin-Token header. Uploads larger than
+    RRVA_MAX_AUDIO_BYTES (decoded) are cut off with 413.
+    """
+    _require_admin(request)
+    if encoding not in ("base64", "binary"):
+        raise HTTPException(status_code=400, detail="encoding must be base64 or binary")
+    try:
+        metadata_dict = json.loads(metadata) if metadata else {}
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="metadata must be a JSON object")
+
+    # Same finalize-class limits as the store_artifact tool
+    try:
+        with lifecycle.track("store_artifact"):
+            await admission.acquire("store_artifact")
+            try:
+                result = await audit_logger.store_audio_stream(
+                    session_id=session_id,
+                    chunks=request.stream(),
+                    encoding=encoding,
+                    metadata=metadata_dict
+                )
+            finally:
+                admission.release("store_artifact")
+    except Overloaded as e:
+        return _overloaded_response(e, jsonrpc=False)
+
+    if not result.get("success"):
+        return JSONResponse(status_code=413 if "max_bytes" in result else 400, content=result)
+    return result
+
+
+@app.get("/audit/decisions")
+async def audit_decisions_endpoint(
+    request: Request,
+    session_id: Optional[str] = None,
+    customer_id: Optional[str] = None,
+    decision_type: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None
+):
+    """Query logged decisions from the audit index (same filters as the query_decisions tool, admin only)."""
+    _require_admin(request)
+    try:
+        async with _admission_slot("query_decisions"):
+            result = await audit_logger.query_decisions(
+                session_id=session_id,
+                customer_id=customer_id,
+                decision_type=decision_type,
+                start_date=start,
+                end_date=end,
+                min_amount=min_amount,
+                max_amount=max_amount,
+                limit=limit,
+                cursor=cursor
+            )
+    except Overloaded as e:
+        return _overloaded_response(e, jsonrpc=False)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@app.get("/audit/decisions/{log_id}")
+async def audit_decision_endpoint(request: Request, log_id: str):
+    """Return one indexed decision by log ID (admin only)."""
+    _require_admin(request)
+    try:
+        async with _admission_slot("query_decisions"):
+            decision = audit_logger.index.get(log_id)
+    except Overloaded as e:
+        return _overloaded_response(e, jsonrpc=False)
+    if decision is None:
+        raise HTTPException(status_code=404, detail=f"Decision {log_id} not found")
+    return decision
+
+
+@app.get("/analytics/decisions")
+async def decision_analytics_endpoint(
+    request: Request,
+    granularity: str = "day",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    decision_type: Optional[str] = None
+):
+    """Hourly or daily decision rollups: approval rate, refunded dollars, failing policy checks (admin only)."""
+    _require_admin(request)
+    try:
+        async with _admission_slot("decision_analytics"):
+            result = await audit_logger.decision_analytics(granularity, start, end, decision_type)
+    except Overloaded as e:
+        return _overloaded_response(e, jsonrpc=False)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@app.get("/transcripts/search")
+async def transcript_search_endpoint(
+    request: Request,
+    q: str,
+    speaker: Optional[str] = None,
+    customer_id: Optional[str] = None,
+    match: str = "all",
+    limit: int = 20,
+    offset: int = 0
+):
+    """Full-text transcript search over every customer's calls (admin only)."""
+    _require_admin(request)
+    if match not in ("all", "any"):
+        raise HTTPException(status_code=400, detail="match must be all or any")
+    try:
+        async with _admission_slot("search_transcripts"):
+            result = await audit_logger.search_transcripts(q, speaker, customer_id, match, limit, offset)
+    except Overloaded as e:
+        return _overloaded_response(e, jsonrpc=False)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@app.get("/transactions")
+async def transactions_endpoint(
+    request: Request,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    customer_id: Optional[str] = None,
+    oldest_first: bool = False
+):
+    """
+    Stream transactions in a time range as NDJSON (reconciliation / chargebacks).
+
+    Served from the timestamp index, optionally restricted to one customer.
+    Requires the X-Admin-Token header.
+    """
+    _require_admin(request)
+    from tools.orders import _transaction_store
+
+    try:
+        total_count = _transaction_store.count(customer_id, start, end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date range")
+
+    # The slot is held until the stream is over
+    try:
+        await admission.acquire("export_transactions")
+    except Overloaded as e:
+        return _overloaded_response(e, jsonrpc=False)
+
+    def transaction_stream():
+        for transaction in _transaction_store.iter_range(
+            customer_id, start, end, newest_first=not oldest_first
+        ):
+            yield json.dumps(transaction) + "\n"
+
+    return _ClosingStreamingResponse(
+        transaction_stream(),
+        on_close=lambda: admission.release("export_transactions"),
+        media_type="application/x-ndjson",
+        headers={"X-Total-Count": str(total_count)}
+    )
+
+
 @app.post("/mcp")
 async def mcp_endpoint(request: Request):
     """MCP JSON-RPC endpoint."""
@@ -702,7 +1321,10 @@ async def mcp_endpoint(request: Request):
                     }
                 }
             
-            result = await call_tool(tool_name, arguments)
+            try:
+                result = await call_tool(tool_name, arguments)
+            except Overloaded as e:
+                return _overloaded_response(e, request_id)
             
             return {
                 "jsonrpc": "2.0",
@@ -711,7 +1333,7 @@ async def mcp_endpoint(request: Request):
                     "content": [
                         {
                             "type": "text",
-                            "text": json.dumps(result, indent=2)
+                            "text": _serialize_result(result)
                         }
                     ]
                 }
@@ -839,7 +1461,10 @@ async def sse_post_endpoint(request: Request):
                     }
                 }
             
-            result = await call_tool(tool_name, arguments)
+            try:
+                result = await call_tool(tool_name, arguments)
+            except Overloaded as e:
+                return _overloaded_response(e, request_id)
             
             return {
                 "jsonrpc": "2.0",
@@ -848,7 +1473,7 @@ async def sse_post_endpoint(request: Request):
                     "content": [
                         {
                             "type": "text",
-                            "text": json.dumps(result, indent=2)
+                            "text": _serialize_result(result)
                         }
                     ]
                 }
@@ -891,5 +1516,22 @@ if __name__ == "__main__":
     print(f"MCP endpoint: http://{host}:{port}/mcp")
     print(f"SSE endpoint: http://{host}:{port}/sse (for STREAMABLE_HTTP)")
     
-    uvicorn.run(app, host=host, port=port)
+    # WORKERS=N (or "auto" for one per core) runs N worker processes on the same port
+    workers_setting = os.getenv("WORKERS", "1")
+    workers = (os.cpu_count() or 1) if workers_setting == "auto" else int(workers_setting)
+    
+    import uvicorn
+
+    if workers > 1:
+        # OTPs and refunds must be visible to every worker (see tools/state.py)
+        if os.getenv("RRVA_STATE_BACKEND", "memory") == "memory":
+            os.environ["RRVA_STATE_BACKEND"] = "sqlite"
+        print(f"Workers: {workers} (shared state: {os.environ['RRVA_STATE_BACKEND']})")
+        sys.path.insert(0, str(Path(__file__).resolve().parent))
+        uvicorn.run(
+            "mcp_server_http:app", host=host, port=port, workers=workers,
+            timeout_graceful_shutdown=math.ceil(lifecycle.drain_timeout)
+        )
+    else:
+        uvicorn.run(app, host=host, port=port, timeout_graceful_shutdown=math.ceil(lifecycle.drain_timeout))
 
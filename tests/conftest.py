@@ -0,0 +1,52 @@
+"""Shared fixtures: put the repository root on sys.path and keep state and artifacts out of storage/."""
+
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tools.state import SQLiteBackend, StateMap  # noqa: E402
+
+
+@pytest.fixture
+def sqlite_backend(tmp_path):
+    """A SQLite state backend in a temporary file (as shared by several workers)."""
+    return SQLiteBackend(tmp_path / "state.db")
+
+
+@pytest.fixture
+def shared_state(monkeypatch, sqlite_backend):
+    """Point the OTP and refund state maps at the temporary SQLite backend."""
+    import tools.identity as identity
+
+    monkeypatch.setattr(identity, "_otp_storage", StateMap(sqlite_backend, "otp"))
+    monkeypatch.setattr(identity, "_otp_attempts", StateMap(sqlite_backend, "otp_attempts"))
+    monkeypatch.setattr("tools.refunds.state_map", lambda namespace, ttl=None: StateMap(sqlite_backend, namespace, ttl))
+    return sqlite_backend
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """Point the audit logger's storage directories at a temporary directory."""
+    import tools.audit as audit
+
+    monkeypatch.setattr(audit, "STORAGE_DIR", tmp_path)
+    for name, directory in (("AUDIO_DIR", "audio"), ("TRANSCRIPT_DIR", "transcripts"),
+                            ("LOG_DIR", "decision_logs"), ("RECEIPT_DIR", "receipts")):
+        monkeypatch.setattr(audit, name, tmp_path / directory)
+    return tmp_path
+
+
+@pytest.fixture
+def http_server(storage, shared_state, monkeypatch):
+    """The HTTP server module with a fresh audit logger and refund executor on temporary storage."""
+    import mcp_server_http
+    import tools.audit as audit
+    from tools.refunds import RefundExecutor
+
+    monkeypatch.setattr("tools.audit.state_map", lambda namespace, ttl=None: StateMap(shared_state, namespace, ttl))
+    monkeypatch.setattr(mcp_server_http, "audit_logger", audit.AuditLogger())
+    monkeypatch.setattr(mcp_server_http, "refund_executor", RefundExecutor())
+    return mcp_server_http
@@ -0,0 +1,73 @@
+"""Decision analytics rebuild: archived logs, decisions recorded during a rebuild, and the admin gate."""
+
+import json
+import zipfile
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from tools.analytics import DecisionAnalytics
+from tools.compression import Compressor, canonical_json
+
+
+def _decision(log_id, decision_type="refund_approved", age=timedelta(0)):
+    return {
+        "log_id": log_id,
+        "session_id": f"SESS-{log_id}",
+        "customer_id": "CUST001",
+        "decision_type": decision_type,
+        "timestamp": (datetime.utcnow() - age).isoformat() + "Z",
+        "outcome": {"amount": 25.0, "refund_id": f"REF-{log_id}"}
+    }
+
+
+def test_rebuild_counts_files_and_archive_members(tmp_path):
+    compressor = Compressor("none", tmp_path / "dictionaries")
+    log_dir = tmp_path / "decision_logs"
+    log_dir.mkdir()
+    (log_dir / "LOG1.json").write_bytes(canonical_json(_decision("LOG1", age=timedelta(minutes=5))))
+    archive_dir = tmp_path / "archive" / "decision_logs"
+    archive_dir.mkdir(parents=True)
+    with zipfile.ZipFile(archive_dir / "2026-01-01-0.zip", "w") as archive:
+        archive.writestr("LOG2.json", compressor.compress(canonical_json(_decision("LOG2", age=timedelta(days=400))), "decision_log"))
+
+    analytics = DecisionAnalytics(tmp_path / "analytics.db")
+    # Rollups for a decision whose log no longer exists
+    analytics.record(_decision("GONE", decision_type="refund_denied", age=timedelta(days=30)))
+
+    result = analytics.rebuild(log_dir, archive_dir=archive_dir, compressor=compressor)
+
+    totals = analytics.summary("day")["totals"]
+    assert (result["recorded"], result["skipped"]) == (2, 0)
+    assert totals["by_decision_type"] == {"refund_approved": 2}
+    assert totals["refunded_amount"] == 50.0
+
+
+def test_rebuild_keeps_decisions_recorded_meanwhile(tmp_path):
+    log_dir = tmp_path / "decision_logs"
+    log_dir.mkdir()
+    analytics = DecisionAnalytics(tmp_path / "analytics.db")
+
+    def read(path):
+        # A worker logs a decision (file first, then rollups) while the rebuild is reading files
+        if not (log_dir / "LIVE.json").exists():
+            live = _decision("LIVE")
+            (log_dir / "LIVE.json").write_bytes(canonical_json(live))
+            analytics.record(live)
+        return json.loads(path.read_bytes())
+
+    (log_dir / "LOG1.json").write_bytes(canonical_json(_decision("LOG1", age=timedelta(minutes=5))))
+    analytics.rebuild(log_dir, read=read)
+
+    assert analytics.summary("day")["totals"]["decisions"] == 2
+
+
+def test_analytics_endpoint_is_admin_only(http_server, monkeypatch):
+    client = TestClient(http_server.app)
+    assert client.get("/analytics/decisions").status_code == 404
+
+    monkeypatch.setenv("RRVA_ADMIN_TOKEN", "secret")
+    assert client.get("/analytics/decisions").status_code == 403
+    response = client.get("/analytics/decisions", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    assert "totals" in response.json()
@@ -0,0 +1,51 @@
+"""Audit logging through end_call: retries and transcript search."""
+
+import asyncio
+
+
+def _end_call(server, refund_id):
+    return asyncio.run(server.call_tool("end_call", {
+        "session_id": "SESSION1",
+        "customer_id": "CUST001",
+        "decision_type": "refund_approved",
+        "transcript": [{"speaker": "customer", "text": "I want to talk to a lawyer about ORD001"}],
+        "inputs": {"order_id": "ORD001"},
+        "outcome": {"refund_id": refund_id, "amount": 25.0}
+    }))
+
+
+def test_retried_end_call_adds_nothing(http_server, storage):
+    refund = asyncio.run(http_server.refund_executor.execute("ORD001", "CUST001", reason="test"))
+    audit_logger = http_server.audit_logger
+
+    first = _end_call(http_server, refund["refund_id"])
+    retry = _end_call(http_server, refund["refund_id"])
+
+    manifest = audit_logger.blob_store.manifest("SESSION1")["artifacts"]
+    assert [entry["type"] for entry in manifest] == ["transcript", "receipt"]
+    assert retry["log_id"] == first["log_id"]
+    assert len(list((storage / "decision_logs").iterdir())) == 1
+    assert audit_logger.index.count() == 1
+
+
+def test_end_call_transcript_is_searchable_by_customer(http_server):
+    _end_call(http_server, refund_id=None)
+
+    found = asyncio.run(http_server.audit_logger.search_transcripts("lawyer", customer_id="CUST001"))
+    other = asyncio.run(http_server.audit_logger.search_transcripts("lawyer", customer_id="CUST002"))
+
+    assert [result["session_id"] for result in found["results"]] == ["SESSION1"]
+    assert other["results"] == []
+
+
+def test_store_artifact_customer_id_is_indexed(http_server):
+    asyncio.run(http_server.call_tool("store_artifact", {
+        "session_id": "SESSION2",
+        "artifact_type": "transcript",
+        "customer_id": "CUST002",
+        "content": '{"conversation": [{"speaker": "customer", "text": "chargeback please"}]}'
+    }))
+
+    found = asyncio.run(http_server.audit_logger.search_transcripts("chargeback", customer_id="CUST002"))
+
+    assert [result["session_id"] for result in found["results"]] == ["SESSION2"]
@@ -0,0 +1,61 @@
+"""Audit index rebuild: archived logs and decisions logged during a rebuild."""
+
+import json
+import zipfile
+from datetime import datetime, timedelta
+
+from tools.audit_index import AuditIndex
+from tools.compression import Compressor, canonical_json
+
+
+def _decision(log_id, customer_id="CUST001", age=timedelta(0)):
+    return {
+        "log_id": log_id,
+        "session_id": f"SESS-{log_id}",
+        "customer_id": customer_id,
+        "decision_type": "refund_approved",
+        "timestamp": (datetime.utcnow() - age).isoformat() + "Z",
+        "outcome": {"amount": 25.0, "refund_id": f"REF-{log_id}"}
+    }
+
+
+def test_rebuild_indexes_files_and_archive_members(tmp_path):
+    compressor = Compressor("none", tmp_path / "dictionaries")
+    log_dir = tmp_path / "decision_logs"
+    log_dir.mkdir()
+    (log_dir / "LOG1.json").write_bytes(canonical_json(_decision("LOG1")))
+    archive_dir = tmp_path / "archive" / "decision_logs"
+    archive_dir.mkdir(parents=True)
+    archive_path = archive_dir / "2026-01-01-0.zip"
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.writestr("LOG2.json", compressor.compress(canonical_json(_decision("LOG2", age=timedelta(days=400))), "decision_log"))
+        archive.writestr("notes.txt", b"not json")
+
+    index = AuditIndex(tmp_path / "audit_index.db")
+    # A stale row from a file that no longer exists
+    index.add(_decision("GONE", age=timedelta(days=30)), str(log_dir / "GONE.json"))
+
+    result = index.rebuild(log_dir, archive_dir=archive_dir, compressor=compressor)
+
+    assert (result["indexed"], result["skipped"]) == (2, 1)
+    assert index.get("GONE") is None
+    assert index.get("LOG1")["path"] == str(log_dir / "LOG1.json")
+    assert index.get("LOG2")["path"] == f"{archive_path}::LOG2.json"
+    assert index.count() == 2
+
+
+def test_rebuild_keeps_decisions_logged_meanwhile(tmp_path):
+    log_dir = tmp_path / "decision_logs"
+    log_dir.mkdir()
+    index = AuditIndex(tmp_path / "audit_index.db")
+
+    def read(path):
+        # A worker logs a decision while the rebuild is reading files
+        index.add(_decision("LIVE"), str(log_dir / "LIVE.json"))
+        return json.loads(path.read_bytes())
+
+    (log_dir / "LOG1.json").write_bytes(canonical_json(_decision("LOG1")))
+    index.rebuild(log_dir, read=read)
+
+    assert index.get("LOG1") is not None
+    assert index.get("LIVE") is not None
@@ -0,0 +1,40 @@
+"""Content-addressed blob store: deduplication and concurrent manifest updates."""
+
+import multiprocessing
+
+from tools.blobstore import BlobStore
+
+
+def _store_many(blob_dir, manifest_dir, worker, count):
+    store = BlobStore(blob_dir, manifest_dir)
+    for i in range(count):
+        store.store("SESSION1", "receipt", {"worker": worker, "n": i})
+
+
+def test_retry_is_deduplicated(tmp_path):
+    store = BlobStore(tmp_path / "blobs", tmp_path / "manifests")
+
+    first = store.store("SESSION1", "transcript", {"turns": ["hi"]})
+    retry = store.store("SESSION1", "transcript", {"turns": ["hi"]})
+
+    assert first["deduplicated"] is False
+    assert retry["deduplicated"] is True
+    assert len(store.manifest("SESSION1")["artifacts"]) == 1
+    assert store.load("SESSION1")[0]["content"] == {"turns": ["hi"]}
+
+
+def test_concurrent_workers_keep_every_manifest_entry(tmp_path):
+    blob_dir, manifest_dir = tmp_path / "blobs", tmp_path / "manifests"
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=_store_many, args=(blob_dir, manifest_dir, worker, 25))
+        for worker in range(4)
+    ]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+
+    artifacts = BlobStore(blob_dir, manifest_dir).manifest("SESSION1")["artifacts"]
+    assert len(artifacts) == 100
+    assert len({entry["sha256"] for entry in artifacts}) == 100
@@ -0,0 +1,41 @@
+"""Audit compression: dictionaries trained after a reader started."""
+
+import json
+
+import pytest
+
+from tools.compression import ZSTD_AVAILABLE, Compressor, canonical_json, train_dictionaries
+
+
+def _samples():
+    return {
+        "transcript": [
+            canonical_json({"speaker": "customer", "text": f"I would like a refund for order ORD{i:03d}", "turn": i})
+            for i in range(400)
+        ]
+    }
+
+
+@pytest.mark.parametrize("codec", ["zstd", "deflate"])
+def test_reader_picks_up_dictionary_trained_later(tmp_path, codec):
+    if codec == "zstd" and not ZSTD_AVAILABLE:
+        pytest.skip("zstandard is not installed")
+    reader = Compressor(codec, tmp_path)
+    # The reader loads its (empty) dictionary set before any training
+    assert reader.dictionary_id("transcript") is None
+
+    train_dictionaries(_samples(), tmp_path, size=4096, codecs=(codec,))
+    writer = Compressor(codec, tmp_path)
+    payload = canonical_json({"speaker": "agent", "text": "Your refund for ORD123 is approved", "turn": 1})
+    data = writer.compress(payload, "transcript")
+    assert writer.dictionary_id("transcript") is not None
+
+    assert json.loads(reader.decompress(data)) == json.loads(payload)
+
+
+def test_missing_dictionary_still_raises(tmp_path):
+    train_dictionaries(_samples(), tmp_path / "trained", size=4096, codecs=("deflate",))
+    data = Compressor("deflate", tmp_path / "trained").compress(b'{"turn":1}', "transcript")
+
+    with pytest.raises(ValueError, match="Missing deflate dictionary"):
+        Compressor("deflate", tmp_path / "empty").decompress(data)
@@ -0,0 +1,77 @@
+"""Server lifecycle: draining in-flight calls, flush hooks and signal handling."""
+
+import asyncio
+import os
+import signal
+
+import pytest
+
+from tools.admission import Overloaded
+from tools.lifecycle import DRAINING, STOPPED, Lifecycle
+
+
+def test_drain_waits_for_in_flight_calls_and_sheds_new_ones():
+    lifecycle = Lifecycle(drain_timeout=5)
+    lifecycle.add_flush_hook("audit", lambda: {"synced": 2})
+    lifecycle.mark_ready()
+
+    async def scenario():
+        lifecycle.begin("execute_refund")
+        drain = asyncio.ensure_future(lifecycle.drain())
+        await asyncio.sleep(0.05)
+        assert lifecycle.state == DRAINING and not lifecycle.ready
+        with pytest.raises(Overloaded):
+            lifecycle.begin("verify_otp")
+        lifecycle.end()
+        return await drain
+
+    report = asyncio.run(scenario())
+
+    assert lifecycle.state == STOPPED
+    assert (report["in_flight_at_start"], report["drained"], report["abandoned"]) == (1, 1, 0)
+    assert report["hooks"]["audit"]["result"] == {"synced": 2}
+
+
+def test_drain_timeout_abandons_calls_and_reports_failing_hooks():
+    lifecycle = Lifecycle(drain_timeout=0.05)
+
+    def failing():
+        raise OSError("disk full")
+
+    lifecycle.add_flush_hook("state", failing)
+    lifecycle.begin("end_call")
+
+    report = asyncio.run(lifecycle.drain())
+
+    assert report["abandoned"] == 1
+    assert report["hooks"]["state"]["error"] == "disk full"
+
+
+def test_signal_drains_before_the_server_handler_runs():
+    received = []
+    original = signal.signal(signal.SIGTERM, lambda signum, frame: received.append(signum))
+    lifecycle = Lifecycle(drain_timeout=5)
+
+    async def scenario():
+        lifecycle.drain_on_signals()
+        lifecycle.begin("execute_refund")
+        os.kill(os.getpid(), signal.SIGTERM)
+        await asyncio.sleep(0.05)
+        # Draining, but the server handler has not been told to stop yet
+        assert lifecycle.state == DRAINING and received == []
+        lifecycle.end()
+        for _ in range(100):
+            if received:
+                break
+            await asyncio.sleep(0.01)
+        lifecycle.restore_signal_handlers()
+
+    try:
+        asyncio.run(scenario())
+        assert received == [signal.SIGTERM]
+        assert lifecycle.state == STOPPED
+        # restore_signal_handlers put the server handler back
+        os.kill(os.getpid(), signal.SIGTERM)
+        assert received == [signal.SIGTERM, signal.SIGTERM]
+    finally:
+        signal.signal(signal.SIGTERM, original)
@@ -0,0 +1,32 @@
+"""Order history paging and projections."""
+
+import asyncio
+
+from tools.orders import OrderHistoryService
+
+
+def _history(**kwargs):
+    return asyncio.run(OrderHistoryService().get_order_history("CUST001", **kwargs))
+
+
+def test_limit_below_one_returns_a_page_with_a_cursor():
+    for limit in (0, -5):
+        result = _history(limit=limit, view="summary")
+        assert result["returned_count"] == 1
+        assert result["has_more"] is True
+        assert result["next_cursor"] is not None
+
+    rest = _history(limit=10, view="summary", cursor=_history(limit=0)["next_cursor"])
+    assert rest["returned_count"] == 2
+    assert rest["has_more"] is False
+
+
+def test_single_field_string_is_one_field():
+    result = _history(fields="status")
+    assert result["view"] == "custom"
+    assert [set(order) for order in result["orders"]] == [{"status"}] * result["returned_count"]
+
+
+def test_custom_view_without_fields_asks_for_fields():
+    result = _history(view="custom")
+    assert "fields is required" in result["error"]
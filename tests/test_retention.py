@@ -0,0 +1,105 @@
+"""Storage retention: archival with index relocation, archived reads and window expiry."""
+
+import asyncio
+import json
+import os
+import time
+import zipfile
+
+import tools.audit as audit
+from tools.retention import DEFAULT_CONFIG, RetentionManager
+
+DAY = 86400
+
+
+def _manager(storage, **windows_days):
+    config = {
+        **DEFAULT_CONFIG,
+        "max_io_mb_per_sec": 0,
+        "windows_days": {**DEFAULT_CONFIG["windows_days"], **windows_days}
+    }
+    return RetentionManager(storage, config)
+
+
+def _age(path, days):
+    timestamp = time.time() - days * DAY
+    os.utime(path, (timestamp, timestamp))
+
+
+def _log_decision(logger):
+    return asyncio.run(logger.log_decision("SESSION1", "CUST001", "refund_approved", {"amount": 25.0}))
+
+
+def test_archived_decision_log_is_relocated_and_readable(storage, monkeypatch):
+    monkeypatch.setenv("RRVA_ARTIFACT_STORE", "files")
+    logger = audit.AuditLogger()
+    logged = _log_decision(logger)
+    _age(logged["log_path"], 10)
+
+    report = _manager(storage).run_once()
+
+    assert report["archived_files"] == {"decision_log": 1}
+    assert report["relocated_index_rows"] == {"decisions": 1}
+    assert not os.path.exists(logged["log_path"])
+    path = logger.index.get(logged["log_id"])["path"]
+    assert "::" in path
+    assert logger.read_artifact(path)["log_id"] == logged["log_id"]
+
+
+def test_archived_session_artifacts_still_load(storage, monkeypatch):
+    monkeypatch.setenv("RRVA_ARTIFACT_STORE", "blobs")
+    logger = audit.AuditLogger()
+    stored = asyncio.run(logger.store_artifact("SESSION1", "transcript", json.dumps({"turns": ["hi"]})))
+    _age(stored["file_path"], 10)
+    _age(logger.blob_store.manifest_path("SESSION1"), 10)
+
+    report = _manager(storage).run_once()
+
+    assert report["removed_blobs"] == 1
+    assert not logger.blob_store.manifest_path("SESSION1").exists()
+    [artifact] = logger.load_artifacts("SESSION1")
+    assert artifact["content"] == {"turns": ["hi"]}
+
+
+def test_files_and_archives_past_their_window_expire(storage, monkeypatch):
+    monkeypatch.setenv("RRVA_ARTIFACT_STORE", "files")
+    logger = audit.AuditLogger()
+    logged = _log_decision(logger)
+    _age(logged["log_path"], 40)
+    old_archive = storage / "archive" / "decision_logs" / "2020-01-01-0.zip"
+    old_archive.parent.mkdir(parents=True)
+    with zipfile.ZipFile(old_archive, "w") as archive:
+        archive.writestr("LOG0.json", b"{}")
+    logger.index.add(
+        {"log_id": "LOG0", "decision_type": "refund_denied", "timestamp": "2020-01-01T00:00:00Z"},
+        f"{old_archive}::LOG0.json"
+    )
+
+    report = _manager(storage, decision_log=30).run_once()
+
+    assert report["expired_files"] == {"decision_log": 1}
+    assert report["expired_archives"] == [str(old_archive)]
+    assert not os.path.exists(logged["log_path"])
+    assert not old_archive.exists()
+    assert logger.index.get(logged["log_id"]) is None
+    assert logger.index.get("LOG0") is None
+
+
+def test_failed_pass_does_not_stop_the_thread(storage, monkeypatch):
+    manager = _manager(storage)
+    manager.config["interval_seconds"] = 0.01
+    calls = []
+
+    def run_once():
+        calls.append(1)
+        raise RuntimeError("unexpected")
+
+    monkeypatch.setattr(manager, "run_once", run_once)
+    manager.start()
+    for _ in range(100):
+        if len(calls) >= 2:
+            break
+        time.sleep(0.01)
+    manager.stop()
+
+    assert len(calls) >= 2
@@ -0,0 +1,193 @@
+"""Shared state backends, and the OTP and refund paths that run on them."""
+
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import time
+
+import pytest
+
+from tools.state import InMemoryBackend, SQLiteBackend, StateBackend, StateMap
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryBackend()
+    return SQLiteBackend(tmp_path / "state.db")
+
+
+def test_backend_interface_is_abstract():
+    class Partial(StateBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_incr_starts_at_zero_and_counts(backend):
+    assert backend.incr("k") == 1
+    assert backend.incr("k", 2) == 3
+    assert StateMap(backend, "n").increment("a") == 1
+    assert StateMap(backend, "n")["a"] == 1
+
+
+def test_incr_restarts_after_expiry(backend):
+    assert backend.incr("k", ttl=0.05) == 1
+    time.sleep(0.1)
+    assert backend.get("k") is None
+    assert backend.incr("k", ttl=60) == 1
+    assert backend.incr("k", ttl=60) == 2
+
+
+def test_add_sets_only_missing_keys(backend):
+    state = StateMap(backend, "claims")
+    assert state.add("ORD001", "REF1") is True
+    assert state.add("ORD001", "REF2") is False
+    assert state["ORD001"] == "REF1"
+    assert backend.add("k", "1", ttl=0.05) is True
+    time.sleep(0.1)
+    assert backend.add("k", "2") is True
+    assert backend.get("k") == "2"
+
+
+def test_sqlite_add_claims_once_across_connections(tmp_path):
+    path = tmp_path / "state.db"
+    SQLiteBackend(path)
+
+    def claim(worker):
+        return SQLiteBackend(path).add("order", str(worker))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(claim, range(50)))
+
+    assert results.count(True) == 1
+
+
+def test_sqlite_incr_is_atomic_across_connections(tmp_path):
+    path = tmp_path / "state.db"
+    SQLiteBackend(path)
+
+    def bump(_):
+        # A fresh backend per call: its own connection, like another worker
+        return SQLiteBackend(path).incr("attempts")
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(bump, range(200)))
+
+    assert sorted(results) == list(range(1, 201))
+
+
+def test_pop_tolerates_missing_entries(backend):
+    state = StateMap(backend, "otp")
+    state["c"] = {"code": "1"}
+    assert state.pop("c", None) == {"code": "1"}
+    assert state.pop("c", None) is None
+    with pytest.raises(KeyError):
+        state.pop("c")
+
+
+def _verifier():
+    from tools.identity import IdentityVerifier
+
+    verifier = IdentityVerifier()
+    verifier.resend_configured = False
+    verifier.email_sender = None
+    return verifier
+
+
+def test_otp_verifies_on_another_worker(shared_state):
+    first, second = _verifier(), _verifier()
+    code = asyncio.run(first.send_otp("CUST001"))["_debug_otp"]
+
+    result = asyncio.run(second.verify_otp("CUST001", code))
+
+    assert result["verified"] is True
+    assert asyncio.run(first.verify_otp("CUST001", code))["error"].startswith("No OTP found")
+
+
+def test_otp_attempt_limit_holds_across_workers(shared_state):
+    workers = [_verifier() for _ in range(3)]
+    code = asyncio.run(workers[0].send_otp("CUST001"))["_debug_otp"]
+    wrong = "000000" if code != "000000" else "111111"
+
+    results = [asyncio.run(worker.verify_otp("CUST001", wrong)) for worker in workers]
+    assert [r["attempts_remaining"] for r in results] == [2, 1, 0]
+
+    # The right code no longer works once the attempts are used up
+    result = asyncio.run(workers[0].verify_otp("CUST001", code))
+    assert result["verified"] is False
+    assert result["error"].startswith("Too many failed attempts")
+
+
+def test_new_otp_resets_attempts(shared_state):
+    verifier = _verifier()
+    asyncio.run(verifier.send_otp("CUST001"))
+    asyncio.run(verifier.verify_otp("CUST001", "not-a-code"))
+    code = asyncio.run(verifier.send_otp("CUST001"))["_debug_otp"]
+
+    assert asyncio.run(verifier.verify_otp("CUST001", code))["verified"] is True
+
+
+def test_refund_receipt_from_another_worker(shared_state):
+    from tools.refunds import RefundExecutor
+
+    refund = asyncio.run(RefundExecutor().execute("ORD-001", "CUST001", reason="test"))
+    receipt = asyncio.run(RefundExecutor().get_receipt(refund["refund_id"], "ORD-001"))
+
+    assert refund["success"] is True
+    assert receipt["refund_id"] == refund["refund_id"]
+
+
+def test_bulk_refund_skips_orders_refunded_by_another_worker(shared_state):
+    from tools.refunds import RefundExecutor
+
+    asyncio.run(RefundExecutor().execute("ORD-001", "CUST001", reason="test"))
+
+    async def run_bulk():
+        return [r async for r in RefundExecutor().execute_bulk(["ORD-001", "ORD-004"], reason="recall", customer_id="CUST001")]
+
+    results = asyncio.run(run_bulk())
+    assert results[0]["error"] == "Order already refunded"
+    assert results[1]["success"] is True
+    assert results[-1]["succeeded"] == 1
+
+
+def test_bulk_refund_requires_customer(shared_state):
+    from tools.refunds import RefundExecutor
+
+    async def run_bulk():
+        return [r async for r in RefundExecutor().execute_bulk(["ORD-004"], reason="recall")]
+
+    result = asyncio.run(run_bulk())[0]
+    assert result["success"] is False
+    assert "customer_id is required" in result["error"]
+
+
+def test_order_is_refunded_once(shared_state):
+    from tools.refunds import RefundExecutor
+
+    first = asyncio.run(RefundExecutor().execute("ORD-001", "CUST001", reason="test"))
+    second = asyncio.run(RefundExecutor().execute("ORD-001", "CUST001", reason="test"))
+
+    assert first["success"] is True
+    assert second["success"] is False
+    assert second["error"] == "Order already refunded"
+    assert second["refund_id"] == first["refund_id"]
+
+
+@pytest.mark.parametrize("amount", [True, float("nan"), float("inf"), -5, "10"])
+def test_bulk_refund_rejects_invalid_amounts(shared_state, amount):
+    from tools.refunds import RefundExecutor
+
+    executor = RefundExecutor()
+
+    async def run_bulk():
+        entry = {"order_id": "ORD-004", "refund_amount": amount}
+        return [r async for r in executor.execute_bulk([entry], reason="recall", customer_id="CUST001")]
+
+    result = asyncio.run(run_bulk())[0]
+    assert result["error"] == "Invalid refund amount"
+    # Nothing was claimed or written
+    assert "ORD004" not in executor._order_refunds
+    assert len(executor._refunds) == 0
@@ -0,0 +1,249 @@
+"""
+Admission Control
+Per-tool concurrency limits, priority classes and load shedding for tool calls.
+
+Every tool belongs to a priority class:
+- interactive: calls on the live voice path (verification, lookups, refunds)
+- finalize: end-of-call audit work (end_call, log_decision, store_artifact)
+- bulk: back-office work (/refunds/bulk as execute_bulk_refund, query_decisions
+  and /audit/*, /analytics/decisions as decision_analytics, /transcripts/search
+  as search_transcripts, /transactions as export_transactions)
+
+A call must get a slot in its tool pool (if the tool has one) and then in
+its class pool. Calls beyond a pool's limit wait in a FIFO queue, up to
+max_queue entries and queue_timeout seconds. Anything past that is shed at once with Overloaded.
+Finalize and bulk calls are also shed instead of queued while interactive
+calls are waiting. A burst of large end_call requests therefore cannot delay
+verify_otp on a live call.
+
+Limits live in the TOOL_LIMITS / CLASS_LIMITS registry below and can be
+overridden in mcp_config.json under "admission".
+"""
+
+from typing import Any, Deque, Dict, Optional
+from collections import deque
+from pathlib import Path
+import asyncio
+import json
+
+CONFIG_PATH = Path(__file__).resolve().parent.parent / "mcp_config.json"
+
+INTERACTIVE = "interactive"
+FINALIZE = "finalize"
+BULK = "bulk"
+
+
+class ClassLimit:
+    """Concurrency and queueing limits for one priority class."""
+
+    __slots__ = ("max_concurrent", "max_queue", "queue_timeout", "yields_to_interactive")
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_queue: int,
+        queue_timeout: float,
+        yields_to_interactive: bool = False
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.yields_to_interactive = yields_to_interactive
+
+
+class ToolLimit:
+    """Priority class and optional concurrency limits for one tool."""
+
+    __slots__ = ("priority", "max_concurrent", "max_queue")
+
+    def __init__(self, priority: str = INTERACTIVE, max_concurrent: Optional[int] = None, max_queue: Optional[int] = None):
+        self.priority = priority
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+
+
+# Priority class registry
+CLASS_LIMITS: Dict[str, ClassLimit] = {
+    INTERACTIVE: ClassLimit(max_concurrent=64, max_queue=256, queue_timeout=2.0),
+    FINALIZE: ClassLimit(max_concurrent=8, max_queue=64, queue_timeout=10.0, yields_to_interactive=True),
+    BULK: ClassLimit(max_concurrent=2, max_queue=8, queue_timeout=30.0, yields_to_interactive=True),
+}
+
+# Tool registry; tools not listed are interactive with only the class limit
+TOOL_LIMITS: Dict[str, ToolLimit] = {
+    "send_otp": ToolLimit(INTERACTIVE, max_concurrent=16, max_queue=64),
+    "end_call": ToolLimit(FINALIZE, max_concurrent=4, max_queue=32),
+    "store_artifact": ToolLimit(FINALIZE, max_concurrent=4, max_queue=32),
+    "log_decision": ToolLimit(FINALIZE, max_concurrent=8, max_queue=64),
+    "execute_bulk_refund": ToolLimit(BULK, max_concurrent=1, max_queue=4),
+    "query_decisions": ToolLimit(BULK, max_concurrent=2, max_queue=8),
+    "decision_analytics": ToolLimit(BULK, max_concurrent=2, max_queue=8),
+    "search_transcripts": ToolLimit(BULK, max_concurrent=2, max_queue=8),
+    "export_transactions": ToolLimit(BULK, max_concurrent=1, max_queue=4),
+}
+
+
+class Overloaded(Exception):
+    """Raised when a tool call is shed instead of admitted."""
+
+    def __init__(self, tool: str, priority: str, reason: str, retry_after: float = 1.0):
+        super().__init__(f"Server overloaded: {tool} ({priority}) shed, {reason}")
+        self.tool = tool
+        self.priority = priority
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "error": "Server overloaded",
+            "tool": self.tool,
+            "priority": self.priority,
+            "reason": self.reason,
+            "retry_after_seconds": self.retry_after
+        }
+
+
+class _Pool:
+    """Counting slot pool with a bounded FIFO wait queue."""
+
+    __slots__ = ("limit", "in_flight", "waiters")
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for waiter in self.waiters if not waiter.done())
+
+    async def acquire(self, max_queue: int, timeout: float, may_queue: bool = True) -> Optional[str]:
+        """Take a slot; returns the shed reason instead if the call cannot be admitted."""
+        if self.in_flight < self.limit and not self.waiters:
+            self.in_flight += 1
+            return None
+        if not may_queue:
+            return "interactive calls are waiting"
+        if self.queued >= max_queue:
+            return "queue full"
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            return "queue timeout"
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over just as the caller went away
+                self.release()
+            raise
+        finally:
+            if waiter in self.waiters and waiter.done():
+                self.waiters.remove(waiter)
+        # release() handed its slot straight to this waiter
+        return None
+
+    def release(self) -> None:
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+class AdmissionController:
+    """Admits, queues or sheds tool calls according to the limit registry."""
+
+    def __init__(
+        self,
+        class_limits: Optional[Dict[str, ClassLimit]] = None,
+        tool_limits: Optional[Dict[str, ToolLimit]] = None
+    ):
+        self.class_limits = dict(class_limits or CLASS_LIMITS)
+        self.tool_limits = dict(tool_limits or TOOL_LIMITS)
+        self._class_pools = {name: _Pool(limit.max_concurrent) for name, limit in self.class_limits.items()}
+        self._tool_pools: Dict[str, _Pool] = {
+            tool: _Pool(limit.max_concurrent)
+            for tool, limit in self.tool_limits.items()
+            if limit.max_concurrent is not None
+        }
+
+    @classmethod
+    def from_config(cls, path: Path = CONFIG_PATH) -> "AdmissionController":
+        """Apply the "admission" section of mcp_config.json on top of the default registry."""
+        class_limits = dict(CLASS_LIMITS)
+        tool_limits = dict(TOOL_LIMITS)
+        config: Dict[str, Any] = {}
+        if path.exists():
+            with open(path) as f:
+                config = json.load(f).get("admission", {})
+
+        for name, values in config.get("classes", {}).items():
+            base = class_limits.get(name, class_limits[INTERACTIVE])
+            class_limits[name] = ClassLimit(
+                max_concurrent=values.get("max_concurrent", base.max_concurrent),
+                max_queue=values.get("max_queue", base.max_queue),
+                queue_timeout=values.get("queue_timeout_seconds", base.queue_timeout),
+                yields_to_interactive=values.get("yields_to_interactive", base.yields_to_interactive)
+            )
+        for tool, values in config.get("tools", {}).items():
+            base = tool_limits.get(tool, ToolLimit())
+            tool_limits[tool] = ToolLimit(
+                priority=values.get("priority", base.priority),
+                max_concurrent=values.get("max_concurrent", base.max_concurrent),
+                max_queue=values.get("max_queue", base.max_queue)
+            )
+        return cls(class_limits, tool_limits)
+
+    def priority(self, tool: str) -> str:
+        limit = self.tool_limits.get(tool)
+        return limit.priority if limit is not None else INTERACTIVE
+
+    def queue_depth(self, priority: str) -> int:
+        """Calls of a priority class waiting for a slot."""
+        return self._class_pools[priority].queued
+
+    def in_flight(self, priority: str) -> int:
+        return self._class_pools[priority].in_flight
+
+    async def acquire(self, tool: str) -> None:
+        """
+        Wait for a slot for one call of a tool.
+
+        Raises:
+            Overloaded: if the call is shed
+        """
+        priority = self.priority(tool)
+        class_limit = self.class_limits[priority]
+        class_pool = self._class_pools[priority]
+        may_queue = not (class_limit.yields_to_interactive and self._class_pools[INTERACTIVE].queued)
+
+        retry_after = min(class_limit.queue_timeout, 5.0)
+
+        # Tool pool first, so calls queued behind a busy tool don't hold class slots
+        tool_pool = self._tool_pools.get(tool)
+        if tool_pool is not None:
+            tool_limit = self.tool_limits[tool]
+            max_queue = tool_limit.max_queue if tool_limit.max_queue is not None else class_limit.max_queue
+            reason = await tool_pool.acquire(max_queue, class_limit.queue_timeout, may_queue)
+            if reason is not None:
+                raise Overloaded(tool, priority, reason, retry_after)
+
+        try:
+            reason = await class_pool.acquire(class_limit.max_queue, class_limit.queue_timeout, may_queue)
+        except asyncio.CancelledError:
+            if tool_pool is not None:
+                tool_pool.release()
+            raise
+        if reason is not None:
+            if tool_pool is not None:
+                tool_pool.release()
+            raise Overloaded(tool, priority, reason, retry_after)
+
+    def release(self, tool: str) -> None:
+        tool_pool = self._tool_pools.get(tool)
+        if tool_pool is not None:
+            tool_pool.release()
+        self._class_pools[self.priority(tool)].release()
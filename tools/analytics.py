@@ -0,0 +1,439 @@
+"""
+Decision Analytics
+Incremental rollups over decision logs for operations dashboards: decisions
+and approval rates per decision type, refunded dollars, and which policy
+checks fail most often, per hour and per day.
+
+log_decision records each decision as it is logged. Recording is a few SQLite
+upserts (one row per granularity for the decision type, and one per policy
+check), so a new log costs the same however many logs came before it. Nothing
+is recomputed. Rollups are served by GET /analytics/decisions.
+
+Rollups outlive the decision log files. To rebuild them from the logs on disk
+and the retention archives (streamed one file at a time), run:
+    python -m tools.analytics rebuild --storage storage
+The rebuild fills separate tables and swaps them in with one transaction, so
+the served rollups stay complete while it runs.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from datetime import datetime
+from pathlib import Path
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+
+from tools.audit_index import decision_log_sources, outcome_amount, range_bound, timestamp_key
+from tools.paths import STORAGE_DIR
+
+DEFAULT_ANALYTICS_PATH = STORAGE_DIR / "analytics.db"
+
+# Bucket key length in a normalized timestamp (YYYY-mm-ddTHH / YYYY-mm-dd)
+GRANULARITIES = {"hour": 13, "day": 10}
+
+# Decision types that grant a refund (others are denials or escalations)
+APPROVED_TYPES = ("refund_approved", "partial_refund")
+
+REBUILD_BATCH = 1000
+MAX_BUCKETS = 24 * 92
+
+# (decision rollups table, check rollups table)
+_LIVE_TABLES = ("decision_rollups", "check_rollups")
+_REBUILD_TABLES = ("decision_rollups_rebuild", "check_rollups_rebuild")
+
+_DECISION_TABLE = """
+CREATE TABLE IF NOT EXISTS {table} (
+    granularity TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    decision_type TEXT NOT NULL,
+    decisions INTEGER NOT NULL,
+    refunds INTEGER NOT NULL,
+    refunded_cents INTEGER NOT NULL,
+    PRIMARY KEY (granularity, bucket, decision_type)
+) WITHOUT ROWID
+"""
+
+_CHECK_TABLE = """
+CREATE TABLE IF NOT EXISTS {table} (
+    granularity TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    decision_type TEXT NOT NULL,
+    check_name TEXT NOT NULL,
+    evaluated INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    PRIMARY KEY (granularity, bucket, decision_type, check_name)
+) WITHOUT ROWID
+"""
+
+# One row while a rebuild runs: decisions from its cutoff on are recorded into
+# the rebuild tables as well, since the rebuild skips them
+_REBUILD_STATE = "CREATE TABLE IF NOT EXISTS rollup_rebuild (cutoff TEXT NOT NULL)"
+
+_SCHEMA = ";\n".join((
+    _DECISION_TABLE.format(table=_LIVE_TABLES[0]),
+    _CHECK_TABLE.format(table=_LIVE_TABLES[1]),
+    _REBUILD_STATE
+))
+
+_DECISION_UPSERT = """
+INSERT INTO {table} (granularity, bucket, decision_type, decisions, refunds, refunded_cents)
+VALUES (?, ?, ?, 1, ?, ?)
+ON CONFLICT (granularity, bucket, decision_type) DO UPDATE SET
+    decisions = decisions + 1,
+    refunds = refunds + excluded.refunds,
+    refunded_cents = refunded_cents + excluded.refunded_cents
+"""
+
+_CHECK_UPSERT = """
+INSERT INTO {table} (granularity, bucket, decision_type, check_name, evaluated, failed)
+VALUES (?, ?, ?, ?, 1, ?)
+ON CONFLICT (granularity, bucket, decision_type, check_name) DO UPDATE SET
+    evaluated = evaluated + 1,
+    failed = failed + excluded.failed
+"""
+
+
+def decision_updates(decision_log: Dict[str, Any]) -> Tuple[List[Tuple], List[Tuple]]:
+    """
+    Rollup increments for one decision log.
+
+    A decision counts as a refund if its type approves one or its outcome
+    has a refund_id. The refunded amount is the outcome amount, in cents.
+
+    Returns:
+        Tuple of (decision_rollups rows, check_rollups rows) to upsert
+
+    Raises:
+        ValueError: if the log has no usable timestamp
+    """
+    key = _decision_key(decision_log)
+    decision_type = str(decision_log.get("decision_type", "unknown"))
+    outcome = decision_log.get("outcome")
+    if not isinstance(outcome, dict):
+        outcome = {}
+    refunded = decision_type in APPROVED_TYPES or bool(outcome.get("refund_id"))
+    cents = round((outcome_amount(outcome) or 0.0) * 100) if refunded else 0
+
+    checks = []
+    for check in decision_log.get("policy_checks") or []:
+        if isinstance(check, dict) and check.get("check"):
+            checks.append((str(check["check"]), 0 if check.get("passed", True) else 1))
+
+    decision_rows = []
+    check_rows = []
+    for granularity, length in GRANULARITIES.items():
+        bucket = key[:length]
+        decision_rows.append((granularity, bucket, decision_type, int(refunded), cents))
+        check_rows.extend((granularity, bucket, decision_type, name, failed) for name, failed in checks)
+    return decision_rows, check_rows
+
+
+def _decision_key(decision_log: Dict[str, Any]) -> str:
+    timestamp = decision_log.get("timestamp") or decision_log.get("stored_at")
+    if not isinstance(timestamp, str):
+        raise ValueError("Decision log has no timestamp")
+    return timestamp_key(timestamp)
+
+
+class DecisionAnalytics:
+    """
+    Hourly and daily decision rollups in a SQLite database shared by every worker.
+
+    Opened on first use, in WAL mode, with one connection per process (and thread).
+    """
+
+    def __init__(self, path: Path = DEFAULT_ANALYTICS_PATH):
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, isolation_level=None, timeout=5.0)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _upsert(
+        connection: sqlite3.Connection,
+        decision_rows: List[Tuple],
+        check_rows: List[Tuple],
+        tables: Tuple[str, str]
+    ) -> None:
+        connection.executemany(_DECISION_UPSERT.format(table=tables[0]), decision_rows)
+        connection.executemany(_CHECK_UPSERT.format(table=tables[1]), check_rows)
+
+    def _apply(self, decision_rows: List[Tuple], check_rows: List[Tuple], tables: Tuple[str, str] = _LIVE_TABLES) -> None:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._upsert(connection, decision_rows, check_rows, tables)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def record(self, decision_log: Dict[str, Any]) -> None:
+        """Add one decision log to the rollups (and to a running rebuild's, from its cutoff on)."""
+        decision_rows, check_rows = decision_updates(decision_log)
+        key = _decision_key(decision_log)
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._upsert(connection, decision_rows, check_rows, _LIVE_TABLES)
+            rebuild = connection.execute("SELECT cutoff FROM rollup_rebuild").fetchone()
+            if rebuild is not None and key >= rebuild["cutoff"]:
+                self._upsert(connection, decision_rows, check_rows, _REBUILD_TABLES)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def summary(
+        self,
+        granularity: str = "day",
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        decision_type: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Rollups for a time range.
+
+        Args:
+            granularity: "hour" or "day"
+            start: Inclusive start date or ISO timestamp
+            end: Inclusive end date or ISO timestamp
+            decision_type: Only count this decision type
+
+        Returns:
+            Dict with one entry per bucket (decisions by type, approval rate,
+            refunds, refunded amount), totals for the range, and policy
+            checks ordered by failures
+
+        Raises:
+            ValueError: for an unknown granularity or an invalid date
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+        length = GRANULARITIES[granularity]
+        conditions = ["granularity = ?"]
+        params: List[Any] = [granularity]
+        start_key, end_key = range_bound(start), range_bound(end, end=True)
+        if start_key:
+            conditions.append("bucket >= ?")
+            params.append(start_key[:length])
+        if end_key:
+            conditions.append("bucket <= ?")
+            params.append(end_key[:length])
+        where = " AND ".join(conditions)
+        type_filter = ""
+        type_params: List[Any] = []
+        if decision_type is not None:
+            type_filter = " AND decision_type = ?"
+            type_params = [decision_type]
+
+        connection = self._connection()
+        buckets: Dict[str, Dict[str, Any]] = {}
+        for row in connection.execute(
+            f"SELECT bucket, decision_type, decisions, refunds, refunded_cents FROM decision_rollups "
+            f"WHERE {where}{type_filter} ORDER BY bucket",
+            params + type_params
+        ):
+            bucket = buckets.get(row["bucket"])
+            if bucket is None:
+                if len(buckets) >= MAX_BUCKETS:
+                    raise ValueError(f"Range covers more than {MAX_BUCKETS} {granularity} buckets; narrow it")
+                bucket = buckets[row["bucket"]] = _empty_totals(bucket=row["bucket"])
+            _add(bucket, row)
+
+        totals = _empty_totals()
+        for bucket in buckets.values():
+            for decision_type_name, count in bucket["by_decision_type"].items():
+                totals["by_decision_type"][decision_type_name] = totals["by_decision_type"].get(decision_type_name, 0) + count
+            for field in ("decisions", "approvals", "refunds", "refunded_cents"):
+                totals[field] += bucket[field]
+
+        checks = [
+            {
+                "check": row["check_name"],
+                "evaluated": row["evaluated"],
+                "failed": row["failed"],
+                "failure_rate": round(row["failed"] / row["evaluated"], 4) if row["evaluated"] else 0.0
+            }
+            for row in connection.execute(
+                f"SELECT check_name, SUM(evaluated) AS evaluated, SUM(failed) AS failed FROM check_rollups "
+                f"WHERE {where}{type_filter} GROUP BY check_name ORDER BY failed DESC, check_name",
+                params + type_params
+            )
+        ]
+
+        return {
+            "granularity": granularity,
+            "start": start,
+            "end": end,
+            "decision_type": decision_type,
+            "buckets": [_finish(bucket) for bucket in buckets.values()],
+            "totals": _finish(totals),
+            "policy_checks": checks
+        }
+
+    def checkpoint(self) -> None:
+        """Copy the WAL into the database file and fsync it (at shutdown)."""
+        self._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def clear(self) -> None:
+        connection = self._connection()
+        connection.execute("DELETE FROM decision_rollups")
+        connection.execute("DELETE FROM check_rollups")
+
+    def rebuild(
+        self,
+        log_dir: Path,
+        read: Optional[Callable[[Path], Any]] = None,
+        archive_dir: Optional[Path] = None,
+        compressor=None
+    ) -> Dict[str, Any]:
+        """
+        Replace the rollups with ones computed from a decision_logs directory and its archives.
+
+        Files are streamed one at a time and applied in batched transactions
+        to separate tables, so memory use doesn't grow with the number of logs
+        and the served rollups stay whole until the new ones are swapped in
+        with one transaction. Decisions timestamped after the rebuild started
+        are left to record, which adds them to both sets of tables meanwhile.
+
+        Args:
+            log_dir: Directory of decision log files (plain or compressed)
+            read: Function that loads one file (default: tools.compression.read_json)
+            archive_dir: Directory of retention archives (archive/decision_logs)
+            compressor: Codec for archived members (default: the audit compressor)
+
+        Returns:
+            Dict with counts of recorded and skipped files
+        """
+        from tools.compression import default_compressor
+        if read is None:
+            from tools.compression import read_json as read
+        decompress = (compressor or default_compressor()).decompress
+        started = time.perf_counter()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Taken under the write lock: every decision recorded before it is in a file already
+            cutoff = timestamp_key(datetime.utcnow().isoformat())
+            connection.execute("DELETE FROM rollup_rebuild")
+            for table, schema in zip(_REBUILD_TABLES, (_DECISION_TABLE, _CHECK_TABLE)):
+                connection.execute(f"DROP TABLE IF EXISTS {table}")
+                connection.execute(schema.format(table=table))
+            connection.execute("INSERT INTO rollup_rebuild (cutoff) VALUES (?)", (cutoff,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        recorded = skipped = 0
+        decision_rows: List[Tuple] = []
+        check_rows: List[Tuple] = []
+        pending = 0
+        for _, load in decision_log_sources(log_dir, read, archive_dir, decompress):
+            try:
+                decision_log = load()
+                if not isinstance(decision_log, dict) or "decision_type" not in decision_log:
+                    raise ValueError("not a decision log")
+                if _decision_key(decision_log) >= cutoff:
+                    continue
+                rows, checks = decision_updates(decision_log)
+            except (ValueError, OSError, RuntimeError, zipfile.BadZipFile):
+                skipped += 1
+                continue
+            decision_rows.extend(rows)
+            check_rows.extend(checks)
+            pending += 1
+            if pending >= REBUILD_BATCH:
+                self._apply(decision_rows, check_rows, _REBUILD_TABLES)
+                recorded += pending
+                decision_rows, check_rows, pending = [], [], 0
+        if pending:
+            self._apply(decision_rows, check_rows, _REBUILD_TABLES)
+            recorded += pending
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for live, rebuilt in zip(_LIVE_TABLES, _REBUILD_TABLES):
+                connection.execute(f"DROP TABLE {live}")
+                connection.execute(f"ALTER TABLE {rebuilt} RENAME TO {live}")
+            connection.execute("DELETE FROM rollup_rebuild")
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return {
+            "recorded": recorded,
+            "skipped": skipped,
+            "analytics_path": str(self.path),
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+
+
+def _empty_totals(**fields: Any) -> Dict[str, Any]:
+    return {**fields, "decisions": 0, "by_decision_type": {}, "approvals": 0, "refunds": 0, "refunded_cents": 0}
+
+
+def _add(totals: Dict[str, Any], row: sqlite3.Row) -> None:
+    totals["decisions"] += row["decisions"]
+    totals["by_decision_type"][row["decision_type"]] = row["decisions"]
+    if row["decision_type"] in APPROVED_TYPES:
+        totals["approvals"] += row["decisions"]
+    totals["refunds"] += row["refunds"]
+    totals["refunded_cents"] += row["refunded_cents"]
+
+
+def _finish(totals: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace cents with dollars and add the approval rate."""
+    totals = dict(totals)
+    totals["refunded_amount"] = totals.pop("refunded_cents") / 100
+    totals["approval_rate"] = round(totals["approvals"] / totals["decisions"], 4) if totals["decisions"] else 0.0
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decision analytics rollups")
+    parser.add_argument("--storage", default=str(STORAGE_DIR), help="Storage directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("rebuild", help="Rebuild the rollups from decision_logs and its archives")
+    summary = subparsers.add_parser("summary", help="Print rollups")
+    summary.add_argument("--granularity", choices=list(GRANULARITIES), default="day")
+    summary.add_argument("--start", default=None)
+    summary.add_argument("--end", default=None)
+    args = parser.parse_args()
+
+    storage_dir = Path(args.storage)
+    analytics = DecisionAnalytics(storage_dir / "analytics.db")
+    if args.command == "rebuild":
+        from tools.compression import Compressor, read_json
+
+        compressor = Compressor("none", storage_dir / "dictionaries")
+        result = analytics.rebuild(
+            storage_dir / "decision_logs",
+            read=lambda path: read_json(path, compressor),
+            archive_dir=storage_dir / "archive" / "decision_logs",
+            compressor=compressor
+        )
+        print(f"Recorded {result['recorded']} decision logs ({result['skipped']} skipped) "
+              f"in {result['seconds']}s -> {result['analytics_path']}")
+    else:
+        print(json.dumps(analytics.summary(args.granularity, args.start, args.end), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""
+Audio Artifact Storage
+Streams call recordings to binary files without holding them in memory.
+
+Audio arrives as base64 text (store_artifact, chunked uploads) or raw bytes.
+Base64 is decoded in chunks as it arrives, and the decoded bytes are written
+straight to disk. On the way through, each chunk is hashed (SHA-256) and
+scanned for frame headers. The scan builds a duration index: byte offsets at
+fixed time intervals, so a player or a redaction job can seek into a
+recording without decoding it.
+
+Each recording is stored as two files:
+    storage/audio/<session>_<ULID>.mp3          the audio bytes
+    storage/audio/<session>_<ULID>.index.json   hash, duration and seek index
+
+MP3 (MPEG audio, with or without ID3v2 tags) and WAV recordings are indexed.
+Other formats are stored and hashed, and their duration is reported as unknown.
+Unrecognized content is stored with a .bin extension.
+
+A recording larger than the byte limit is rejected while it streams in, and
+nothing is kept.
+
+Configuration (environment):
+    RRVA_MAX_AUDIO_BYTES   largest decoded recording accepted (default 200 MiB)
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Union
+from datetime import datetime
+from pathlib import Path
+import base64
+import binascii
+import hashlib
+import json
+import os
+
+# Base64 characters decoded per step when content arrives as one string (multiple of 4)
+CHUNK_CHARS = 256 * 1024
+
+# Seconds between entries of the duration index
+INDEX_INTERVAL = 1.0
+
+# Largest decoded recording accepted (RRVA_MAX_AUDIO_BYTES)
+DEFAULT_MAX_AUDIO_BYTES = 200 * 1024 * 1024
+
+# Bytes kept to detect the container format and parse WAV headers
+_HEADER_BYTES = 4096
+
+_WHITESPACE = b" \t\r\n"
+
+
+class InvalidAudio(ValueError):
+    """Raised when audio content cannot be decoded or is empty."""
+
+
+class AudioTooLarge(InvalidAudio):
+    """Raised when a recording grows past the byte limit."""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Audio content exceeds the {max_bytes} byte limit")
+        self.max_bytes = max_bytes
+
+
+def max_audio_bytes() -> int:
+    """The configured limit on decoded recording size."""
+    return int(os.getenv("RRVA_MAX_AUDIO_BYTES", str(DEFAULT_MAX_AUDIO_BYTES)))
+
+
+class Base64StreamDecoder:
+    """
+    Incremental base64 decoder.
+
+    Chunks may split a base64 quantum anywhere. Incomplete quanta are held
+    back until the next chunk arrives. Whitespace is ignored, and a leading
+    data URL prefix ("data:audio/mpeg;base64,") is stripped.
+    """
+
+    def __init__(self):
+        self._pending = b""
+        self._started = False
+
+    def feed(self, chunk: Union[str, bytes]) -> bytes:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("ascii", errors="replace")
+        data = self._pending + bytes(chunk).translate(None, _WHITESPACE)
+        if not self._started:
+            if data.startswith(b"data:"):
+                comma = data.find(b",")
+                if comma < 0:
+                    # Prefix not complete yet
+                    self._pending = data
+                    return b""
+                data = data[comma + 1:]
+            self._started = True
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        try:
+            return base64.b64decode(data[:usable], validate=True)
+        except binascii.Error as e:
+            raise InvalidAudio(f"Invalid base64 audio content: {e}") from None
+
+    def finish(self) -> bytes:
+        if self._pending:
+            raise InvalidAudio("Invalid base64 audio content: truncated input")
+        return b""
+
+
+# MPEG audio frame header tables, indexed by [version][layer] and bitrate index (kbps)
+_MPEG1, _MPEG2, _MPEG25 = 3, 2, 0
+_LAYER1, _LAYER2, _LAYER3 = 3, 2, 1
+_BITRATES = {
+    (_MPEG1, _LAYER1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (_MPEG1, _LAYER2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (_MPEG1, _LAYER3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (_MPEG2, _LAYER1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (_MPEG2, _LAYER2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (_MPEG2, _LAYER3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_SAMPLE_RATES = {
+    _MPEG1: (44100, 48000, 32000),
+    _MPEG2: (22050, 24000, 16000),
+    _MPEG25: (11025, 12000, 8000),
+}
+
+
+def _parse_mpeg_header(b1: int, b2: int):
+    """Return (frame_length_bytes, samples, sample_rate) for a frame header, or None if invalid."""
+    version = (b1 >> 3) & 3
+    layer = (b1 >> 1) & 3
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 3
+    if version == 1 or layer == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _BITRATES[(_MPEG1 if version == _MPEG1 else _MPEG2, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    if layer == _LAYER1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+    samples = 576 if (layer == _LAYER3 and version != _MPEG1) else 1152
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate
+
+
+class AudioIndexer:
+    """
+    Detects the audio format and builds a duration index from streamed bytes.
+
+    feed() accepts the file's bytes in order, in chunks of any size. MP3 frame
+    headers are parsed as they arrive. WAV durations come from the header and
+    the final size.
+    """
+
+    def __init__(self, interval: float = INDEX_INTERVAL):
+        self.interval = interval
+        self.format: Optional[str] = None
+        self.sample_rate: Optional[int] = None
+        self.index: List[List[float]] = []
+        self._header = bytearray()
+        self._size = 0
+        # MP3 frame scanner state
+        self._buffer = bytearray()
+        self._buffer_offset = 0
+        self._skip = 0
+        self._seconds = 0.0
+        self._next_mark = 0.0
+        self._frames = 0
+
+    def feed(self, data: bytes) -> None:
+        if len(self._header) < _HEADER_BYTES:
+            self._header += data[:_HEADER_BYTES - len(self._header)]
+        if self.format is None:
+            if len(self._header) < 12:
+                self._buffer += data
+                self._size += len(data)
+                return
+            self.format = _detect_format(bytes(self._header))
+            if self.format == "mp3":
+                # Re-scan what was held back while the format was unknown
+                data = bytes(self._buffer) + data
+                self._size -= len(self._buffer)
+                self._buffer = bytearray()
+            else:
+                self._buffer = bytearray()
+        self._size += len(data)
+        if self.format == "mp3":
+            self._scan_mp3(data)
+
+    def _scan_mp3(self, data: bytes) -> None:
+        buffer = self._buffer
+        buffer += data
+        pos = 0
+        end = len(buffer)
+        if self._skip:
+            skipped = min(self._skip, end)
+            pos += skipped
+            self._skip -= skipped
+        while pos + 10 <= end:
+            if buffer[pos] == 0x49 and buffer[pos:pos + 3] == b"ID3":
+                # ID3v2 tag: 10-byte header, syncsafe size, optional 10-byte footer
+                size = (buffer[pos + 6] << 21) | (buffer[pos + 7] << 14) | (buffer[pos + 8] << 7) | buffer[pos + 9]
+                tag_length = 10 + size + (10 if buffer[pos + 5] & 0x10 else 0)
+                skipped = min(tag_length, end - pos)
+                pos += skipped
+                self._skip = tag_length - skipped
+                continue
+            if buffer[pos] != 0xFF or (buffer[pos + 1] & 0xE0) != 0xE0:
+                # Resynchronize on the next possible frame sync (or tag)
+                next_sync = buffer.find(b"\xff", pos + 1)
+                next_tag = buffer.find(b"ID3", pos + 1)
+                candidates = [p for p in (next_sync, next_tag) if p >= 0]
+                pos = min(candidates) if candidates else end
+                continue
+            header = _parse_mpeg_header(buffer[pos + 1], buffer[pos + 2])
+            if header is None:
+                pos += 1
+                continue
+            frame_length, samples, sample_rate = header
+            if pos + frame_length > end:
+                break
+            offset = self._buffer_offset + pos
+            if self._seconds >= self._next_mark:
+                self.index.append([round(self._seconds, 3), offset])
+                self._next_mark += self.interval
+            self._seconds += samples / sample_rate
+            self.sample_rate = sample_rate
+            self._frames += 1
+            pos += frame_length
+        pos = min(pos, end)
+        del buffer[:pos]
+        self._buffer_offset += pos
+
+    def finish(self) -> Dict[str, Any]:
+        """Return format, duration and the duration index for everything fed so far."""
+        if self.format is None:
+            self.format = _detect_format(bytes(self._header))
+            if self.format == "mp3":
+                data = bytes(self._buffer)
+                self._buffer = bytearray()
+                self._scan_mp3(data)
+        duration = None
+        if self.format == "mp3" and self._frames:
+            duration = self._seconds
+        elif self.format == "wav":
+            duration = self._index_wav()
+        return {
+            "format": self.format,
+            "duration_seconds": round(duration, 3) if duration is not None else None,
+            "sample_rate": self.sample_rate,
+            "index_interval_seconds": self.interval,
+            "index": self.index,
+        }
+
+    def _index_wav(self) -> Optional[float]:
+        header = bytes(self._header)
+        pos = 12
+        byte_rate = block_align = None
+        while pos + 8 <= len(header):
+            chunk_id = header[pos:pos + 4]
+            chunk_size = int.from_bytes(header[pos + 4:pos + 8], "little")
+            if chunk_id == b"fmt " and pos + 24 <= len(header):
+                self.sample_rate = int.from_bytes(header[pos + 12:pos + 16], "little")
+                byte_rate = int.from_bytes(header[pos + 16:pos + 20], "little")
+                block_align = int.from_bytes(header[pos + 20:pos + 22], "little") or 1
+            elif chunk_id == b"data":
+                if not byte_rate:
+                    return None
+                data_offset = pos + 8
+                # Streaming encoders often leave the data size unset (0 or 0xFFFFFFFF)
+                data_bytes = self._size - data_offset
+                if 0 < chunk_size < data_bytes:
+                    data_bytes = chunk_size
+                duration = max(0, data_bytes) / byte_rate
+                mark = 0.0
+                while mark < duration:
+                    offset = data_offset + int(mark * byte_rate) // block_align * block_align
+                    self.index.append([round(mark, 3), offset])
+                    mark += self.interval
+                return duration
+            pos += 8 + chunk_size + (chunk_size & 1)
+        return None
+
+
+def _detect_format(header: bytes) -> str:
+    if header.startswith(b"ID3") or (len(header) > 1 and header[0] == 0xFF and (header[1] & 0xE0) == 0xE0):
+        return "mp3"
+    if header.startswith(b"RIFF") and header[8:12] == b"WAVE":
+        return "wav"
+    if header.startswith(b"OggS"):
+        return "ogg"
+    if header.startswith(b"fLaC"):
+        return "flac"
+    if header[4:8] == b"ftyp":
+        return "m4a"
+    if header.startswith(b"\x1a\x45\xdf\xa3"):
+        return "webm"
+    return "bin"
+
+
+class AudioArtifactWriter:
+    """
+    Writes one audio artifact from a stream of chunks.
+
+    Bytes go to a temporary .part file and are renamed into place by close().
+    The final extension comes from the detected format. A failed or abandoned
+    upload never leaves a partial recording under its final name. With
+    max_bytes set, write() raises AudioTooLarge as soon as the decoded size
+    would pass it.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        stem: str,
+        encoding: str = "base64",
+        max_bytes: Optional[int] = None
+    ):
+        if encoding not in ("base64", "binary"):
+            raise ValueError(f"Unknown audio encoding: {encoding}")
+        self.directory = directory
+        self.stem = stem
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._decoder = Base64StreamDecoder() if encoding == "base64" else None
+        self._sha256 = hashlib.sha256()
+        self._indexer = AudioIndexer()
+        self._part_path = directory / f"{stem}.part"
+        self._file = open(self._part_path, "wb")
+
+    def write(self, chunk: Union[str, bytes]) -> None:
+        """Add the next chunk (base64 text or raw bytes, depending on the encoding)."""
+        data = self._decoder.feed(chunk) if self._decoder is not None else bytes(chunk)
+        self._write_bytes(data)
+
+    def _write_bytes(self, data: bytes) -> None:
+        if data:
+            if self.max_bytes is not None and self.size + len(data) > self.max_bytes:
+                raise AudioTooLarge(self.max_bytes)
+            self._file.write(data)
+            self._sha256.update(data)
+            self._indexer.feed(data)
+            self.size += len(data)
+
+    def close(self, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Finish the artifact and write its index sidecar.
+
+        Returns:
+            Dict with the file and index paths, size, SHA-256, format and duration
+        """
+        try:
+            if self._decoder is not None:
+                self._write_bytes(self._decoder.finish())
+            if self.size == 0:
+                raise InvalidAudio("Audio content is empty")
+            self._file.close()
+        except BaseException:
+            self.abort()
+            raise
+
+        summary = self._indexer.finish()
+        file_path = self.directory / f"{self.stem}.{summary['format']}"
+        os.replace(self._part_path, file_path)
+
+        index_path = self.directory / f"{self.stem}.index.json"
+        record = {
+            "file": file_path.name,
+            "size_bytes": self.size,
+            "sha256": self._sha256.hexdigest(),
+            **summary,
+            "metadata": metadata or {},
+            "stored_at": datetime.utcnow().isoformat() + "Z"
+        }
+        with open(index_path, "w") as f:
+            json.dump(record, f)
+
+        return {
+            "file_path": str(file_path),
+            "index_path": str(index_path),
+            "file_size_bytes": self.size,
+            "sha256": record["sha256"],
+            "format": summary["format"],
+            "duration_seconds": summary["duration_seconds"]
+        }
+
+    def abort(self) -> None:
+        """Discard a partially written artifact."""
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.unlink(self._part_path)
+        except FileNotFoundError:
+            pass
+
+
+def iter_base64_chunks(content: str, chunk_chars: int = CHUNK_CHARS) -> Iterable[str]:
+    """Split base64 text that is already in memory into decode-sized slices."""
+    for start in range(0, len(content), chunk_chars):
+        yield content[start:start + chunk_chars]
+
+
+def load_index(audio_path: Union[str, Path]) -> Dict[str, Any]:
+    """Read the index sidecar stored next to an audio artifact."""
+    audio_path = Path(audio_path)
+    stem = audio_path.name.rsplit(".", 1)[0]
+    with open(audio_path.with_name(f"{stem}.index.json")) as f:
+        return json.load(f)
+
+
+def seek_offset(index: Dict[str, Any], seconds: float) -> int:
+    """Byte offset of the last indexed position at or before a time (0 without an index)."""
+    offset = 0
+    for mark, position in index.get("index", []):
+        if mark > seconds:
+            break
+        offset = position
+    return offset
@@ -3,29 +3,146 @@ Audit Logging and Artifact Storage
 Handles decision logging and storage of audio, transcripts, decision logs, and receipts.
 """
 
-from typing import Dict, List, Optional, Any
+from typing import AsyncIterable, Deque, Dict, List, Optional, Any, Tuple, Union
+from collections import deque
 from datetime import datetime
 from pathlib import Path
+from contextlib import contextmanager
+import asyncio
+import hashlib
 import json
 import os
+import sqlite3
+import time
 
-# Storage directory for artifacts
-STORAGE_DIR = Path("storage")
-STORAGE_DIR.mkdir(exist_ok=True)
+from tools.tracing import span
+from tools.audio import AudioArtifactWriter, AudioTooLarge, InvalidAudio, iter_base64_chunks, max_audio_bytes
+from tools.blobstore import BlobStore
+from tools.compression import canonical_json, default_compressor, read_json
+from tools.audit_index import AuditIndex
+from tools.transcript_search import TranscriptIndex
+from tools.analytics import DecisionAnalytics
+from tools.ids import new_id
+from tools.paths import STORAGE_DIR
+from tools.state import state_map
+from tools.retention import ARCHIVE_SEPARATOR, fsync_dir, read_archived
 
-# Subdirectories for different artifact types
+# Subdirectories for different artifact types (created on first write)
 AUDIO_DIR = STORAGE_DIR / "audio"
 TRANSCRIPT_DIR = STORAGE_DIR / "transcripts"
 LOG_DIR = STORAGE_DIR / "decision_logs"
 RECEIPT_DIR = STORAGE_DIR / "receipts"
 
-for dir_path in [AUDIO_DIR, TRANSCRIPT_DIR, LOG_DIR, RECEIPT_DIR]:
-    dir_path.mkdir(exist_ok=True)
+# JSON artifact types kept in the content-addressed blob store
+# (RRVA_ARTIFACT_STORE=files writes one timestamped file per call instead)
+BLOB_ARTIFACT_TYPES = ("transcript", "decision_log", "receipt")
+
+# Kernel writeback persists dirty pages within ~30s, so flush() only fsyncs files younger than this
+UNSYNCED_WINDOW_SECONDS = 60
+
+# How long a deduplicated decision is remembered (end_call retries arrive within minutes)
+DECISION_DEDUP_TTL_SECONDS = 86400
+
+_created_dirs = set()
+
+
+def _ensure_dir(dir_path: Path) -> Path:
+    """Create an artifact directory the first time something is written to it."""
+    if dir_path not in _created_dirs:
+        dir_path.mkdir(parents=True, exist_ok=True)
+        _created_dirs.add(dir_path)
+    return dir_path
 
 
 class AuditLogger:
     """Handles audit logging and artifact storage."""
     
+    def __init__(self):
+        # Codec and per-segment dictionaries for JSON artifacts (RRVA_AUDIT_COMPRESSION)
+        self.compressor = default_compressor()
+        
+        # Deduplicating store for transcripts, decision logs and receipts
+        self.blob_store = None
+        if os.getenv("RRVA_ARTIFACT_STORE", "blobs") == "blobs":
+            self.blob_store = BlobStore(STORAGE_DIR / "blobs", STORAGE_DIR / "manifests", self.compressor)
+        
+        # Queryable index over decision logs (opened on first use)
+        self.index = AuditIndex(STORAGE_DIR / "audit_index.db")
+        
+        # Hourly/daily decision rollups for dashboards (opened on first use)
+        self.analytics = DecisionAnalytics(STORAGE_DIR / "analytics.db")
+        
+        # Full-text index over transcripts (opened on first use)
+        self.transcript_index = TranscriptIndex(STORAGE_DIR / "transcript_index.db")
+        
+        # Content hash -> logged decision, so a retried end_call logs its decision once (shared by workers)
+        self._logged_decisions = state_map("logged_decisions", DECISION_DEDUP_TTL_SECONDS)
+        
+        # Recently written files, fsynced by flush() at shutdown: (time written, path)
+        self._unsynced: Deque[Tuple[float, str]] = deque()
+    
+    def _write_json(self, directory: Path, stem: str, value: Any, segment: str) -> Path:
+        """Write a JSON artifact, compressed with the segment's dictionary unless compression is off."""
+        file_path = _ensure_dir(directory) / f"{stem}.json{self.compressor.extension}"
+        with self._tracked_write(segment):
+            if self.compressor.enabled:
+                data = self.compressor.compress(canonical_json(value), segment)
+            else:
+                data = json.dumps(value, indent=2).encode("utf-8")
+            with open(file_path, "wb") as f:
+                f.write(data)
+        self._written(file_path)
+        return file_path
+    
+    def _written(self, *paths: Union[str, Path]) -> None:
+        """Remember files to fsync at shutdown (forgetting those the kernel has written back by now)."""
+        now = time.monotonic()
+        self._unsynced.extend((now, str(path)) for path in paths)
+        while now - self._unsynced[0][0] > UNSYNCED_WINDOW_SECONDS:
+            self._unsynced.popleft()
+    
+    def flush(self) -> Dict[str, Any]:
+        """
+        Make recent audit writes durable: fsync files written in the last
+        UNSYNCED_WINDOW_SECONDS and their directories, then checkpoint the
+        index databases. Called by the server lifecycle at shutdown.
+        
+        Returns:
+            Dict with the number of files and directories synced
+        """
+        pending, self._unsynced = self._unsynced, deque()
+        synced = 0
+        directories = set()
+        for _, path in pending:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue  # archived or rotated since
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            synced += 1
+            directories.add(os.path.dirname(path))
+        for directory in directories:
+            fsync_dir(Path(directory))
+        for store in (self.index, self.transcript_index, self.analytics):
+            if store.path.exists():
+                store.checkpoint()
+        return {"files_synced": synced, "directories_synced": len(directories)}
+    
+    def read_artifact(self, path: Union[str, Path]) -> Any:
+        """Read a JSON artifact or decision log file, decompressing it if needed (archived paths included)."""
+        if ARCHIVE_SEPARATOR in str(path):
+            return json.loads(self.compressor.decompress(read_archived(str(path))))
+        return read_json(path, self.compressor)
+    
+    @contextmanager
+    def _tracked_write(self, artifact_type: str):
+        """Trace an audit write."""
+        with span("audit.write", artifact_type=artifact_type):
+            yield
+    
     async def log_decision(
         self,
         session_id: str,
@@ -34,11 +151,17 @@ class AuditLogger:
         outcome: Dict[str, Any],
         inputs: Optional[Dict[str, Any]] = None,
         policy_checks: Optional[List[Dict[str, Any]]] = None,
-        tool_calls: Optional[List[Dict[str, Any]]] = None
+        tool_calls: Optional[List[Dict[str, Any]]] = None,
+        deduplicate: bool = False
     ) -> Dict[str, Any]:
         """
         Log a decision event for audit purposes.
         
+        With deduplicate, a decision identical to one logged in the last day
+        (same session, customer, type, inputs, checks, tool calls and outcome)
+        is not written, indexed or counted again; the first log is returned
+        with deduplicated=True.
+        
         Args:
             session_id: Session/Interaction ID
             customer_id: Customer ID
@@ -47,6 +170,7 @@ class AuditLogger:
             inputs: Input parameters used in decision
             policy_checks: Policy evaluation results
             tool_calls: Tool calls made during decision process
+            deduplicate: Skip a repeat of an identical decision (end_call retries)
         
         Returns:
             Dict with log record details
@@ -60,20 +184,165 @@ class AuditLogger:
             "policy_checks": policy_checks or [],
             "tool_calls": tool_calls or [],
             "outcome": outcome,
-            "log_id": f"LOG{session_id}{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
+            "log_id": new_id("LOG")
         }
         
+        dedup_key = None
+        if deduplicate:
+            content = {key: value for key, value in decision_log.items() if key not in ("timestamp", "log_id")}
+            dedup_key = hashlib.sha256(canonical_json(content)).hexdigest()
+            claim = {"log_id": decision_log["log_id"], "timestamp": decision_log["timestamp"]}
+            # Atomic across workers: only the first identical decision is written
+            if not self._logged_decisions.add(dedup_key, claim):
+                logged = self._logged_decisions.get(dedup_key) or {}
+                return {"success": True, **logged, "deduplicated": True}
+        
         # Store decision log
-        log_file = LOG_DIR / f"{decision_log['log_id']}.json"
-        with open(log_file, "w") as f:
-            json.dump(decision_log, f, indent=2)
+        try:
+            log_file = self._write_json(LOG_DIR, decision_log["log_id"], decision_log, "decision_log")
+        except Exception:
+            if dedup_key is not None:
+                self._logged_decisions.pop(dedup_key, None)
+            raise
         
-        return {
+        # Index it; the log file is the record, so an index failure doesn't fail the call
+        try:
+            with span("audit.index"):
+                self.index.add(decision_log, str(log_file))
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Warning: could not index decision log {decision_log['log_id']}: {e}")
+        try:
+            with span("audit.analytics"):
+                self.analytics.record(decision_log)
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Warning: could not record decision log {decision_log['log_id']} in analytics: {e}")
+        
+        result = {
             "success": True,
             "log_id": decision_log["log_id"],
             "log_path": str(log_file),
             "timestamp": decision_log["timestamp"]
         }
+        if dedup_key is not None:
+            self._logged_decisions[dedup_key] = {key: result[key] for key in ("log_id", "log_path", "timestamp")}
+        return result
+    
+    async def query_decisions(
+        self,
+        session_id: Optional[str] = None,
+        customer_id: Optional[str] = None,
+        decision_type: Optional[str] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        min_amount: Optional[float] = None,
+        max_amount: Optional[float] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Query logged decisions from the audit index (newest first).
+        
+        Args:
+            session_id: Session ID
+            customer_id: Customer ID
+            decision_type: Decision type (e.g. refund_denied)
+            start_date: Inclusive start date or ISO timestamp
+            end_date: Inclusive end date or ISO timestamp
+            min_amount: Minimum outcome amount
+            max_amount: Maximum outcome amount
+            limit: Maximum number of decisions to return
+            cursor: next_cursor from a previous response
+        
+        Returns:
+            Dict with matching decisions and pagination details
+        """
+        try:
+            result = self.index.query(
+                session_id=session_id,
+                customer_id=customer_id,
+                decision_type=decision_type,
+                start=start_date,
+                end=end_date,
+                min_amount=min_amount,
+                max_amount=max_amount,
+                limit=limit,
+                cursor=cursor
+            )
+        except ValueError as e:
+            return {"error": str(e)}
+        result["retrieved_at"] = datetime.utcnow().isoformat() + "Z"
+        return result
+    
+    def _index_transcript(
+        self,
+        session_id: str,
+        transcript: Any,
+        metadata: Dict[str, Any],
+        path: str,
+        sha256: Optional[str] = None
+    ) -> None:
+        """Add a stored transcript to the search index (a failure is only logged; the file is the record)."""
+        try:
+            with span("audit.transcript_index"):
+                self.transcript_index.add(session_id, transcript, metadata, path, sha256)
+        except sqlite3.Error as e:
+            print(f"Warning: could not index transcript for session {session_id}: {e}")
+    
+    async def search_transcripts(
+        self,
+        query: str,
+        speaker: Optional[str] = None,
+        customer_id: Optional[str] = None,
+        match: str = "all",
+        limit: int = 20,
+        offset: int = 0
+    ) -> Dict[str, Any]:
+        """
+        Full-text search over stored transcripts.
+        
+        Args:
+            query: Words and "quoted phrases"
+            speaker: Only match turns by this speaker (customer, agent)
+            customer_id: Only search this customer's transcripts
+            match: "all" terms in one turn, or "any"
+            limit: Maximum number of transcripts to return
+            offset: Number of transcripts to skip
+        
+        Returns:
+            Dict with ranked transcripts and matching turn snippets
+        """
+        try:
+            result = self.transcript_index.search(query, speaker, customer_id, match, limit, offset)
+        except ValueError as e:
+            return {"error": str(e)}
+        result["retrieved_at"] = datetime.utcnow().isoformat() + "Z"
+        return result
+    
+    async def decision_analytics(
+        self,
+        granularity: str = "day",
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        decision_type: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Decision rollups (approval rate, refunded dollars, failing policy checks).
+        
+        Args:
+            granularity: hour or day
+            start_date: Inclusive start date or ISO timestamp
+            end_date: Inclusive end date or ISO timestamp
+            decision_type: Only count this decision type
+        
+        Returns:
+            Dict with per-bucket rollups, totals and policy check failure rates
+        """
+        try:
+            result = self.analytics.summary(granularity, start_date, end_date, decision_type)
+        except ValueError as e:
+            return {"error": str(e)}
+        result["retrieved_at"] = datetime.utcnow().isoformat() + "Z"
+        return result
     
     async def store_artifact(
         self,
@@ -94,47 +363,71 @@ class AuditLogger:
         Returns:
             Dict with storage details
         """
-        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+        stem = f"{session_id}_{new_id()}"
+        audio_details: Dict[str, Any] = {}
         
         if artifact_type == "audio":
-            # For audio, content should be base64 encoded
-            file_path = AUDIO_DIR / f"{session_id}_{timestamp}.mp3"
-            # In production, decode base64 and write binary
-            # For PoC, we'll store as text (base64 string)
-            with open(file_path, "w") as f:
-                f.write(content)
-            file_extension = "mp3"
+            # Base64 content is decoded in chunks straight to a binary file (see tools/audio.py)
+            try:
+                audio_details = await self._write_audio(
+                    stem, _iter_async(iter_base64_chunks(content)), "base64", metadata
+                )
+            except InvalidAudio as e:
+                return {"success": False, "error": str(e)}
+            file_path = Path(audio_details.pop("file_path"))
+            file_extension = file_path.suffix[1:]
+        
+        elif artifact_type in BLOB_ARTIFACT_TYPES and self.blob_store is not None:
+            # Stored once per distinct content and listed in the session manifest
+            payload = json.loads(content) if isinstance(content, str) else content
+            with self._tracked_write(artifact_type):
+                entry = self.blob_store.store(session_id, artifact_type, payload, metadata)
+                self._written(entry["blob_path"], self.blob_store.manifest_path(session_id))
+            if artifact_type == "transcript":
+                self._index_transcript(
+                    session_id, payload, {**(metadata or {}), "stored_at": entry["stored_at"]},
+                    entry["blob_path"], entry["sha256"]
+                )
+            return {
+                "success": True,
+                "artifact_type": artifact_type,
+                "session_id": session_id,
+                "file_path": entry["blob_path"],
+                "file_size_bytes": os.path.getsize(entry["blob_path"]),
+                "sha256": entry["sha256"],
+                "deduplicated": entry["deduplicated"],
+                "manifest_path": str(self.blob_store.manifest_path(session_id)),
+                "stored_at": entry["stored_at"]
+            }
         
         elif artifact_type == "transcript":
-            file_path = TRANSCRIPT_DIR / f"{session_id}_{timestamp}.json"
             # Content should be JSON string
             transcript_data = json.loads(content) if isinstance(content, str) else content
             transcript_data["session_id"] = session_id
             transcript_data["metadata"] = metadata or {}
             transcript_data["stored_at"] = datetime.utcnow().isoformat() + "Z"
-            with open(file_path, "w") as f:
-                json.dump(transcript_data, f, indent=2)
-            file_extension = "json"
+            file_path = self._write_json(TRANSCRIPT_DIR, stem, transcript_data, "transcript")
+            file_extension = file_path.name.split(".", 1)[1]
+            self._index_transcript(
+                session_id, transcript_data, {**transcript_data["metadata"], "stored_at": transcript_data["stored_at"]},
+                str(file_path)
+            )
         
         elif artifact_type == "decision_log":
-            file_path = LOG_DIR / f"{session_id}_{timestamp}.json"
             log_data = json.loads(content) if isinstance(content, str) else content
             log_data["session_id"] = session_id
             log_data["metadata"] = metadata or {}
             log_data["stored_at"] = datetime.utcnow().isoformat() + "Z"
-            with open(file_path, "w") as f:
-                json.dump(log_data, f, indent=2)
-            file_extension = "json"
+            file_path = self._write_json(LOG_DIR, stem, log_data, "decision_log")
+            file_extension = file_path.name.split(".", 1)[1]
         
         elif artifact_type == "receipt":
-            file_path = RECEIPT_DIR / f"{session_id}_{timestamp}.json"
             receipt_data = json.loads(content) if isinstance(content, str) else content
             receipt_data["session_id"] = session_id
             receipt_data["metadata"] = metadata or {}
             receipt_data["stored_at"] = datetime.utcnow().isoformat() + "Z"
-            with open(file_path, "w") as f:
-                json.dump(receipt_data, f, indent=2)
-            file_extension = "json"
+            file_path = self._write_json(RECEIPT_DIR, stem, receipt_data, "receipt")
+            file_extension = file_path.name.split(".", 1)[1]
         
         else:
             return {
@@ -148,7 +441,89 @@ class AuditLogger:
             "session_id": session_id,
             "file_path": str(file_path),
             "file_size_bytes": os.path.getsize(file_path),
-            "stored_at": datetime.utcnow().isoformat() + "Z"
+            "stored_at": datetime.utcnow().isoformat() + "Z",
+            **audio_details
         }
+    
+    def load_artifacts(self, session_id: str, artifact_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Load the JSON artifacts stored for a session (including archived ones).
+        
+        Args:
+            session_id: Session ID
+            artifact_type: Only return artifacts of this type
+        
+        Returns:
+            Manifest entries in the order stored, each with its payload under "content"
+        """
+        if self.blob_store is None:
+            return []
+        return self.blob_store.load(session_id, artifact_type)
+    
+    async def store_audio_stream(
+        self,
+        session_id: str,
+        chunks: AsyncIterable[Union[str, bytes]],
+        encoding: str = "base64",
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Store an audio artifact from a stream of chunks (chunked HTTP uploads).
+        
+        Args:
+            session_id: Session ID
+            chunks: Audio content as it arrives (base64 text or raw bytes)
+            encoding: "base64" or "binary"
+            metadata: Additional metadata
+        
+        Returns:
+            Dict with storage details, SHA-256, format and duration
+        """
+        try:
+            audio_details = await self._write_audio(f"{session_id}_{new_id()}", chunks, encoding, metadata)
+        except AudioTooLarge as e:
+            return {"success": False, "error": str(e), "max_bytes": e.max_bytes}
+        except InvalidAudio as e:
+            return {"success": False, "error": str(e)}
+        
+        return {
+            "success": True,
+            "artifact_type": "audio",
+            "session_id": session_id,
+            "stored_at": datetime.utcnow().isoformat() + "Z",
+            **audio_details
+        }
+    
+    async def _write_audio(
+        self,
+        stem: str,
+        chunks: AsyncIterable[Union[str, bytes]],
+        encoding: str,
+        metadata: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Stream chunks into an audio artifact; a failed write leaves no file behind.
+        
+        Decoding, hashing and file writes run in a worker thread, so a large
+        upload does not block the event loop.
+        """
+        with self._tracked_write("audio"):
+            writer = await asyncio.to_thread(
+                AudioArtifactWriter, _ensure_dir(AUDIO_DIR), stem, encoding, max_audio_bytes()
+            )
+            try:
+                async for chunk in chunks:
+                    await asyncio.to_thread(writer.write, chunk)
+            except BaseException:
+                writer.abort()
+                raise
+            details = await asyncio.to_thread(writer.close, metadata)
+            self._written(details["file_path"], details["index_path"])
+            return details
+
+
+async def _iter_async(chunks):
+    for chunk in chunks:
+        yield chunk
 
 
@@ -0,0 +1,474 @@
+"""
+Audit Decision Index
+SQLite index over decision logs, by session, customer, decision type, time
+and outcome amount.
+
+log_decision adds each decision to the index as it writes the log file, so
+questions like "all refund_denied decisions for CUST009 last week" are
+answered from the index (query_decisions tool, /audit/decisions endpoints)
+without opening the raw files. Each row keeps the outcome JSON and the path
+of the log file it came from.
+
+Rebuild the index from an existing decision_logs directory (plain or
+compressed files) and the retention archives (archive/decision_logs/*.zip)
+with:
+    python -m tools.audit_index rebuild --storage storage
+
+A rebuild fills a separate table and swaps it in with one transaction, so
+queries keep seeing the old index until the new one is complete. Decisions
+logged while the rebuild runs are carried over.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import argparse
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+
+from tools.paths import STORAGE_DIR
+
+DEFAULT_INDEX_PATH = STORAGE_DIR / "audit_index.db"
+
+# Outcome keys that carry the decision's amount, in order of preference
+AMOUNT_KEYS = ("refund_amount", "amount", "total_refund_amount")
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+REBUILD_BATCH = 1000
+
+_TABLE = """
+CREATE TABLE IF NOT EXISTS {table} (
+    log_id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    customer_id TEXT NOT NULL,
+    decision_type TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    amount REAL,
+    refund_id TEXT,
+    status TEXT,
+    outcome TEXT NOT NULL,
+    path TEXT
+)"""
+_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS decisions_customer ON decisions (customer_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS decisions_session ON decisions (session_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS decisions_type ON decisions (decision_type, timestamp)",
+    "CREATE INDEX IF NOT EXISTS decisions_time ON decisions (timestamp)",
+    "CREATE INDEX IF NOT EXISTS decisions_path ON decisions (path)",
+)
+_SCHEMA = ";\n".join((_TABLE.format(table="decisions"),) + _INDEXES) + ";"
+
+# Table a rebuild fills before it is swapped in
+_REBUILD_TABLE = "decisions_rebuild"
+
+_COLUMNS = ("log_id", "session_id", "customer_id", "decision_type", "timestamp",
+            "amount", "refund_id", "status", "outcome", "path")
+
+
+def timestamp_key(value: str) -> str:
+    """Normalize an ISO timestamp to a sortable UTC key (YYYY-mm-ddTHH:MM:SS.ffffffZ)."""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def range_bound(value: Optional[str], end: bool = False) -> Optional[str]:
+    """Turn a date (YYYY-mm-dd) or timestamp range bound into a timestamp key."""
+    if not value:
+        return None
+    if len(value) == 10:
+        value += "T23:59:59.999999" if end else "T00:00:00"
+    try:
+        return timestamp_key(value)
+    except ValueError:
+        raise ValueError(f"Invalid date or timestamp: {value}")
+
+
+def _encode_cursor(key: Tuple[str, str]) -> str:
+    """Encode a (timestamp, log_id) key as an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Decode a cursor produced by _encode_cursor. Raises ValueError if invalid."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, log_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(timestamp, str) or not isinstance(log_id, str):
+        raise ValueError("Invalid cursor")
+    return timestamp, log_id
+
+
+def _prefix_end(prefix: str) -> str:
+    """Smallest string greater than every string starting with prefix (for indexed prefix ranges)."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def outcome_amount(outcome: Dict[str, Any]) -> Optional[float]:
+    """Amount of a decision's outcome (None if the outcome has no amount)."""
+    for key in AMOUNT_KEYS:
+        value = outcome.get(key)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+    return None
+
+
+def decision_row(decision_log: Dict[str, Any], path: Optional[str] = None) -> Tuple:
+    """
+    Index row for a decision log.
+
+    Raises:
+        ValueError: if the log has no usable timestamp
+    """
+    outcome = decision_log.get("outcome") or {}
+    if not isinstance(outcome, dict):
+        outcome = {"value": outcome}
+    amount = outcome_amount(outcome)
+    timestamp = decision_log.get("timestamp") or decision_log.get("stored_at")
+    if not isinstance(timestamp, str):
+        raise ValueError("Decision log has no timestamp")
+    session_id = str(decision_log.get("session_id", "unknown"))
+    return (
+        str(decision_log.get("log_id") or f"{session_id}:{timestamp}"),
+        session_id,
+        str(decision_log.get("customer_id", "unknown")),
+        str(decision_log.get("decision_type", "unknown")),
+        timestamp_key(timestamp),
+        amount,
+        outcome.get("refund_id"),
+        outcome.get("status"),
+        json.dumps(outcome),
+        path
+    )
+
+
+class AuditIndex:
+    """
+    Decision index in a SQLite database shared by every worker process.
+
+    The database is opened on first use. WAL mode lets queries run while a
+    worker is writing. Each process (and thread) uses its own connection.
+    """
+
+    def __init__(self, path: Path = DEFAULT_INDEX_PATH):
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, isolation_level=None, timeout=5.0)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def add(self, decision_log: Dict[str, Any], path: Optional[str] = None) -> None:
+        """Index one decision log (replacing any earlier row with the same log_id)."""
+        self._connection().execute(
+            f"INSERT OR REPLACE INTO decisions ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+            decision_row(decision_log, path)
+        )
+
+    def add_many(self, rows: List[Tuple], table: str = "decisions") -> None:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                f"INSERT OR REPLACE INTO {table} ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                rows
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def query(
+        self,
+        session_id: Optional[str] = None,
+        customer_id: Optional[str] = None,
+        decision_type: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        min_amount: Optional[float] = None,
+        max_amount: Optional[float] = None,
+        limit: int = DEFAULT_LIMIT,
+        cursor: Optional[str] = None,
+        oldest_first: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Find decisions matching every given filter, newest first.
+
+        Args:
+            session_id: Session ID
+            customer_id: Customer ID
+            decision_type: Exact decision type (e.g. refund_denied)
+            start: Inclusive start date or ISO timestamp
+            end: Inclusive end date or ISO timestamp
+            min_amount: Minimum outcome amount
+            max_amount: Maximum outcome amount
+            limit: Page size (at most MAX_LIMIT)
+            cursor: next_cursor from a previous page
+            oldest_first: Return the oldest decisions first
+
+        Returns:
+            Dict with the matching decisions, the total count and the next page cursor
+
+        Raises:
+            ValueError: for an invalid date or cursor
+        """
+        conditions: List[str] = []
+        params: List[Any] = []
+        for column, value in (("session_id", session_id), ("customer_id", customer_id), ("decision_type", decision_type)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        start_key, end_key = range_bound(start), range_bound(end, end=True)
+        if start_key:
+            conditions.append("timestamp >= ?")
+            params.append(start_key)
+        if end_key:
+            conditions.append("timestamp <= ?")
+            params.append(end_key)
+        if min_amount is not None:
+            conditions.append("amount >= ?")
+            params.append(min_amount)
+        if max_amount is not None:
+            conditions.append("amount <= ?")
+            params.append(max_amount)
+
+        connection = self._connection()
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        total_count = connection.execute(f"SELECT COUNT(*) FROM decisions{where}", params).fetchone()[0]
+
+        page_conditions = list(conditions)
+        page_params = list(params)
+        if cursor:
+            page_conditions.append("(timestamp, log_id) > (?, ?)" if oldest_first else "(timestamp, log_id) < (?, ?)")
+            page_params.extend(_decode_cursor(cursor))
+        limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+        direction = "ASC" if oldest_first else "DESC"
+        page_where = f" WHERE {' AND '.join(page_conditions)}" if page_conditions else ""
+        rows = connection.execute(
+            f"SELECT * FROM decisions{page_where} ORDER BY timestamp {direction}, log_id {direction} LIMIT ?",
+            page_params + [limit + 1]
+        ).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "decisions": [self._row_dict(row) for row in rows],
+            "total_count": total_count,
+            "returned_count": len(rows),
+            "next_cursor": _encode_cursor((rows[-1]["timestamp"], rows[-1]["log_id"])) if has_more else None,
+            "has_more": has_more
+        }
+
+    def checkpoint(self) -> None:
+        """Copy the WAL into the database file and fsync it (at shutdown)."""
+        self._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def relocate(self, paths: Dict[str, str]) -> int:
+        """Point rows at new artifact locations ({old path: new path}, e.g. after archiving)."""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            moved = sum(
+                connection.execute("UPDATE decisions SET path = ? WHERE path = ?", (new, old)).rowcount
+                for old, new in paths.items()
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return moved
+
+    def delete_before(self, timestamp: str, batch: int = REBUILD_BATCH) -> int:
+        """Delete decisions logged before an ISO timestamp, a batch per transaction."""
+        key = timestamp_key(timestamp)
+        connection = self._connection()
+        deleted = 0
+        while True:
+            count = connection.execute(
+                "DELETE FROM decisions WHERE rowid IN (SELECT rowid FROM decisions WHERE timestamp < ? LIMIT ?)",
+                (key, batch)
+            ).rowcount
+            deleted += count
+            if count < batch:
+                return deleted
+
+    def delete_paths(self, prefixes: List[str]) -> int:
+        """Delete decisions stored at paths starting with any prefix (an expired file or "<archive>::")."""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            deleted = sum(
+                connection.execute(
+                    "DELETE FROM decisions WHERE path >= ? AND path < ?", (prefix, _prefix_end(prefix))
+                ).rowcount
+                for prefix in prefixes
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return deleted
+
+    def get(self, log_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute("SELECT * FROM decisions WHERE log_id = ?", (log_id,)).fetchone()
+        return self._row_dict(row) if row is not None else None
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM decisions").fetchone()[0]
+
+    @staticmethod
+    def _row_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        decision = dict(row)
+        decision["outcome"] = json.loads(decision["outcome"])
+        return decision
+
+    def rebuild(
+        self,
+        log_dir: Path,
+        read=None,
+        archive_dir: Optional[Path] = None,
+        compressor=None
+    ) -> Dict[str, Any]:
+        """
+        Replace the index contents with every decision log in a directory and its archives.
+
+        Rows are written to a separate table in batches, then swapped in with
+        one transaction. Rows added by log_decision since the rebuild started
+        are kept.
+
+        Args:
+            log_dir: Directory of decision log files (plain or compressed)
+            read: Function that loads one file (default: tools.compression.read_json)
+            archive_dir: Directory of retention archives (archive/decision_logs);
+                their members are indexed as "<archive>::<member>"
+            compressor: Codec for archived members (default: the audit compressor)
+
+        Returns:
+            Dict with counts of indexed and skipped files
+        """
+        from tools.compression import default_compressor
+        if read is None:
+            from tools.compression import read_json as read
+        decompress = (compressor or default_compressor()).decompress
+        started = time.perf_counter()
+        # A decision is timestamped a little before it is indexed: look back a minute
+        started_key = timestamp_key((datetime.utcnow() - timedelta(seconds=60)).isoformat())
+        connection = self._connection()
+        connection.execute(f"DROP TABLE IF EXISTS {_REBUILD_TABLE}")
+        connection.execute(_TABLE.format(table=_REBUILD_TABLE))
+
+        indexed = skipped = 0
+        batch: List[Tuple] = []
+        for path, load in decision_log_sources(log_dir, read, archive_dir, decompress):
+            try:
+                decision_log = load()
+                if not isinstance(decision_log, dict) or "decision_type" not in decision_log:
+                    raise ValueError("not a decision log")
+                batch.append(decision_row(decision_log, path))
+            except (ValueError, OSError, RuntimeError, zipfile.BadZipFile):
+                skipped += 1
+                continue
+            if len(batch) >= REBUILD_BATCH:
+                self.add_many(batch, table=_REBUILD_TABLE)
+                indexed += len(batch)
+                batch = []
+        if batch:
+            self.add_many(batch, table=_REBUILD_TABLE)
+            indexed += len(batch)
+
+        columns = ", ".join(_COLUMNS)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Keep decisions logged while the files were being read
+            connection.execute(
+                f"INSERT OR IGNORE INTO {_REBUILD_TABLE} ({columns}) "
+                f"SELECT {columns} FROM decisions WHERE timestamp >= ?",
+                (started_key,)
+            )
+            connection.execute("DROP TABLE decisions")
+            connection.execute(f"ALTER TABLE {_REBUILD_TABLE} RENAME TO decisions")
+            for statement in _INDEXES:
+                connection.execute(statement)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return {
+            "indexed": indexed,
+            "skipped": skipped,
+            "index_path": str(self.path),
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+
+
+def decision_log_sources(log_dir: Path, read, archive_dir: Optional[Path] = None, decompress=None):
+    """
+    Yield (path, loader) for every decision log file, then every archived member.
+
+    The directory is scanned without listing it all into memory first. Archived
+    members are named "<archive>::<member>" and loaded with decompress.
+    """
+    if Path(log_dir).is_dir():
+        with os.scandir(log_dir) as entries:
+            for entry in entries:
+                if ".json" in entry.name and entry.is_file():
+                    path = Path(entry.path)
+                    yield str(path), lambda path=path: read(path)
+    if archive_dir is None:
+        return
+    from tools.retention import ARCHIVE_SEPARATOR
+    for archive_path in sorted(Path(archive_dir).glob("*.zip")):
+        try:
+            archive = zipfile.ZipFile(archive_path)
+        except (OSError, zipfile.BadZipFile):
+            continue
+        with archive:
+            for member in archive.namelist():
+                if member.endswith("/"):
+                    continue
+                yield (
+                    f"{archive_path}{ARCHIVE_SEPARATOR}{member}",
+                    lambda member=member: json.loads(decompress(archive.read(member)))
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit decision index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild = subparsers.add_parser("rebuild", help="Rebuild the index from decision_logs and its archives")
+    rebuild.add_argument("--storage", default=str(STORAGE_DIR), help="Storage directory")
+    args = parser.parse_args()
+
+    from tools.compression import Compressor, read_json
+
+    storage_dir = Path(args.storage)
+    compressor = Compressor("none", storage_dir / "dictionaries")
+    result = AuditIndex(storage_dir / "audit_index.db").rebuild(
+        storage_dir / "decision_logs",
+        read=lambda path: read_json(path, compressor),
+        archive_dir=storage_dir / "archive" / "decision_logs",
+        compressor=compressor
+    )
+    print(f"Indexed {result['indexed']} decision logs ({result['skipped']} skipped) "
+          f"in {result['seconds']}s -> {result['index_path']}")
+
+
+if __name__ == "__main__":
+    main()
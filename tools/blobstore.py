@@ -0,0 +1,275 @@
+"""
+Content-Addressed Blob Store
+Stores JSON artifacts (transcripts, receipts, decision logs) once per distinct
+content, with a small manifest per session.
+
+Each payload is serialized canonically (sorted keys, no whitespace) and named
+by the SHA-256 of those bytes. A retried end_call sends the same transcript
+and receipt again (receipts are stored without their generation time, see
+RefundExecutor.get_receipt). Those payloads hash to blobs that already exist,
+and the session manifest already lists them, so the retry adds no blob or
+manifest entry. Its decision is logged with deduplicate=True, so the retry
+adds no decision log either. The same receipt stored from different sessions
+is also kept only once.
+
+Layout (under storage/):
+    blobs/<first two hex digits>/<sha256>.json.zst  compressed canonical payload
+    manifests/<session_id>.json                     artifacts stored for the session, in order
+
+A blob's mtime is refreshed whenever it is stored again, so retention
+(tools/retention.py) only removes blobs that no recent session has stored.
+Once retention has archived a session, load() reads its manifests from
+archive/manifests/*.zip and its blobs from archive/<type dir>/*.zip
+(members manifests/<session_id>.json and blobs/<xx>/<sha256>.json.zst).
+
+Manifests are read, updated and rewritten under an exclusive flock, so
+workers storing artifacts for the same session never drop each other's
+entries. Locks are striped over a fixed set of hidden lock files in the
+manifest directory (.lock-00 to .lock-3f), one stripe per manifest name.
+
+Blobs are compressed with the audit codec and the artifact type's dictionary
+(see tools/compression.py). The extension follows the codec (.zst, .zz, or
+.gz for blobs written before codecs were configurable). Readers accept any of them.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+import hashlib
+import json
+import os
+import re
+import zipfile
+import zlib
+
+from tools.compression import Compressor, canonical_json, default_compressor
+from tools.paths import STORAGE_DIR
+
+# Exclusive lock between worker processes (POSIX only)
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+DEFAULT_BLOB_DIR = STORAGE_DIR / "blobs"
+DEFAULT_MANIFEST_DIR = STORAGE_DIR / "manifests"
+
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9._-]")
+
+# Blob extensions readers look for, current codecs first
+_BLOB_EXTENSIONS = (".json.zst", ".json.zz", ".json.gz", ".json")
+
+# Lock files manifests are spread over
+MANIFEST_LOCK_STRIPES = 64
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """Write a file under a temporary name and rename it into place."""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def manifest_lock(manifest_path: Path):
+    """Hold the exclusive lock for one manifest's read-modify-write (its directory must exist)."""
+    stripe = zlib.crc32(manifest_path.name.encode("utf-8")) % MANIFEST_LOCK_STRIPES
+    with open(manifest_path.parent / f".lock-{stripe:02x}", "a") as lock:
+        if FCNTL_AVAILABLE:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+class BlobStore:
+    """Content-addressed, compressed JSON blobs with per-session manifests."""
+
+    def __init__(
+        self,
+        blob_dir: Path = DEFAULT_BLOB_DIR,
+        manifest_dir: Path = DEFAULT_MANIFEST_DIR,
+        compressor: Optional[Compressor] = None,
+        archive_dir: Optional[Path] = None
+    ):
+        self.blob_dir = Path(blob_dir)
+        self.manifest_dir = Path(manifest_dir)
+        # Retention archives (storage/archive next to storage/blobs by default)
+        self.archive_dir = Path(archive_dir) if archive_dir is not None else self.blob_dir.parent / "archive"
+        self.compressor = compressor or default_compressor()
+        self._created_dirs = set()
+
+    def _ensure_dir(self, dir_path: Path) -> Path:
+        if dir_path not in self._created_dirs:
+            dir_path.mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(dir_path)
+        return dir_path
+
+    # Blobs
+
+    def blob_path(self, digest: str) -> Path:
+        """Path a new blob is written to with the current codec."""
+        return self.blob_dir / digest[:2] / f"{digest}.json{self.compressor.extension}"
+
+    def find(self, digest: str) -> Optional[Path]:
+        """Path of a stored blob, whichever codec wrote it (None if unknown)."""
+        directory = self.blob_dir / digest[:2]
+        for extension in _BLOB_EXTENSIONS:
+            path = directory / f"{digest}{extension}"
+            if path.exists():
+                return path
+        return None
+
+    def exists(self, digest: str) -> bool:
+        return self.find(digest) is not None
+
+    def put(self, data: bytes, segment: Optional[str] = None) -> Tuple[str, bool]:
+        """
+        Store bytes under their SHA-256.
+
+        Args:
+            data: Uncompressed bytes
+            segment: Artifact type whose compression dictionary to use
+
+        Returns:
+            Tuple of (hex digest, whether a new blob was written)
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        existing = self.find(digest)
+        if existing is not None:
+            try:
+                # Stored again: refresh the mtime so retention keeps the blob
+                os.utime(existing)
+                return digest, False
+            except FileNotFoundError:
+                pass  # expired by retention in between; write it again
+        path = self.blob_path(digest)
+        self._ensure_dir(path.parent)
+        _write_atomic(path, self.compressor.compress(data, segment))
+        return digest, True
+
+    def get(self, digest: str) -> bytes:
+        """Return a blob's uncompressed bytes (raises FileNotFoundError if unknown)."""
+        path = self.find(digest)
+        if path is None:
+            raise FileNotFoundError(f"Unknown blob: {digest}")
+        with open(path, "rb") as f:
+            return self.compressor.decompress(f.read())
+
+    def put_json(self, value: Any) -> Tuple[str, bool]:
+        return self.put(canonical_json(value))
+
+    def get_json(self, digest: str) -> Any:
+        return json.loads(self.get(digest))
+
+    # Session manifests
+
+    def manifest_path(self, session_id: str) -> Path:
+        return self.manifest_dir / f"{_UNSAFE_NAME.sub('_', session_id)}.json"
+
+    def manifest(self, session_id: str) -> Dict[str, Any]:
+        """Return a session's manifest (empty if nothing was stored for it)."""
+        path = self.manifest_path(session_id)
+        if not path.exists():
+            return {"session_id": session_id, "artifacts": []}
+        with open(path) as f:
+            return json.load(f)
+
+    def store(
+        self,
+        session_id: str,
+        artifact_type: str,
+        value: Any,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Store a JSON artifact for a session.
+
+        Args:
+            session_id: Session ID
+            artifact_type: Artifact type (transcript, receipt, decision_log)
+            value: JSON-serializable payload
+            metadata: Additional metadata (kept from the first time the payload is stored)
+
+        Returns:
+            The manifest entry, with blob_path and deduplicated (True if the
+            content was already stored)
+        """
+        data = canonical_json(value)
+        digest, created = self.put(data, segment=artifact_type)
+        blob_path = str(self.find(digest))
+
+        path = self.manifest_path(session_id)
+        self._ensure_dir(path.parent)
+        with manifest_lock(path):
+            manifest = self.manifest(session_id)
+            for entry in manifest["artifacts"]:
+                if entry["sha256"] == digest and entry["type"] == artifact_type:
+                    # Retry of an artifact the session already has: nothing to write
+                    return {**entry, "blob_path": blob_path, "deduplicated": True}
+
+            entry = {
+                "type": artifact_type,
+                "sha256": digest,
+                "size_bytes": len(data),
+                "stored_at": datetime.utcnow().isoformat() + "Z",
+                "metadata": metadata or {}
+            }
+            manifest["artifacts"].append(entry)
+            _write_atomic(path, json.dumps(manifest, indent=2).encode("utf-8"))
+        return {**entry, "blob_path": blob_path, "deduplicated": not created}
+
+    def load(self, session_id: str, artifact_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Return a session's artifacts (optionally of one type), each with its payload under "content".
+
+        Entries from archived manifests come first, then the live manifest's
+        (a session stored to again after it was archived has both).
+        """
+        entries = []
+        seen = set()
+        for manifest in [*self.archived_manifests(session_id), self.manifest(session_id)]:
+            for entry in manifest["artifacts"]:
+                key = (entry["sha256"], entry["type"])
+                if key in seen or (artifact_type is not None and entry["type"] != artifact_type):
+                    continue
+                seen.add(key)
+                entries.append(entry)
+        return [{**entry, "content": self._load_json(entry)} for entry in entries]
+
+    def _load_json(self, entry: Dict[str, Any]) -> Any:
+        try:
+            return self.get_json(entry["sha256"])
+        except FileNotFoundError:
+            return json.loads(self.get_archived(entry["sha256"], entry["type"]))
+
+    # Retention archives
+
+    def _archives(self, directory: str) -> List[Path]:
+        return sorted((self.archive_dir / directory).glob("*.zip"))
+
+    def archived_manifests(self, session_id: str) -> List[Dict[str, Any]]:
+        """A session's manifests in the retention archives, oldest archive first."""
+        member = f"manifests/{self.manifest_path(session_id).name}"
+        manifests = []
+        for archive_path in self._archives("manifests"):
+            with zipfile.ZipFile(archive_path) as archive:
+                try:
+                    manifests.append(json.loads(archive.read(member)))
+                except KeyError:
+                    continue
+        return manifests
+
+    def get_archived(self, digest: str, artifact_type: str) -> bytes:
+        """Uncompressed bytes of a blob retention moved into an archive (raises FileNotFoundError if none has it)."""
+        from tools.retention import ARTIFACT_DIRS
+
+        members = [f"blobs/{digest[:2]}/{digest}{extension}" for extension in _BLOB_EXTENSIONS]
+        for archive_path in reversed(self._archives(ARTIFACT_DIRS.get(artifact_type, artifact_type))):
+            with zipfile.ZipFile(archive_path) as archive:
+                names = set(archive.namelist())
+                for member in members:
+                    if member in names:
+                        return self.compressor.decompress(archive.read(member))
+        raise FileNotFoundError(f"Unknown blob: {digest}")
@@ -0,0 +1,362 @@
+"""
+Audit Artifact Compression
+Compresses transcripts, decision logs and receipts before they are written,
+and decompresses them transparently when they are read back.
+
+Codecs:
+- zstd: Zstandard (needs the optional `zstandard` package); files end in .zst
+- deflate: zlib streams from the standard library; files end in .zz
+  (the zlib container is used instead of gzip because only zlib can carry
+  a preset dictionary)
+- none: plain JSON, as before
+
+Audit payloads are small, repetitive JSON documents. Most of what they
+contain is key names, tool names, policy check names and stock agent
+phrases, and each document is too small to learn those on its own. A
+dictionary trained per segment (transcript, decision_log, receipt) gives the
+compressor that shared vocabulary up front. Both formats record which
+dictionary was used in the stream header (the zstd dictionary ID, the zlib
+DICTID), so readers find the right dictionary without any side table, even
+after new dictionaries have been trained.
+
+Readers recognize the format from the data (zstd, gzip, zlib or plain JSON),
+so files written with any codec, and older uncompressed files, stay readable.
+
+Configuration (environment):
+    RRVA_AUDIT_COMPRESSION   auto (default: zstd if installed, else deflate), zstd, deflate/gzip, none
+
+Training (run periodically, e.g. after a day of traffic):
+    python -m tools.compression train --storage storage
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from datetime import datetime
+from pathlib import Path
+import argparse
+import gzip
+import json
+import os
+import zlib
+
+from tools.paths import STORAGE_DIR
+
+# Zstandard (optional, preferred when installed)
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+DEFAULT_DICT_DIR = STORAGE_DIR / "dictionaries"
+SEGMENTS = ("transcript", "decision_log", "receipt")
+
+EXTENSIONS = {"zstd": ".zst", "deflate": ".zz", "none": ""}
+DEFAULT_LEVELS = {"zstd": 6, "deflate": 6}
+DEFAULT_DICT_SIZE = 16 * 1024
+# zlib only looks back 32KB, so a larger preset dictionary is wasted
+MAX_DEFLATE_DICT = 32 * 1024
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+def _is_zlib(data: bytes) -> bool:
+    return len(data) >= 2 and data[0] & 0x0F == 8 and (data[0] << 8 | data[1]) % 31 == 0
+
+
+def _zlib_dict_id(data: bytes) -> Optional[int]:
+    """DICTID from a zlib stream header, if the stream was compressed with a preset dictionary."""
+    if len(data) >= 6 and data[1] & 0x20:
+        return int.from_bytes(data[2:6], "big")
+    return None
+
+
+def resolve_codec(name: str) -> str:
+    """Map a configured codec name (auto, zstd, deflate, gzip, none) to the codec used."""
+    name = (name or "auto").lower()
+    if name == "auto":
+        return "zstd" if ZSTD_AVAILABLE else "deflate"
+    if name == "gzip":
+        return "deflate"
+    if name == "zstd" and not ZSTD_AVAILABLE:
+        print("Warning: zstandard package not installed. Falling back to deflate compression.")
+        return "deflate"
+    if name not in EXTENSIONS:
+        raise ValueError(f"Unknown compression codec: {name}")
+    return name
+
+
+class Compressor:
+    """
+    Compresses payloads per segment with the configured codec and dictionaries.
+
+    Dictionaries are read from dict_dir the first time they are needed. Files
+    are named <segment>-<codec>-<trained at>-<id>.dict, and the newest file
+    per segment and codec is used for writing.
+    """
+
+    def __init__(self, codec: str = "auto", dict_dir: Path = DEFAULT_DICT_DIR, level: Optional[int] = None):
+        self.codec = resolve_codec(codec)
+        self.dict_dir = Path(dict_dir)
+        self.level = level if level is not None else DEFAULT_LEVELS.get(self.codec, 0)
+        self.extension = EXTENSIONS[self.codec]
+        self._loaded = False
+        # codec -> dictionary ID -> dictionary
+        self._by_id: Dict[str, Dict[int, Any]] = {"zstd": {}, "deflate": {}}
+        # (segment, codec) -> dictionary ID used for writing
+        self._active: Dict[Tuple[str, str], int] = {}
+        self._compressors: Dict[Optional[str], Any] = {}
+        self._decompressors: Dict[int, Any] = {}
+
+    @classmethod
+    def from_env(cls, dict_dir: Path = DEFAULT_DICT_DIR) -> "Compressor":
+        return cls(os.getenv("RRVA_AUDIT_COMPRESSION", "auto"), dict_dir)
+
+    @property
+    def enabled(self) -> bool:
+        return self.codec != "none"
+
+    def reload(self) -> None:
+        """Forget loaded dictionaries (picked up again on next use)."""
+        self._loaded = False
+        self._by_id = {"zstd": {}, "deflate": {}}
+        self._active = {}
+        self._compressors = {}
+        self._decompressors = {}
+
+    def _load_dictionaries(self) -> None:
+        self._loaded = True
+        if not self.dict_dir.exists():
+            return
+        for path in sorted(self.dict_dir.glob("*.dict")):
+            try:
+                segment, codec, _, dict_id = path.stem.rsplit("-", 3)
+                dict_id = int(dict_id)
+            except ValueError:
+                continue
+            data = path.read_bytes()
+            if codec == "zstd":
+                if not ZSTD_AVAILABLE:
+                    continue
+                self._by_id["zstd"][dict_id] = zstandard.ZstdCompressionDict(data)
+            elif codec == "deflate":
+                self._by_id["deflate"][dict_id] = data
+            else:
+                continue
+            # Sorted by name, so the newest training wins
+            self._active[(segment, codec)] = dict_id
+
+    def _dictionary(self, codec: str, dict_id: int) -> Any:
+        """
+        Return a dictionary by ID for reading.
+
+        A dictionary trained after this process loaded its dictionaries (by
+        another worker, or the training CLI) is picked up by rescanning
+        dict_dir once before giving up.
+
+        Raises:
+            ValueError: if the dictionary is not in dict_dir
+        """
+        if not self._loaded:
+            self._load_dictionaries()
+        dictionary = self._by_id[codec].get(dict_id)
+        if dictionary is None:
+            self._load_dictionaries()
+            dictionary = self._by_id[codec].get(dict_id)
+        if dictionary is None:
+            label = dict_id if codec == "zstd" else f"{dict_id:08x}"
+            raise ValueError(f"Missing {codec} dictionary {label} in {self.dict_dir}")
+        return dictionary
+
+    def dictionary_id(self, segment: Optional[str]) -> Optional[int]:
+        """ID of the dictionary used to write a segment with this codec (None without one)."""
+        if not self._loaded:
+            self._load_dictionaries()
+        return self._active.get((segment, self.codec)) if segment else None
+
+    def compress(self, data: bytes, segment: Optional[str] = None) -> bytes:
+        """Compress bytes with the segment's dictionary, if one has been trained."""
+        if self.codec == "none":
+            return data
+        dict_id = self.dictionary_id(segment)
+        if self.codec == "zstd":
+            compressor = self._compressors.get(segment if dict_id is not None else None)
+            if compressor is None:
+                dictionary = self._by_id["zstd"][dict_id] if dict_id is not None else None
+                compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary, write_checksum=True)
+                self._compressors[segment if dict_id is not None else None] = compressor
+            return compressor.compress(data)
+        if dict_id is not None:
+            stream = zlib.compressobj(self.level, zdict=self._by_id["deflate"][dict_id])
+        else:
+            stream = zlib.compressobj(self.level)
+        return stream.compress(data) + stream.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        """Decompress data written by any codec (plain data is returned unchanged)."""
+        if data.startswith(_ZSTD_MAGIC):
+            if not ZSTD_AVAILABLE:
+                raise RuntimeError("Reading zstd-compressed artifacts requires the zstandard package")
+            dict_id = zstandard.get_frame_parameters(data).dict_id
+            decompressor = self._decompressors.get(dict_id)
+            if decompressor is None:
+                dictionary = self._dictionary("zstd", dict_id) if dict_id else None
+                decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+                self._decompressors[dict_id] = decompressor
+            # Frames written by ZstdCompressor.compress() record their size
+            return decompressor.decompress(data)
+        if data.startswith(_GZIP_MAGIC):
+            return gzip.decompress(data)
+        if _is_zlib(data):
+            dict_id = _zlib_dict_id(data)
+            if dict_id is None:
+                return zlib.decompress(data)
+            stream = zlib.decompressobj(zdict=self._dictionary("deflate", dict_id))
+            return stream.decompress(data) + stream.flush()
+        return data
+
+
+_default_compressor: Optional[Compressor] = None
+
+
+def default_compressor() -> Compressor:
+    """Process-wide compressor configured by RRVA_AUDIT_COMPRESSION."""
+    global _default_compressor
+    if _default_compressor is None:
+        _default_compressor = Compressor.from_env()
+    return _default_compressor
+
+
+def read_json(path: Union[str, Path], compressor: Optional[Compressor] = None) -> Any:
+    """Read a JSON artifact written with any codec (or uncompressed)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    return json.loads((compressor or default_compressor()).decompress(data))
+
+
+def canonical_json(value: Any) -> bytes:
+    """Serialize a JSON value so that equal values always give equal bytes (sorted keys, no whitespace)."""
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+# Dictionary training
+
+def collect_samples(storage_dir: Path = STORAGE_DIR, compressor: Optional[Compressor] = None) -> Dict[str, List[bytes]]:
+    """
+    Gather stored artifacts per segment, serialized the way they are compressed.
+
+    Reads the per-type artifact directories and the blob store (types come
+    from the session manifests).
+    """
+    compressor = compressor or Compressor("none")
+    samples: Dict[str, List[bytes]] = {segment: [] for segment in SEGMENTS}
+    directories = {"transcript": "transcripts", "decision_log": "decision_logs", "receipt": "receipts"}
+    for segment, directory in directories.items():
+        for path in sorted((storage_dir / directory).glob("*.json*")):
+            try:
+                samples[segment].append(canonical_json(read_json(path, compressor)))
+            except (ValueError, OSError, RuntimeError):
+                continue
+
+    blob_dir = storage_dir / "blobs"
+    for manifest_path in sorted((storage_dir / "manifests").glob("*.json")):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        for entry in manifest.get("artifacts", []):
+            if entry.get("type") not in samples:
+                continue
+            for blob_path in (blob_dir / entry["sha256"][:2]).glob(f"{entry['sha256']}.*"):
+                try:
+                    samples[entry["type"]].append(compressor.decompress(blob_path.read_bytes()))
+                except (ValueError, OSError, RuntimeError):
+                    pass
+                break
+    return samples
+
+
+def _deflate_dictionary(samples: List[bytes], size: int) -> bytes:
+    """
+    Raw preset dictionary for zlib: sample content, most recent last.
+
+    zlib finds matches fastest near the end of the dictionary, so the newest
+    samples (most like upcoming writes) go at the end.
+    """
+    size = min(size, MAX_DEFLATE_DICT)
+    parts: List[bytes] = []
+    total = 0
+    for sample in reversed(samples):
+        if total >= size:
+            break
+        part = sample[-(size - total):]
+        parts.append(part)
+        total += len(part)
+    return b"".join(reversed(parts))
+
+
+def train_dictionaries(
+    samples: Dict[str, List[bytes]],
+    dict_dir: Path = DEFAULT_DICT_DIR,
+    size: int = DEFAULT_DICT_SIZE,
+    codecs: Iterable[str] = ("zstd", "deflate")
+) -> List[Dict[str, Any]]:
+    """
+    Train one dictionary per segment and codec and save it to dict_dir.
+
+    Older dictionaries are kept: artifacts written with them stay readable.
+
+    Returns:
+        Summary of each dictionary written
+    """
+    dict_dir = Path(dict_dir)
+    dict_dir.mkdir(parents=True, exist_ok=True)
+    trained_at = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    written = []
+    for segment, segment_samples in samples.items():
+        if not segment_samples:
+            continue
+        sample_bytes = sum(len(sample) for sample in segment_samples)
+        for codec in codecs:
+            if codec == "zstd":
+                if not ZSTD_AVAILABLE:
+                    continue
+                # zstd needs noticeably more sample data than the dictionary size
+                dict_size = max(1024, min(size, sample_bytes // 4))
+                try:
+                    dictionary = zstandard.train_dictionary(dict_size, segment_samples)
+                except zstandard.ZstdError as e:
+                    print(f"Skipping zstd dictionary for {segment}: {e}")
+                    continue
+                data, dict_id = dictionary.as_bytes(), dictionary.dict_id()
+            else:
+                data = _deflate_dictionary(segment_samples, size)
+                dict_id = zlib.adler32(data)
+            path = dict_dir / f"{segment}-{codec}-{trained_at}-{dict_id}.dict"
+            path.write_bytes(data)
+            written.append({
+                "segment": segment,
+                "codec": codec,
+                "dict_id": dict_id,
+                "size_bytes": len(data),
+                "samples": len(segment_samples),
+                "path": str(path)
+            })
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit artifact compression dictionaries")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train = subparsers.add_parser("train", help="Train per-segment dictionaries from stored artifacts")
+    train.add_argument("--storage", default=str(STORAGE_DIR), help="Storage directory to sample")
+    train.add_argument("--size", type=int, default=DEFAULT_DICT_SIZE, help="Dictionary size in bytes")
+    args = parser.parse_args()
+
+    storage_dir = Path(args.storage)
+    samples = collect_samples(storage_dir, Compressor("none", storage_dir / "dictionaries"))
+    for entry in train_dictionaries(samples, storage_dir / "dictionaries", args.size):
+        print(f"{entry['segment']:<13} {entry['codec']:<8} id={entry['dict_id']:<11} "
+              f"{entry['size_bytes']:>6} bytes from {entry['samples']} samples -> {entry['path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+"""
+Columnar Audit Export
+Streams decision logs and transcripts into date-partitioned Parquet, Arrow
+IPC or CSV files for offline analysis.
+
+Datasets (one row each per):
+    decisions     decision log: core fields, inputs_* / outcome_* columns,
+                  check_<name> (passed) and check_<name>_details columns,
+                  checks_total / checks_failed, tool call count and names
+    transcripts   conversation turn: session, customer, stored_at, turn,
+                  speaker, text
+
+Layout (Hive-style partitions, readable by pyarrow.dataset, DuckDB, Spark):
+    <out>/<dataset>/date=YYYY-mm-dd/part-<run>-<n>.parquet
+    <out>/checkpoint.json
+
+Core columns have fixed types. Flattened columns are typed from their values:
+bool, float64 for numbers, string, or a JSON string for nested or mixed values.
+
+Exports are incremental. Each run exports what was stored between the
+previous run's cutoff (checkpoint.json) and now, minus a few seconds, so
+files still being written are left for the next run. Parts left by a run that
+failed before saving its checkpoint are removed when the export is retried.
+
+pyarrow is optional. Without it the export falls back to CSV.
+
+Usage:
+    python -m tools.export --storage storage --out exports
+    python -m tools.export --format csv --dataset decisions
+    python -m tools.export --full        # ignore the checkpoint and re-export everything
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import csv
+import json
+import os
+import shutil
+import time
+
+from tools.audit_index import outcome_amount
+from tools.compression import Compressor, read_json
+from tools.transcript_search import extract_turns
+from tools.ids import session_from_stem
+from tools.paths import STORAGE_DIR
+
+# pyarrow (optional, needed for Parquet and Arrow IPC)
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+DATASETS = ("decisions", "transcripts")
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv"}
+
+# Rows buffered per date partition before a part file is written
+PART_ROWS = 50000
+# Files modified in the last few seconds may still be being written
+SETTLE_SECONDS = 5.0
+
+# Leading columns of each dataset and their types; flattened columns follow in name order
+CORE_COLUMNS = {
+    "decisions": {
+        "log_id": "string", "session_id": "string", "customer_id": "string", "decision_type": "string",
+        "timestamp": "timestamp", "amount": "float", "checks_total": "int", "checks_failed": "int",
+        "failed_checks": "string", "tool_call_count": "int", "tool_names": "string",
+    },
+    "transcripts": {
+        "session_id": "string", "customer_id": "string", "stored_at": "timestamp", "sha256": "string",
+        "turn": "int", "speaker": "string", "text": "string",
+    },
+}
+
+
+def _parse_time(value: Any) -> Optional[datetime]:
+    """UTC datetime from an ISO timestamp (None if missing or invalid)."""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def _flatten(prefix: str, values: Any, row: Dict[str, Any]) -> None:
+    if isinstance(values, dict):
+        for key, value in values.items():
+            row[f"{prefix}_{key}"] = value
+
+
+def decision_record(decision_log: Dict[str, Any]) -> Dict[str, Any]:
+    """Flat row for a decision log."""
+    outcome = decision_log.get("outcome")
+    checks = [check for check in decision_log.get("policy_checks") or [] if isinstance(check, dict) and check.get("check")]
+    failed = [str(check["check"]) for check in checks if not check.get("passed", True)]
+    tool_calls = [call for call in decision_log.get("tool_calls") or [] if isinstance(call, dict)]
+    row: Dict[str, Any] = {
+        "log_id": decision_log.get("log_id"),
+        "session_id": decision_log.get("session_id"),
+        "customer_id": decision_log.get("customer_id"),
+        "decision_type": decision_log.get("decision_type"),
+        "timestamp": _parse_time(decision_log.get("timestamp")),
+        "amount": outcome_amount(outcome) if isinstance(outcome, dict) else None,
+        "checks_total": len(checks),
+        "checks_failed": len(failed),
+        "failed_checks": ",".join(failed),
+        "tool_call_count": len(tool_calls),
+        "tool_names": ",".join(str(call.get("tool_name", "")) for call in tool_calls),
+    }
+    _flatten("inputs", decision_log.get("inputs"), row)
+    _flatten("outcome", outcome, row)
+    for check in checks:
+        name = str(check["check"])
+        row[f"check_{name}"] = bool(check.get("passed", True))
+        if check.get("details") is not None:
+            row[f"check_{name}_details"] = check["details"]
+    return row
+
+
+def transcript_records(
+    session_id: str,
+    transcript: Any,
+    metadata: Dict[str, Any],
+    stored_at: Optional[datetime],
+    sha256: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """One flat row per conversation turn."""
+    return [
+        {
+            "session_id": session_id,
+            "customer_id": metadata.get("customer_id"),
+            "stored_at": stored_at,
+            "sha256": sha256,
+            "turn": number,
+            "speaker": speaker,
+            "text": text,
+        }
+        for number, (speaker, text) in enumerate(extract_turns(transcript))
+    ]
+
+
+def _column_kind(values: List[Any]) -> Optional[str]:
+    """
+    Type of a flattened column: bool, float, string or json (None if every value is missing).
+
+    Numbers are always float, so a column has the same type in every part file.
+    """
+    kinds = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            kinds.add("bool")
+        elif isinstance(value, (int, float)):
+            kinds.add("float")
+        elif isinstance(value, str):
+            kinds.add("string")
+        elif isinstance(value, datetime):
+            kinds.add("timestamp")
+        else:
+            kinds.add("json")
+    if not kinds:
+        return None
+    return kinds.pop() if len(kinds) == 1 else "json"
+
+
+def _columns(dataset: str, rows: List[Dict[str, Any]]) -> Dict[str, Tuple[str, List[Any]]]:
+    """Rows as typed columns, core columns first (flattened columns with no values are left out)."""
+    core = CORE_COLUMNS[dataset]
+    extra = set()
+    for row in rows:
+        extra.update(row)
+    columns = {}
+    for name in list(core) + sorted(extra - set(core)):
+        values = [row.get(name) for row in rows]
+        kind = core.get(name) or _column_kind(values)
+        if kind is None:
+            continue
+        if kind == "json":
+            values = [None if value is None else json.dumps(value, default=str) for value in values]
+        elif kind == "float":
+            values = [None if value is None else float(value) for value in values]
+        columns[name] = (kind, values)
+    return columns
+
+
+_ARROW_TYPES = {
+    "bool": lambda: pyarrow.bool_(),
+    "int": lambda: pyarrow.int64(),
+    "float": lambda: pyarrow.float64(),
+    "string": lambda: pyarrow.string(),
+    "json": lambda: pyarrow.string(),
+    "timestamp": lambda: pyarrow.timestamp("us", tz="UTC"),
+}
+
+
+def write_part(path: Path, dataset: str, rows: List[Dict[str, Any]], fmt: str) -> None:
+    """Write rows as one Parquet, Arrow IPC or CSV file (under a temporary name, then renamed)."""
+    columns = _columns(dataset, rows)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    if fmt == "csv":
+        with open(tmp_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for values in zip(*(values for _, values in columns.values())):
+                writer.writerow(
+                    "" if value is None else value.isoformat() if isinstance(value, datetime) else value
+                    for value in values
+                )
+    else:
+        table = pyarrow.table({
+            name: pyarrow.array(values, type=_ARROW_TYPES[kind]())
+            for name, (kind, values) in columns.items()
+        })
+        if fmt == "parquet":
+            pyarrow.parquet.write_table(table, tmp_path, compression="zstd")
+        else:
+            with pyarrow.ipc.new_file(str(tmp_path), table.schema) as writer:
+                writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+class _PartitionWriter:
+    """Buffers rows per date partition and writes a part file every PART_ROWS rows."""
+
+    def __init__(self, out_dir: Path, dataset: str, fmt: str, run_tag: str, part_rows: int = PART_ROWS):
+        self.dataset_dir = out_dir / dataset
+        self.dataset = dataset
+        self.fmt = fmt
+        self.run_tag = run_tag
+        self.part_rows = part_rows
+        self.buffers: Dict[str, List[Dict[str, Any]]] = {}
+        self.parts: Dict[str, int] = {}
+        self.rows = 0
+        self.files: List[str] = []
+
+    def add(self, date: str, row: Dict[str, Any]) -> None:
+        buffer = self.buffers.setdefault(date, [])
+        buffer.append(row)
+        if len(buffer) >= self.part_rows:
+            self._flush(date)
+
+    def _flush(self, date: str) -> None:
+        rows = self.buffers.pop(date, [])
+        if not rows:
+            return
+        number = self.parts.get(date, 0)
+        self.parts[date] = number + 1
+        path = self.dataset_dir / f"date={date}" / f"part-{self.run_tag}-{number:04d}{FORMATS[self.fmt]}"
+        write_part(path, self.dataset, rows, self.fmt)
+        self.rows += len(rows)
+        self.files.append(str(path))
+
+    def close(self) -> None:
+        for date in list(self.buffers):
+            self._flush(date)
+
+
+def _remove_parts(dataset_dir: Path, run_tag: str) -> int:
+    """Delete part files of an earlier attempt at this run (one that failed before saving its checkpoint)."""
+    removed = 0
+    for path in dataset_dir.glob(f"date=*/part-{run_tag}-*"):
+        path.unlink()
+        removed += 1
+    return removed
+
+
+def _modified_between(directory: Path, since: float, until: float) -> Iterator[Tuple[Path, float]]:
+    """Files in a directory modified in (since, until], without listing it into memory first."""
+    if not directory.is_dir():
+        return
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or ".json" not in entry.name or not entry.is_file():
+                continue
+            mtime = entry.stat().st_mtime
+            if since < mtime <= until:
+                yield Path(entry.path), mtime
+
+
+def iter_decisions(storage_dir: Path, compressor: Compressor, since: float, until: float) -> Iterator[Dict[str, Any]]:
+    """Flat decision rows for logs written in (since, until] (unreadable files are skipped)."""
+    for path, _ in _modified_between(storage_dir / "decision_logs", since, until):
+        try:
+            decision_log = read_json(path, compressor)
+        except (ValueError, OSError, RuntimeError):
+            continue
+        if isinstance(decision_log, dict) and "decision_type" in decision_log:
+            yield decision_record(decision_log)
+
+
+def iter_transcripts(storage_dir: Path, compressor: Compressor, since: float, until: float) -> Iterator[Dict[str, Any]]:
+    """Turn rows for transcripts stored in (since, until], from transcript files and blob manifests."""
+    for path, mtime in _modified_between(storage_dir / "transcripts", since, until):
+        try:
+            transcript = read_json(path, compressor)
+        except (ValueError, OSError, RuntimeError):
+            continue
+        if not isinstance(transcript, dict):
+            continue
+        stored_at = _parse_time(transcript.get("stored_at")) or datetime.fromtimestamp(mtime, timezone.utc)
+        yield from transcript_records(
+            str(transcript.get("session_id") or session_from_stem(path.name.split(".json", 1)[0])),
+            transcript, transcript.get("metadata") or {}, stored_at
+        )
+
+    # Blob store: a manifest changes whenever an artifact is added to its session
+    for manifest_path, _ in _modified_between(storage_dir / "manifests", since, float("inf")):
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (ValueError, OSError):
+            continue
+        for entry in manifest.get("artifacts", []):
+            stored_at = _parse_time(entry.get("stored_at"))
+            if entry.get("type") != "transcript" or stored_at is None:
+                continue
+            if not since < stored_at.timestamp() <= until:
+                continue
+            digest = entry["sha256"]
+            blob_path = next((storage_dir / "blobs" / digest[:2]).glob(f"{digest}.json*"), None)
+            if blob_path is None:
+                continue
+            try:
+                transcript = read_json(blob_path, compressor)
+            except (ValueError, OSError, RuntimeError):
+                continue
+            yield from transcript_records(manifest["session_id"], transcript, entry.get("metadata") or {}, stored_at, digest)
+
+
+_ROW_SOURCES = {
+    "decisions": (iter_decisions, "timestamp"),
+    "transcripts": (iter_transcripts, "stored_at"),
+}
+
+
+def load_checkpoint(out_dir: Path) -> Dict[str, Any]:
+    path = out_dir / "checkpoint.json"
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_checkpoint(out_dir: Path, checkpoint: Dict[str, Any]) -> None:
+    path = out_dir / "checkpoint.json"
+    tmp_path = path.with_name(".checkpoint.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def export_audit(
+    storage_dir: Path = STORAGE_DIR,
+    out_dir: Path = Path("exports"),
+    fmt: Optional[str] = None,
+    datasets: Tuple[str, ...] = DATASETS,
+    full: bool = False,
+    part_rows: int = PART_ROWS
+) -> Dict[str, Any]:
+    """
+    Export audit data stored since the last checkpoint.
+
+    Args:
+        storage_dir: Audit storage directory
+        out_dir: Export directory (partitions and checkpoint.json)
+        fmt: parquet, arrow or csv (default: parquet if pyarrow is installed, else csv)
+        datasets: Datasets to export
+        full: Delete earlier exports of these datasets and export everything
+        part_rows: Rows per part file
+
+    Returns:
+        Dict with rows and files written per dataset, and the new cutoff
+
+    Raises:
+        ValueError: for an unknown format or dataset, or a pyarrow format without pyarrow
+    """
+    fmt = fmt or ("parquet" if PYARROW_AVAILABLE else "csv")
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+    if fmt != "csv" and not PYARROW_AVAILABLE:
+        raise ValueError(f"{fmt} export needs pyarrow (pip install pyarrow); use --format csv")
+    unknown = set(datasets) - set(DATASETS)
+    if unknown:
+        raise ValueError(f"Unknown dataset: {', '.join(sorted(unknown))}")
+
+    storage_dir, out_dir = Path(storage_dir), Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    compressor = Compressor("none", storage_dir / "dictionaries")
+    checkpoint = load_checkpoint(out_dir)
+    until = time.time() - SETTLE_SECONDS
+    results: Dict[str, Any] = {}
+
+    for dataset in datasets:
+        started = time.perf_counter()
+        previous = None if full else checkpoint.get(dataset)
+        since = _parse_time(previous["cutoff"]).timestamp() if previous else 0.0
+        run_tag = datetime.fromtimestamp(since, timezone.utc).strftime("%Y%m%dT%H%M%S") if previous else "initial"
+        if full:
+            shutil.rmtree(out_dir / dataset, ignore_errors=True)
+        _remove_parts(out_dir / dataset, run_tag)
+
+        iter_rows, time_column = _ROW_SOURCES[dataset]
+        writer = _PartitionWriter(out_dir, dataset, fmt, run_tag, part_rows)
+        for row in iter_rows(storage_dir, compressor, since, until):
+            moment = row.get(time_column)
+            writer.add(moment.strftime("%Y-%m-%d") if moment else "unknown", row)
+        writer.close()
+
+        cutoff = datetime.fromtimestamp(until, timezone.utc).isoformat().replace("+00:00", "Z")
+        checkpoint[dataset] = {
+            "cutoff": cutoff,
+            "format": fmt,
+            "rows": writer.rows,
+            "exported_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+        }
+        _save_checkpoint(out_dir, checkpoint)
+        results[dataset] = {
+            "rows": writer.rows,
+            "files": writer.files,
+            "cutoff": cutoff,
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export audit data to columnar files")
+    parser.add_argument("--storage", default=str(STORAGE_DIR), help="Storage directory")
+    parser.add_argument("--out", default="exports", help="Export directory")
+    parser.add_argument("--format", choices=list(FORMATS), default=None,
+                        help="Default: parquet if pyarrow is installed, else csv")
+    parser.add_argument("--dataset", choices=list(DATASETS), action="append", default=None,
+                        help="Dataset to export (repeatable; default: all)")
+    parser.add_argument("--full", action="store_true", help="Ignore the checkpoint and re-export everything")
+    parser.add_argument("--part-rows", type=int, default=PART_ROWS, help="Rows per part file")
+    args = parser.parse_args()
+
+    if args.format is None and not PYARROW_AVAILABLE:
+        print("Warning: pyarrow not installed. Exporting CSV.")
+    results = export_audit(
+        Path(args.storage), Path(args.out), args.format,
+        tuple(args.dataset or DATASETS), args.full, args.part_rows
+    )
+    for dataset, result in results.items():
+        print(f"{dataset}: {result['rows']} rows in {len(result['files'])} files "
+              f"({result['seconds']}s, cutoff {result['cutoff']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,24 +4,78 @@ Handles customer authentication via order ID, email/phone, OTP, and payment veri
 """
 
 import asyncio
+import importlib.util
 import random
 import string
 import os
+import uuid
+from collections import deque
 from datetime import datetime, timedelta
-from typing import Dict, Optional, Any
+from typing import Dict, MutableMapping, Optional, Any
 import json
 
-# Resend API for sending OTP emails
-try:
-    import resend
-    RESEND_AVAILABLE = True
-except ImportError:
-    RESEND_AVAILABLE = False
+# Resend API for sending OTP emails (imported on first send; it pulls in requests/httpx)
+RESEND_AVAILABLE = importlib.util.find_spec("resend") is not None
+if not RESEND_AVAILABLE:
     print("Warning: resend package not installed. OTP emails will not be sent.")
 
+
+def _resend(api_key: str):
+    """Import the Resend client on first use and set its API key."""
+    import resend
+    resend.api_key = api_key
+    return resend
+
+from tools.tracing import span
+from tools.state import StateMap, state_map
+
+# Stored OTPs are dropped by the backend after this long (expiry itself is checked on verify)
+OTP_STATE_TTL_SECONDS = 3600
+# Verification attempts allowed per OTP
+OTP_MAX_ATTEMPTS = 3
+
+# Pending OTPs live in the shared state backend so any worker can verify them
+_otp_storage: MutableMapping[str, Dict[str, Any]] = state_map("otp", ttl=OTP_STATE_TTL_SECONDS)
+# Verification attempts per pending OTP, counted atomically across workers
+_otp_attempts: StateMap = state_map("otp_attempts", ttl=OTP_STATE_TTL_SECONDS)
 # In-memory storage for demo (replace with actual database in production)
-_otp_storage: Dict[str, Dict[str, Any]] = {}
 _customer_db: Dict[str, Dict[str, Any]] = {}
+# Order ID -> owning customer ID, kept in sync by register_customer()
+_order_owner: Dict[str, str] = {}
+
+
+class FakeEmailSender:
+    """
+    Local stand-in for Resend, used for load tests and local development.
+    Keeps sent emails in an in-memory outbox instead of delivering them.
+    Enable with OTP_EMAIL_SENDER=fake.
+    """
+    
+    def __init__(self, max_messages: int = 1000):
+        self.outbox: deque = deque(maxlen=max_messages)
+    
+    def send(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        email_id = f"fake-{uuid.uuid4().hex[:12]}"
+        self.outbox.append({"id": email_id, **params})
+        return {"id": email_id}
+
+
+def register_customer(customer: Dict[str, Any]) -> None:
+    """Add (or replace) a customer and index the orders they own."""
+    _customer_db[customer["customer_id"]] = customer
+    for order_id in customer.get("orders", []):
+        _order_owner[order_id] = customer["customer_id"]
+
+
+def _find_order_owner(order_id: str) -> Optional[str]:
+    """Return the customer owning an order (accepts ORD-001 and ORD001 formats)."""
+    return _order_owner.get(order_id.replace("-", "")) or _order_owner.get(order_id)
+
+
+def _discard_otp(customer_id: str) -> None:
+    """Remove a customer's pending OTP and its attempt count (another worker may have removed them already)."""
+    _otp_storage.pop(customer_id, None)
+    _otp_attempts.pop(customer_id, None)
 
 
 class IdentityVerifier:
@@ -31,20 +85,24 @@ class IdentityVerifier:
         # Load sample customer data
         self._load_sample_customers()
         
+        # Local fake sender (load tests): OTPs are recorded, not emailed
+        self.email_sender = FakeEmailSender() if os.getenv("OTP_EMAIL_SENDER") == "fake" else None
+        
         # Initialize Resend API key if available
         self.resend_configured = False
-        if RESEND_AVAILABLE:
+        self.resend_api_key = None
+        if self.email_sender is None and RESEND_AVAILABLE:
             resend_api_key = os.getenv("RESEND_API_KEY")
             if resend_api_key:
-                resend.api_key = resend_api_key
+                self.resend_api_key = resend_api_key
                 self.resend_configured = True
             else:
                 print("Warning: RESEND_API_KEY environment variable not set. OTP emails will not be sent.")
     
     def _load_sample_customers(self):
         """Load sample customer data for PoC."""
-        global _customer_db
-        _customer_db = {
+        # Update in place so customers registered from a generated dataset are kept
+        sample_customers = {
             "CUST001": {
                 "customer_id": "CUST001",
                 "email": "sanjyot.sathe@gmail.com",
@@ -158,6 +216,8 @@ class IdentityVerifier:
                 "last_four": "7890"
             }
         }
+        for customer in sample_customers.values():
+            register_customer(customer)
     
     async def verify_by_order_and_name(
         self,
@@ -179,19 +239,7 @@ class IdentityVerifier:
         normalized_order_id = order_id.replace("-", "")
         
         # Find customer by order ID (check both original and normalized)
-        customer_id = None
-        matched_order_id = None
-        for cust_id, cust_data in _customer_db.items():
-            orders = cust_data.get("orders", [])
-            # Check if order_id matches (with or without hyphens)
-            if normalized_order_id in orders:
-                customer_id = cust_id
-                matched_order_id = normalized_order_id
-                break
-            elif order_id in orders:
-                customer_id = cust_id
-                matched_order_id = order_id
-                break
+        customer_id = _find_order_owner(order_id)
         
         if not customer_id:
             return {
@@ -261,12 +309,7 @@ class IdentityVerifier:
             customer = _customer_db[customer_id]
         else:
             # Find customer by order ID
-            customer_id = None
-            for cust_id, cust_data in _customer_db.items():
-                orders = cust_data.get("orders", [])
-                if normalized_order_id in orders or order_id in orders:
-                    customer_id = cust_id
-                    break
+            customer_id = _find_order_owner(order_id)
             
             if not customer_id:
                 return {
@@ -334,43 +377,58 @@ class IdentityVerifier:
         otp_code = ''.join(random.choices(string.digits, k=6))
         expires_at = datetime.now() + timedelta(minutes=10)
         
-        # Store OTP
+        # Store OTP (a new OTP gets a fresh attempt count)
         _otp_storage[customer_id] = {
             "code": otp_code,
             "expires_at": expires_at.isoformat(),
-            "method": method,
-            "attempts": 0
+            "method": method
         }
+        _otp_attempts.pop(customer_id, None)
         
         contact = customer.get("email" if method == "email" else "phone", "")
         
         # Send OTP via Resend API if available
         if method == "email":
-            if self.resend_configured:
+            if self.email_sender is not None:
+                with span("email.send", sender="fake"):
+                    email_response = self.email_sender.send({
+                        "to": [contact],
+                        "subject": "Your Verification Code",
+                        "otp_code": otp_code
+                    })
+                return {
+                    "success": True,
+                    "message": f"OTP sent to email: {contact} (fake sender)",
+                    "expires_in_minutes": 10,
+                    "email_id": email_response["id"],
+                    "_debug_otp": otp_code  # Fake sender only, so load tests can complete verification
+                }
+            elif self.resend_configured:
                 try:
                     # Get sender email from environment or use default
                     from_email = os.getenv("RESEND_FROM_EMAIL", "onboarding@resend.dev")
                     
                     # Send email via Resend 2.x API
-                    email_response = resend.Emails.send({
-                        "from": from_email,
-                        "to": [contact],
-                        "subject": "Your Verification Code",
-                        "html": f"""
-                        <html>
-                        <body style="font-family: Arial, sans-serif; padding: 20px;">
-                            <h2>Verification Code</h2>
-                            <p>Hello {customer.get('name', 'Customer')},</p>
-                            <p>Your verification code is:</p>
-                            <h1 style="font-size: 32px; color: #0066cc; letter-spacing: 5px; margin: 20px 0;">{otp_code}</h1>
-                            <p>This code will expire in 10 minutes.</p>
-                            <p>If you didn't request this code, please ignore this email.</p>
-                            <hr style="margin-top: 30px; border: none; border-top: 1px solid #eee;">
-                            <p style="color: #666; font-size: 12px;">This is an automated message. Please do not reply.</p>
-                        </body>
-                        </html>
-                        """
-                    })
+                    with span("email.send", sender="resend"):
+                        email_response = _resend(self.resend_api_key).Emails.send({
+                            "from": from_email,
+                            "to": [contact],
+                            "subject": "Your Verification Code",
+                            "html": f"""
+                            <html>
+                            <body style="font-family: Arial, sans-serif; padding: 20px;">
+                                <h2>Verification Code</h2>
+                                <p>Hello {customer.get('name', 'Customer')},</p>
+                                <p>Your verification code is:</p>
+                                <h1 style="font-size: 32px; color: #0066cc; letter-spacing: 5px; margin: 20px 0;">{otp_code}</h1>
+                                <p>This code will expire in 10 minutes.</p>
+                                <p>If you didn't request this code, please ignore this email.</p>
+                                <hr style="margin-top: 30px; border: none; border-top: 1px solid #eee;">
+                                <p style="color: #666; font-size: 12px;">This is an automated message. Please do not reply.</p>
+                            </body>
+                            </html>
+                            """
+                        })
                     
                     # Extract email ID from response (Resend 2.x returns object with id attribute)
                     email_id = None
@@ -424,26 +482,28 @@ class IdentityVerifier:
         Returns:
             Dict with verification status
         """
-        if customer_id not in _otp_storage:
+        otp_data = _otp_storage.get(customer_id)
+        if otp_data is None:
             return {
                 "verified": False,
                 "error": "No OTP found. Please request a new OTP."
             }
         
-        otp_data = _otp_storage[customer_id]
         expires_at = datetime.fromisoformat(otp_data["expires_at"])
         
         # Check expiration
         if datetime.now() > expires_at:
-            del _otp_storage[customer_id]
+            _discard_otp(customer_id)
             return {
                 "verified": False,
                 "error": "OTP expired. Please request a new OTP."
             }
         
-        # Check attempts
-        if otp_data["attempts"] >= 3:
-            del _otp_storage[customer_id]
+        # Count the attempt before checking the code, so concurrent guesses on
+        # other workers cannot get past the limit
+        attempts = _otp_attempts.increment(customer_id)
+        if attempts > OTP_MAX_ATTEMPTS:
+            _discard_otp(customer_id)
             return {
                 "verified": False,
                 "error": "Too many failed attempts. Please request a new OTP."
@@ -451,15 +511,14 @@ class IdentityVerifier:
         
         # Verify code
         if otp_code != otp_data["code"]:
-            otp_data["attempts"] += 1
             return {
                 "verified": False,
                 "error": "Invalid OTP code",
-                "attempts_remaining": 3 - otp_data["attempts"]
+                "attempts_remaining": OTP_MAX_ATTEMPTS - attempts
             }
         
         # Success - remove OTP
-        del _otp_storage[customer_id]
+        _discard_otp(customer_id)
         
         return {
             "verified": True,
@@ -0,0 +1,94 @@
+"""
+Time-Ordered IDs
+ULIDs for decision logs, artifact files and refunds.
+
+A ULID is 128 bits: a 48-bit millisecond timestamp followed by 80 random
+bits. It is written as 26 Crockford base32 characters, so IDs sort by
+creation time as plain strings (and as SQLite TEXT keys).
+
+IDs from one process are strictly increasing. Within a millisecond, or if
+the clock steps back, the random part of the last ID is incremented instead
+of drawn again. Processes need no coordination: each draws its own 80 random
+bits per millisecond, and a forked worker starts a fresh sequence, so IDs from
+different workers do not collide in practice.
+
+    LOG01JAB3K6Q8W9M2V4X7Z5N1R0T6   decision log (log_decision)
+    REF01JAB3K6Q8W9M2V4X7Z5N1R0T7   refund
+    <session>_01JAB3K6Q8...         artifact file stem
+"""
+
+from datetime import datetime, timezone
+import os
+import re
+import threading
+import time
+
+CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+ULID_LENGTH = 26
+RANDOM_BITS = 80
+
+_DECODE = {char: value for value, char in enumerate(CROCKFORD)}
+_ULID = re.compile(f"^[{CROCKFORD}]{{{ULID_LENGTH}}}$")
+
+
+class IdGenerator:
+    """Monotonic ULID source (thread-safe; restarts its sequence after a fork)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._last_ms = 0
+        self._last_random = 0
+
+    def ulid(self) -> str:
+        with self._lock:
+            now_ms = time.time_ns() // 1_000_000
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._last_ms = 0
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._last_random = int.from_bytes(os.urandom(RANDOM_BITS // 8), "big")
+            else:
+                self._last_random += 1
+                if self._last_random >> RANDOM_BITS:
+                    # Random part exhausted within one millisecond: borrow the next one
+                    self._last_ms += 1
+                    self._last_random = int.from_bytes(os.urandom(RANDOM_BITS // 8), "big")
+            value = (self._last_ms << RANDOM_BITS) | self._last_random
+        chars = []
+        for _ in range(ULID_LENGTH):
+            chars.append(CROCKFORD[value & 31])
+            value >>= 5
+        return "".join(reversed(chars))
+
+
+_generator = IdGenerator()
+
+
+def new_id(prefix: str = "") -> str:
+    """A new ULID, optionally prefixed (e.g. new_id("REF"))."""
+    return prefix + _generator.ulid()
+
+
+def is_ulid(value: str) -> bool:
+    return bool(_ULID.match(value))
+
+
+def id_time(value: str) -> datetime:
+    """Creation time encoded in a ULID (the last 26 characters of a prefixed ID)."""
+    ulid = value[-ULID_LENGTH:]
+    if not is_ulid(ulid):
+        raise ValueError(f"Not a ULID: {value}")
+    ms = 0
+    for char in ulid[:10]:
+        ms = (ms << 5) | _DECODE[char]
+    return datetime.fromtimestamp(ms / 1000, timezone.utc)
+
+
+def session_from_stem(stem: str) -> str:
+    """Session ID of an artifact file stem: <session>_<ULID>, or <session>_<YYYYmmdd>_<HHMMSS> before IDs."""
+    session_id, _, suffix = stem.rpartition("_")
+    if session_id and is_ulid(suffix):
+        return session_id
+    return stem.rsplit("_", 2)[0]
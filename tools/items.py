@@ -0,0 +1,190 @@
+"""
+Compact Line Item Storage
+Columnar, array-backed representation of order line items.
+
+All line items live in one set of shared columns: prices and quantities in
+typed arrays, condition and fulfillment status as small integer codes into
+interned tables. Each order keeps a LineItems view (a row range into the
+columns) instead of a list of dicts. The policy and refund hot loops read the
+columns directly; the dict form is only built at the JSON boundary via
+to_dicts().
+
+Orders are converted once, when they are registered (as_line_items). The
+request path uses line_items_view(), which never appends to the shared
+columns: an order that still holds dicts gets a throwaway view instead.
+"""
+
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+import sys
+
+# Interned code tables (index = code)
+_condition_names: List[str] = ["unknown", "unopened", "defective", "wrong_item", "used"]
+_condition_codes: Dict[str, int] = {name: code for code, name in enumerate(_condition_names)}
+_status_names: List[str] = ["unknown", "pending", "shipped", "delivered", "returned"]
+_status_codes: Dict[str, int] = {name: code for code, name in enumerate(_status_names)}
+
+# Keys of the dict form, in the order they are emitted
+_ITEM_FIELDS = ("item_id", "product_name", "quantity", "price", "condition", "fulfillment_status")
+
+
+def condition_code(condition: str) -> int:
+    """Return the code for a condition name, interning new names on first use."""
+    code = _condition_codes.get(condition)
+    if code is None:
+        code = len(_condition_names)
+        _condition_names.append(condition)
+        _condition_codes[condition] = code
+    return code
+
+
+def condition_name(code: int) -> str:
+    """Return the condition name for a code."""
+    return _condition_names[code]
+
+
+def _status_code(status: str) -> int:
+    code = _status_codes.get(status)
+    if code is None:
+        code = len(_status_names)
+        _status_names.append(status)
+        _status_codes[status] = code
+    return code
+
+
+class ItemColumns:
+    """Append-only column store holding every line item."""
+
+    __slots__ = (
+        "item_ids",
+        "product_names",
+        "prices",
+        "quantities",
+        "conditions",
+        "statuses",
+        "extras",
+    )
+
+    def __init__(self):
+        self.item_ids: List[str] = []
+        self.product_names: List[str] = []
+        self.prices = array("d")
+        self.quantities = array("I")
+        self.conditions = array("B")
+        self.statuses = array("B")
+        # Sparse per-row fields outside the known columns
+        self.extras: Dict[int, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self.item_ids)
+
+    def append(self, item: Dict[str, Any]) -> int:
+        """Append one item dict and return its row number."""
+        row = len(self.item_ids)
+        self.item_ids.append(item["item_id"])
+        self.product_names.append(sys.intern(item.get("product_name", "")))
+        self.prices.append(item["price"])
+        self.quantities.append(item.get("quantity", 1))
+        self.conditions.append(condition_code(item.get("condition", "unknown")))
+        self.statuses.append(_status_code(item.get("fulfillment_status", "unknown")))
+        extra = {key: value for key, value in item.items() if key not in _ITEM_FIELDS}
+        if extra:
+            self.extras[row] = extra
+        return row
+
+
+_columns = ItemColumns()
+
+
+class LineItems:
+    """
+    Line items of one order: a [start, stop) row range into the shared columns.
+
+    Positions returned by select() are column rows, so callers index the
+    column attributes (prices, quantities, conditions, ...) with them directly.
+    """
+
+    __slots__ = ("start", "stop", "columns")
+
+    def __init__(self, start: int, stop: int, columns: Optional[ItemColumns] = None):
+        self.start = start
+        self.stop = stop
+        self.columns = columns if columns is not None else _columns
+
+    @classmethod
+    def from_dicts(cls, items: Iterable[Dict[str, Any]]) -> "LineItems":
+        """Append item dicts to the shared columns and return their view."""
+        start = len(_columns)
+        for item in items:
+            _columns.append(item)
+        return cls(start, len(_columns))
+
+    # Columns, indexed by the rows from select()
+    item_ids = property(lambda self: self.columns.item_ids)
+    product_names = property(lambda self: self.columns.product_names)
+    prices = property(lambda self: self.columns.prices)
+    quantities = property(lambda self: self.columns.quantities)
+    conditions = property(lambda self: self.columns.conditions)
+    statuses = property(lambda self: self.columns.statuses)
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def select(self, item_ids: Optional[Sequence[str]] = None) -> Sequence[int]:
+        """
+        Return rows of the requested items (all items if item_ids is empty).
+
+        Accepts both ITEM-001 and ITEM001 formats.
+        """
+        rows = range(self.start, self.stop)
+        if not item_ids:
+            return rows
+        wanted = set(item_ids)
+        wanted.update(item_id.replace("-", "") for item_id in item_ids)
+        column = self.columns.item_ids
+        return [row for row in rows if column[row] in wanted]
+
+    def subtotal(self, rows: Optional[Sequence[int]] = None) -> float:
+        """Sum of price * quantity over the given rows (all items by default)."""
+        prices = self.columns.prices
+        quantities = self.columns.quantities
+        if rows is None:
+            rows = range(self.start, self.stop)
+        return sum(prices[row] * quantities[row] for row in rows)
+
+    def to_dict(self, row: int) -> Dict[str, Any]:
+        """Build the dict form of one item."""
+        columns = self.columns
+        item = {
+            "item_id": columns.item_ids[row],
+            "product_name": columns.product_names[row],
+            "quantity": columns.quantities[row],
+            "price": columns.prices[row],
+            "condition": _condition_names[columns.conditions[row]],
+            "fulfillment_status": _status_names[columns.statuses[row]]
+        }
+        extra = columns.extras.get(row)
+        if extra:
+            item.update(extra)
+        return item
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Build the dict form of every item (for JSON responses)."""
+        return [self.to_dict(row) for row in range(self.start, self.stop)]
+
+
+def as_line_items(items: Union[LineItems, Iterable[Dict[str, Any]]]) -> LineItems:
+    """Return items in compact form, appending a list of dicts to the columns if needed (order registration only)."""
+    if isinstance(items, LineItems):
+        return items
+    return LineItems.from_dicts(items)
+
+
+def line_items_view(items: Union[LineItems, Iterable[Dict[str, Any]]]) -> LineItems:
+    """Return items in compact form without growing the shared columns (request path)."""
+    if isinstance(items, LineItems):
+        return items
+    columns = ItemColumns()
+    for item in items:
+        columns.append(item)
+    return LineItems(0, len(columns), columns)
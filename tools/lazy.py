@@ -0,0 +1,48 @@
+"""
+Lazy Service Loading
+Defers importing a service module and constructing the service until the
+first tool call that uses it. Listing tools (the first thing an MCP client
+does) therefore needs none of the service modules or their data.
+"""
+
+from typing import Any
+import importlib
+
+
+class LazyService:
+    """
+    Stand-in for a service instance, created on first attribute access.
+
+    Attribute reads and writes are forwarded to the real instance, so
+    `await identity_verifier.send_otp(...)` works unchanged.
+    """
+
+    __slots__ = ("_module", "_class_name", "_instance")
+
+    def __init__(self, module: str, class_name: str):
+        object.__setattr__(self, "_module", module)
+        object.__setattr__(self, "_class_name", class_name)
+        object.__setattr__(self, "_instance", None)
+
+    def load(self) -> Any:
+        """Import the module and construct the service (once)."""
+        instance = self._instance
+        if instance is None:
+            service_class = getattr(importlib.import_module(self._module), self._class_name)
+            instance = service_class()
+            object.__setattr__(self, "_instance", instance)
+        return instance
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.load(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self.load(), name, value)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._instance is not None else "not loaded"
+        return f"<LazyService {self._module}.{self._class_name} ({state})>"
@@ -0,0 +1,218 @@
+"""
+Server Lifecycle
+Readiness, draining and flushing for graceful shutdown and rolling deploys.
+
+A server moves through four states: starting -> ready -> draining -> stopped.
+
+- Readiness: GET /ready answers 200 only while the server is ready, so a load
+  balancer stops routing to it before it drains.
+- Draining: new tool calls are shed with 503 and Retry-After (the Overloaded
+  path admission control already uses), so clients retry on another worker.
+  Calls already running finish, up to RRVA_DRAIN_TIMEOUT_SECONDS.
+- Flushing: the server's flush hooks then run in order, in a thread. They
+  fsync recently written audit files, checkpoint the SQLite indexes and the
+  shared state database, and empty the trace export queue.
+- Reporting: a drain report (calls drained and abandoned, drain and flush
+  seconds, and one entry per hook) is logged, kept in last_report and returned
+  by POST /admin/drain.
+
+drain() is idempotent: a pre-stop POST /admin/drain and the shutdown that
+follows share one drain. SIGTERM and SIGINT drain first as well: the stdio
+server installs its own handlers (install_signal_handlers), and the HTTP
+server wraps uvicorn's (drain_on_signals), so uvicorn only stops accepting
+connections once the drain is over. uvicorn then waits up to its own
+timeout_graceful_shutdown for requests still open (calls the drain abandoned),
+so with both set to RRVA_DRAIN_TIMEOUT_SECONDS a shutdown takes at most about
+twice that, plus the flush.
+
+Configuration (environment):
+    RRVA_DRAIN_TIMEOUT_SECONDS   longest wait for in-flight calls (default 25)
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from contextlib import contextmanager
+from datetime import datetime
+import asyncio
+import logging
+import os
+import signal
+import threading
+import time
+
+from tools.admission import Overloaded
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DRAIN_TIMEOUT = 25.0
+
+STARTING = "starting"
+READY = "ready"
+DRAINING = "draining"
+STOPPED = "stopped"
+
+
+class Lifecycle:
+    """Tracks in-flight tool calls and runs the drain and flush at shutdown."""
+
+    def __init__(self, drain_timeout: float = DEFAULT_DRAIN_TIMEOUT):
+        self.drain_timeout = drain_timeout
+        self.state = STARTING
+        self.in_flight = 0
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._hooks: List[Tuple[str, Callable[[], Any]]] = []
+        self._idle: Optional[asyncio.Event] = None
+        self._drain: Optional[asyncio.Future] = None
+        self._previous_handlers: Dict[int, Any] = {}
+
+    @classmethod
+    def from_env(cls) -> "Lifecycle":
+        return cls(float(os.getenv("RRVA_DRAIN_TIMEOUT_SECONDS", str(DEFAULT_DRAIN_TIMEOUT))))
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    def mark_ready(self) -> None:
+        if self.state == STARTING:
+            self.state = READY
+
+    def add_flush_hook(self, name: str, hook: Callable[[], Any]) -> None:
+        """Run hook (in a thread) after draining; its return value goes into the drain report."""
+        self._hooks.append((name, hook))
+
+    # In-flight calls
+
+    def begin(self, tool: str) -> None:
+        """
+        Count a tool call as in flight (pair with end()).
+
+        Raises:
+            Overloaded: if the server is draining or stopped
+        """
+        if self.state in (DRAINING, STOPPED):
+            raise Overloaded(tool, "all", "server is shutting down", retry_after=1.0)
+        self.in_flight += 1
+
+    def end(self) -> None:
+        self.in_flight -= 1
+        if self.in_flight == 0 and self._idle is not None:
+            self._idle.set()
+
+    @contextmanager
+    def track(self, tool: str):
+        """Count a tool call as in flight for the duration of the block (see begin())."""
+        self.begin(tool)
+        try:
+            yield
+        finally:
+            self.end()
+
+    # Shutdown
+
+    async def drain(self) -> Dict[str, Any]:
+        """Stop accepting calls, wait for in-flight ones (up to the timeout), then flush."""
+        if self._drain is None:
+            self._drain = asyncio.ensure_future(self._drain_and_flush())
+        return await asyncio.shield(self._drain)
+
+    async def _drain_and_flush(self) -> Dict[str, Any]:
+        started = time.monotonic()
+        self.state = DRAINING
+        in_flight_at_start = self.in_flight
+        self._idle = asyncio.Event()
+        if self.in_flight:
+            try:
+                await asyncio.wait_for(self._idle.wait(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                pass
+        abandoned = self.in_flight
+        drained_at = time.monotonic()
+        hooks = await asyncio.to_thread(self.flush)
+        self.state = STOPPED
+
+        report = {
+            "pid": os.getpid(),
+            "in_flight_at_start": in_flight_at_start,
+            "drained": in_flight_at_start - abandoned,
+            "abandoned": abandoned,
+            "drain_seconds": round(drained_at - started, 3),
+            "flush_seconds": round(time.monotonic() - drained_at, 3),
+            "hooks": hooks,
+            "stopped_at": datetime.utcnow().isoformat() + "Z"
+        }
+        self.last_report = report
+        if abandoned:
+            logger.warning("Drain timed out after %.1fs with %d tool calls still running", self.drain_timeout, abandoned)
+        logger.info(
+            "Drained %d tool calls in %.3fs, flushed in %.3fs",
+            report["drained"], report["drain_seconds"], report["flush_seconds"]
+        )
+        return report
+
+    def flush(self) -> Dict[str, Any]:
+        """Run every flush hook in order (a failing hook is reported, not raised)."""
+        results = {}
+        for name, hook in self._hooks:
+            started = time.perf_counter()
+            try:
+                result = {"result": hook()}
+            except Exception as e:
+                logger.warning("Flush hook %s failed: %s", name, e)
+                result = {"error": str(e)}
+            result["seconds"] = round(time.perf_counter() - started, 3)
+            results[name] = result
+        return results
+
+    def install_signal_handlers(self, task: asyncio.Task) -> None:
+        """Drain on SIGTERM/SIGINT, then cancel task (servers that don't have their own handlers)."""
+        loop = asyncio.get_running_loop()
+
+        async def drain_then_cancel():
+            await self.drain()
+            task.cancel()
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, lambda: asyncio.ensure_future(drain_then_cancel()))
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows event loops: the default handlers stay in place
+
+    def drain_on_signals(self) -> None:
+        """
+        Drain on SIGTERM/SIGINT before passing the signal to the handler already installed.
+
+        For servers that set their own handlers with signal.signal (uvicorn):
+        call it after they are installed, e.g. from the app's startup. A second
+        signal goes straight to the server's handler (forced exit). Pair with
+        restore_signal_handlers() at shutdown.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return  # handlers can only be set from the main thread (e.g. not under TestClient)
+        loop = asyncio.get_running_loop()
+        signalled = False
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            previous = signal.getsignal(sig)
+            if not callable(previous):
+                continue  # default or ignored: no server handler to pass the signal to
+
+            async def drain_then_exit(signum, previous=previous):
+                await self.drain()
+                previous(signum, None)
+
+            def handler(signum, frame, previous=previous, drain_then_exit=drain_then_exit):
+                nonlocal signalled
+                if signalled:
+                    previous(signum, frame)
+                    return
+                signalled = True
+                loop.call_soon_threadsafe(lambda: asyncio.ensure_future(drain_then_exit(signum)))
+
+            self._previous_handlers[sig] = previous
+            signal.signal(sig, handler)
+
+    def restore_signal_handlers(self) -> None:
+        """Put back the handlers drain_on_signals() replaced."""
+        while self._previous_handlers:
+            sig, previous = self._previous_handlers.popitem()
+            signal.signal(sig, previous)
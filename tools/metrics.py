@@ -0,0 +1,162 @@
+"""
+Tool Call Metrics
+Per-tool call counts, error counts and latency histograms, plus gauges and
+labelled counters, rendered in the Prometheus text exposition format.
+
+Counters are plain Python ints owned by one worker process and only touched
+from its event loop thread, so recording needs no locks. Each worker serves
+its own counters; the pid label tells workers apart when several are running.
+
+Tool names come from clients, so once known_tools is set any other name is
+recorded as tool="unknown" (one series instead of one per bogus name). Label
+values are escaped as the exposition format requires.
+"""
+
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from bisect import bisect_left
+import os
+
+# Latency histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+UNKNOWN_TOOL = "unknown"
+
+
+def escape_label(value: str) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _ToolStats:
+    __slots__ = ("calls", "errors", "buckets", "total_seconds")
+
+    def __init__(self, bucket_count: int):
+        self.calls = 0
+        self.errors = 0
+        # Non-cumulative counts; the last slot is +Inf
+        self.buckets = [0] * (bucket_count + 1)
+        self.total_seconds = 0.0
+
+
+class MetricsRegistry:
+    """Collects tool call metrics for one worker process."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, prefix: str = "rrva"):
+        self.bucket_bounds = buckets
+        self.prefix = prefix
+        self.in_flight = 0
+        # Tool names recorded as-is (None records every name)
+        self.known_tools: Optional[Set[str]] = None
+        self._tools: Dict[str, _ToolStats] = {}
+        self._gauges: List[Tuple[str, str, Callable[[], float]]] = []
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._counter_help: Dict[str, str] = {}
+        self._labels = f'pid="{os.getpid()}"'
+
+    def tool_label(self, tool: str) -> str:
+        """The tool label to record a call under (unknown names share one label)."""
+        if self.known_tools is None or tool in self.known_tools:
+            return tool
+        return UNKNOWN_TOOL
+
+    def observe(self, tool: str, seconds: float, error: bool = False) -> None:
+        """Record one tool call. Runs on every call, so keep it cheap."""
+        tool = self.tool_label(tool)
+        stats = self._tools.get(tool)
+        if stats is None:
+            stats = self._tools[tool] = _ToolStats(len(self.bucket_bounds))
+        stats.calls += 1
+        if error:
+            stats.errors += 1
+        stats.buckets[bisect_left(self.bucket_bounds, seconds)] += 1
+        stats.total_seconds += seconds
+
+    def register_gauge(self, name: str, help_text: str, read: Callable[[], float]) -> None:
+        """Register a gauge whose value is read at scrape time."""
+        self._gauges.append((name, help_text, read))
+
+    def increment(self, name: str, help_text: str, amount: float = 1, **labels: str) -> None:
+        """Add to a labelled counter outside the per-tool stats."""
+        if "tool" in labels:
+            labels["tool"] = self.tool_label(labels["tool"])
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + amount
+        self._counter_help.setdefault(name, help_text)
+
+    def tool_stats(self, tool: str) -> Optional[Dict[str, float]]:
+        """Return call/error counts and mean latency for one tool (None if never called)."""
+        stats = self._tools.get(tool)
+        if stats is None:
+            return None
+        return {
+            "calls": stats.calls,
+            "errors": stats.errors,
+            "mean_seconds": stats.total_seconds / stats.calls if stats.calls else 0.0
+        }
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format."""
+        p = self.prefix
+        base = self._labels
+        lines = [
+            f"# HELP {p}_tool_calls_total Tool calls handled.",
+            f"# TYPE {p}_tool_calls_total counter",
+        ]
+        for tool, stats in sorted(self._tools.items()):
+            lines.append(f'{p}_tool_calls_total{{{base},tool="{escape_label(tool)}"}} {stats.calls}')
+
+        lines += [
+            f"# HELP {p}_tool_errors_total Tool calls that returned an error.",
+            f"# TYPE {p}_tool_errors_total counter",
+        ]
+        for tool, stats in sorted(self._tools.items()):
+            lines.append(f'{p}_tool_errors_total{{{base},tool="{escape_label(tool)}"}} {stats.errors}')
+
+        lines += [
+            f"# HELP {p}_tool_latency_seconds Tool call latency.",
+            f"# TYPE {p}_tool_latency_seconds histogram",
+        ]
+        for tool, stats in sorted(self._tools.items()):
+            labels = f'{base},tool="{escape_label(tool)}"'
+            cumulative = 0
+            for bound, count in zip(self.bucket_bounds, stats.buckets):
+                cumulative += count
+                lines.append(f'{p}_tool_latency_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{p}_tool_latency_seconds_bucket{{{labels},le="+Inf"}} {stats.calls}')
+            lines.append(f"{p}_tool_latency_seconds_sum{{{labels}}} {stats.total_seconds:.6f}")
+            lines.append(f"{p}_tool_latency_seconds_count{{{labels}}} {stats.calls}")
+
+        lines += [
+            f"# HELP {p}_tool_calls_in_flight Tool calls currently executing.",
+            f"# TYPE {p}_tool_calls_in_flight gauge",
+            f"{p}_tool_calls_in_flight{{{base}}} {self.in_flight}",
+        ]
+        emitted = set()
+        for (name, labels), value in sorted(self._counters.items()):
+            if name not in emitted:
+                lines += [
+                    f"# HELP {p}_{name} {self._counter_help[name]}",
+                    f"# TYPE {p}_{name} counter",
+                ]
+                emitted.add(name)
+            extra = "".join(f',{key}="{escape_label(val)}"' for key, val in labels)
+            lines.append(f"{p}_{name}{{{base}{extra}}} {value:g}")
+
+        for name, help_text, read in self._gauges:
+            try:
+                value = read()
+            except Exception:
+                continue
+            lines += [
+                f"# HELP {p}_{name} {help_text}",
+                f"# TYPE {p}_{name} gauge",
+                f"{p}_{name}{{{base}}} {value}",
+            ]
+
+        return "\n".join(lines) + "\n"
+
+
+# Registry shared by the servers in this process
+metrics = MetricsRegistry()
@@ -3,10 +3,16 @@ Order and Transaction History Tools
 Retrieves order details, transaction history, and fulfillment status.
 """
 
-from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Any, Tuple
+from datetime import datetime, timedelta, timezone
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+import base64
 import json
 
+from tools.items import LineItems, as_line_items
+from tools.tracing import traced
+
 # Sample order data for PoC
 _sample_orders: Dict[str, Dict[str, Any]] = {
     "ORD001": {
@@ -959,77 +965,365 @@ _sample_transactions: Dict[str, List[Dict[str, Any]]] = {
 }
 
 
+# Fields returned by each get_order_history view (None = the full order)
+ORDER_VIEWS: Dict[str, Optional[Tuple[str, ...]]] = {
+    "summary": ("order_id", "order_date", "status", "total_amount", "currency"),
+    "full": None,
+}
+
+# Per-customer order index: (order_date, order_id) keys sorted oldest first.
+# Keep in sync with _sample_orders by adding orders through register_order().
+_customer_order_index: Dict[str, List[Tuple[str, str]]] = {}
+
+
+def _index_order(order: Dict[str, Any]) -> None:
+    """Add an order to the per-customer sorted index."""
+    key = (order["order_date"], order["order_id"])
+    insort(_customer_order_index.setdefault(order["customer_id"], []), key)
+
+
+def register_order(order: Dict[str, Any]) -> None:
+    """Add (or replace) an order in the store and keep the index in sync."""
+    order["items"] = as_line_items(order["items"])
+    existing = _sample_orders.get(order["order_id"])
+    if existing is not None:
+        keys = _customer_order_index.get(existing["customer_id"], [])
+        key = (existing["order_date"], existing["order_id"])
+        pos = bisect_left(keys, key)
+        if pos < len(keys) and keys[pos] == key:
+            del keys[pos]
+    _sample_orders[order["order_id"]] = order
+    _index_order(order)
+
+
+def _encode_cursor(key: Tuple[str, str]) -> str:
+    """Encode an (order_date, order_id) key as an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Decode a cursor produced by _encode_cursor. Raises ValueError if invalid."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        order_date, order_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(order_date, str) or not isinstance(order_id, str):
+        raise ValueError("Invalid cursor")
+    return order_date, order_id
+
+
+def _project(order: Dict[str, Any], fields: Optional[Tuple[str, ...]]) -> Dict[str, Any]:
+    """
+    Return the requested top-level fields of an order (all if fields is None)
+    in JSON-ready form, expanding compact line items back to dicts.
+    """
+    if fields is None:
+        fields = tuple(order)
+    projected = {field: order[field] for field in fields if field in order}
+    items = projected.get("items")
+    if isinstance(items, LineItems):
+        projected["items"] = items.to_dicts()
+    return projected
+
+
+def _iter_customer_orders(
+    index: List[Tuple[str, str]],
+    after: Optional[Tuple[str, str]] = None,
+    fields: Optional[Tuple[str, ...]] = None
+) -> Iterator[Tuple[Tuple[str, str], Dict[str, Any]]]:
+    """Yield (key, projected order) newest first, starting strictly after the given key."""
+    pos = bisect_left(index, after) if after else len(index)
+    for i in range(pos - 1, -1, -1):
+        key = index[i]
+        yield key, _project(_sample_orders[key[1]], fields)
+
+
+def _build_order_index() -> None:
+    """(Re)build the per-customer index from the current order store."""
+    _customer_order_index.clear()
+    for order in _sample_orders.values():
+        # Orders hold their items in compact form; dicts are rebuilt by _project
+        order["items"] = as_line_items(order["items"])
+        _index_order(order)
+
+
+_build_order_index()
+
+
+def _timestamp_key(value: str) -> str:
+    """Normalize an ISO timestamp to a sortable UTC key (YYYY-mm-ddTHH:MM:SS.ffffffZ)."""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _range_bound(value: Optional[str], end: bool = False) -> Optional[str]:
+    """Turn a date (YYYY-mm-dd) or timestamp range bound into a timestamp key."""
+    if not value:
+        return None
+    if len(value) == 10:
+        value += "T23:59:59.999999" if end else "T00:00:00"
+    return _timestamp_key(value)
+
+
+class TransactionStore:
+    """
+    Transaction store indexed by order, by customer and by timestamp.
+    
+    Transactions without a timestamp are indexed under their order's date.
+    """
+    
+    def __init__(self):
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._by_order: Dict[str, List[Dict[str, Any]]] = {}
+        # Sorted (timestamp key, transaction_id) lists
+        self._by_customer: Dict[str, List[Tuple[str, str]]] = {}
+        self._by_time: List[Tuple[str, str]] = []
+    
+    def add(self, transaction: Dict[str, Any]) -> None:
+        """Index a transaction. Its order must already be in the order store."""
+        order = _sample_orders.get(transaction["order_id"], {})
+        timestamp = transaction.get("timestamp") or order.get("order_date")
+        key = (_timestamp_key(timestamp) if timestamp else "", transaction["transaction_id"])
+        
+        self._by_id[transaction["transaction_id"]] = transaction
+        self._by_order.setdefault(transaction["order_id"], []).append(transaction)
+        if order.get("customer_id"):
+            insort(self._by_customer.setdefault(order["customer_id"], []), key)
+        insort(self._by_time, key)
+    
+    def for_order(self, order_id: str) -> List[Dict[str, Any]]:
+        """Return all transactions for an order, in insertion order."""
+        return self._by_order.get(order_id, [])
+    
+    def _range(
+        self,
+        customer_id: Optional[str],
+        start: Optional[str],
+        end: Optional[str]
+    ) -> Tuple[List[Tuple[str, str]], int, int]:
+        """Return the index and [lo, hi) positions covering the time range."""
+        keys = self._by_customer.get(customer_id, []) if customer_id else self._by_time
+        lo = bisect_left(keys, (start, "")) if start else 0
+        hi = bisect_right(keys, (end, "\uffff")) if end else len(keys)
+        return keys, lo, max(lo, hi)
+    
+    def count(
+        self,
+        customer_id: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None
+    ) -> int:
+        """Count transactions in a time range without reading them."""
+        _, lo, hi = self._range(customer_id, _range_bound(start), _range_bound(end, end=True))
+        return hi - lo
+    
+    def iter_range(
+        self,
+        customer_id: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        newest_first: bool = True
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream transactions in a time range, optionally for a single customer.
+        
+        Args:
+            customer_id: Restrict to this customer's orders (optional)
+            start: Inclusive lower bound, date or ISO timestamp (optional)
+            end: Inclusive upper bound, date or ISO timestamp (optional)
+            newest_first: Yield in descending timestamp order (default)
+        """
+        keys, lo, hi = self._range(customer_id, _range_bound(start), _range_bound(end, end=True))
+        positions = range(hi - 1, lo - 1, -1) if newest_first else range(lo, hi)
+        for i in positions:
+            yield self._by_id[keys[i][1]]
+
+
+_transaction_store = TransactionStore()
+
+
+def _build_transaction_store() -> None:
+    """Index every transaction currently in _sample_transactions."""
+    for transactions in _sample_transactions.values():
+        for transaction in transactions:
+            _transaction_store.add(transaction)
+
+
+_build_transaction_store()
+
+
+def register_transaction(transaction: Dict[str, Any]) -> None:
+    """Add a transaction to the raw store and the transaction indexes."""
+    _sample_transactions.setdefault(transaction["order_id"], []).append(transaction)
+    _transaction_store.add(transaction)
+
+
 class OrderHistoryService:
     """Handles order and transaction history retrieval."""
     
+    @traced("store.order_history")
     async def get_order_history(
         self,
         customer_id: str,
         order_id: Optional[str] = None,
-        limit: int = 10
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        view: Optional[str] = None,
+        fields: Optional[List[str]] = None
     ) -> Dict[str, Any]:
         """
-        Retrieve order history for a customer.
+        Retrieve order history for a customer, newest first, one page at a time.
         
         Args:
             customer_id: Verified customer ID
             order_id: Specific order ID (optional) - accepts both ORD-001 and ORD001 formats
-            limit: Maximum number of orders to return
+            limit: Maximum number of orders to return (page size, at least 1)
+            cursor: Opaque cursor from a previous page's next_cursor (optional)
+            view: "summary" (id, date, status, total), "full" (default) or "custom"
+            fields: Top-level order fields to return (a list, or one field name); implies
+                the "custom" view, which requires it
         
         Returns:
-            Dict with orders list and metadata
+            Dict with orders list, total count and next_cursor for the following page
         """
         # Normalize customer_id (remove hyphens)
         normalized_customer_id = customer_id.replace("-", "")
         
-        # Filter orders by customer
-        customer_orders = [
-            order for order in _sample_orders.values()
-            if order["customer_id"] == normalized_customer_id or order["customer_id"] == customer_id
-        ]
+        # Resolve the projection up front so it is applied while reading the store
+        if isinstance(fields, str):
+            fields = [fields]
+        if fields:
+            view = "custom"
+            projection: Optional[Tuple[str, ...]] = tuple(fields)
+        elif view == "custom":
+            return {
+                "error": "fields is required for the custom view",
+                "customer_id": customer_id
+            }
+        elif (view or "full") in ORDER_VIEWS:
+            view = view or "full"
+            projection = ORDER_VIEWS[view]
+        else:
+            return {
+                "error": f"Unknown view: {view}. Use summary, full, or custom with fields",
+                "customer_id": customer_id
+            }
         
-        # Filter by specific order if provided
+        # Specific order: direct lookup, no pagination needed
         if order_id:
             # Normalize order_id (remove hyphens) to handle both formats
             normalized_order_id = order_id.replace("-", "")
-            customer_orders = [
-                order for order in customer_orders
-                if order["order_id"] == normalized_order_id or order["order_id"] == order_id
-            ]
+            order = _sample_orders.get(normalized_order_id) or _sample_orders.get(order_id)
+            if order and order["customer_id"] not in (normalized_customer_id, customer_id):
+                order = None
+            orders = [_project(order, projection)] if order else []
+            return {
+                "customer_id": customer_id,
+                "view": view,
+                "orders": orders,
+                "total_count": len(orders),
+                "returned_count": len(orders),
+                "next_cursor": None,
+                "has_more": False,
+                "retrieved_at": datetime.utcnow().isoformat() + "Z"
+            }
+        
+        after = None
+        if cursor:
+            try:
+                after = _decode_cursor(cursor)
+            except ValueError as e:
+                return {
+                    "error": str(e),
+                    "customer_id": customer_id
+                }
         
-        # Sort by date (newest first) and limit
-        customer_orders.sort(
-            key=lambda x: x["order_date"],
-            reverse=True
+        index = (
+            _customer_order_index.get(normalized_customer_id)
+            or _customer_order_index.get(customer_id)
+            or []
         )
-        customer_orders = customer_orders[:limit]
+        
+        # Materialize one page, plus one extra entry to detect further pages
+        limit = max(1, int(limit))
+        page = list(islice(_iter_customer_orders(index, after, projection), limit + 1))
+        has_more = len(page) > limit
+        page = page[:limit]
         
         return {
             "customer_id": customer_id,
-            "orders": customer_orders,
-            "total_count": len(customer_orders),
+            "view": view,
+            "orders": [order for _, order in page],
+            "total_count": len(index),
+            "returned_count": len(page),
+            "next_cursor": _encode_cursor(page[-1][0]) if has_more and page else None,
+            "has_more": has_more,
             "retrieved_at": datetime.utcnow().isoformat() + "Z"
         }
     
+    @traced("store.transaction_history")
     async def get_transaction_history(
         self,
-        order_id: str,
-        customer_id: str
+        order_id: Optional[str],
+        customer_id: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        limit: int = 100
     ) -> Dict[str, Any]:
         """
-        Retrieve transaction/payment history for a specific order.
+        Retrieve transaction/payment history for an order, or for all of a
+        customer's orders within an optional time range.
         
         Args:
-            order_id: Order ID - accepts both ORD-001 and ORD001 formats
+            order_id: Order ID, or None for all of the customer's orders - accepts both ORD-001 and ORD001 formats
             customer_id: Verified customer ID (for authorization check) - accepts both CUST-001 and CUST001 formats
+            start_date: Inclusive start, date or ISO timestamp (optional)
+            end_date: Inclusive end, date or ISO timestamp (optional)
+            limit: Maximum number of transactions to return for customer-wide queries
         
         Returns:
             Dict with transactions list
         """
         # Normalize IDs (remove hyphens) to handle both formats
-        normalized_order_id = order_id.replace("-", "")
         normalized_customer_id = customer_id.replace("-", "")
         
+        try:
+            start_key = _range_bound(start_date)
+            end_key = _range_bound(end_date, end=True)
+        except ValueError:
+            return {
+                "error": "Invalid date range",
+                "customer_id": customer_id
+            }
+        
+        if not order_id:
+            # Customer-wide history, served from the customer/timestamp index
+            store_customer_id = (
+                normalized_customer_id
+                if normalized_customer_id in _customer_order_index
+                else customer_id
+            )
+            limit = max(0, int(limit))
+            transactions = list(islice(
+                _transaction_store.iter_range(store_customer_id, start_date, end_date),
+                limit
+            ))
+            total_count = _transaction_store.count(store_customer_id, start_date, end_date)
+            return {
+                "customer_id": customer_id,
+                "start_date": start_date,
+                "end_date": end_date,
+                "transactions": transactions,
+                "total_count": total_count,
+                "has_more": total_count > len(transactions),
+                "retrieved_at": datetime.utcnow().isoformat() + "Z"
+            }
+        
+        normalized_order_id = order_id.replace("-", "")
+        
         # Try to find order with normalized ID first, then original
         order = _sample_orders.get(normalized_order_id) or _sample_orders.get(order_id)
         
@@ -1047,8 +1341,13 @@ class OrderHistoryService:
                 "order_id": order_id
             }
         
-        # Get transactions for this order (try normalized ID first, then original)
-        transactions = _sample_transactions.get(normalized_order_id, []) or _sample_transactions.get(order_id, [])
+        # Get transactions for this order from the order index
+        transactions = _transaction_store.for_order(order["order_id"])
+        if start_key or end_key:
+            transactions = [
+                txn for txn in transactions
+                if _in_range(txn.get("timestamp") or order["order_date"], start_key, end_key)
+            ]
         
         return {
             "order_id": normalized_order_id,  # Return normalized format
@@ -1059,3 +1358,7 @@ class OrderHistoryService:
         }
 
 
+def _in_range(timestamp: str, start_key: Optional[str], end_key: Optional[str]) -> bool:
+    """Check a timestamp against normalized range bounds."""
+    key = _timestamp_key(timestamp)
+    return (not start_key or key >= start_key) and (not end_key or key <= end_key)
@@ -0,0 +1,37 @@
+"""
+Storage Paths
+Location of the storage directory used by every audit and state module.
+
+Resolved once at import, in order:
+1. RRVA_STORAGE_DIR environment variable
+2. "storage" -> "base_dir" in mcp_config.json
+3. ./storage (relative to the working directory)
+
+Subdirectories and database files keep their fixed names under it
+(audio/, transcripts/, decision_logs/, audit_index.db, ...).
+"""
+
+from pathlib import Path
+import json
+import os
+
+CONFIG_PATH = Path(__file__).resolve().parent.parent / "mcp_config.json"
+DEFAULT_STORAGE_DIR = Path("storage")
+
+
+def load_config_section(name: str, config_path: Path = CONFIG_PATH) -> dict:
+    """Return one section of mcp_config.json (empty if the file or section is missing)."""
+    try:
+        with open(config_path) as f:
+            section = json.load(f).get(name, {})
+    except (OSError, ValueError):
+        return {}
+    return section if isinstance(section, dict) else {}
+
+
+def resolve_storage_dir() -> Path:
+    configured = os.getenv("RRVA_STORAGE_DIR") or load_config_section("storage").get("base_dir")
+    return Path(configured) if configured else DEFAULT_STORAGE_DIR
+
+
+STORAGE_DIR = resolve_storage_dir()
@@ -8,6 +8,8 @@ from datetime import datetime, timedelta
 import json
 
 from tools.orders import _sample_orders
+from tools.items import line_items_view, condition_code, condition_name
+from tools.tracing import span
 
 
 class RefundPolicyEngine:
@@ -49,7 +51,8 @@ class RefundPolicyEngine:
         normalized_customer_id = customer_id.replace("-", "")
         
         # Try to find order with normalized ID first, then original
-        order = _sample_orders.get(normalized_order_id) or _sample_orders.get(order_id)
+        with span("store.order_lookup"):
+            order = _sample_orders.get(normalized_order_id) or _sample_orders.get(order_id)
         
         if not order:
             return {
@@ -73,9 +76,10 @@ class RefundPolicyEngine:
         issues = []
         
         # Check 1: Time window
-        order_date = datetime.fromisoformat(order["order_date"].replace("Z", "+00:00"))
-        days_since_order = (datetime.now(order_date.tzinfo) - order_date).days
-        within_window = days_since_order <= self.policy["refund_window_days"]
+        with span("policy.time_window"):
+            order_date = datetime.fromisoformat(order["order_date"].replace("Z", "+00:00"))
+            days_since_order = (datetime.now(order_date.tzinfo) - order_date).days
+            within_window = days_since_order <= self.policy["refund_window_days"]
         
         checks.append({
             "check": "time_window",
@@ -105,51 +109,55 @@ class RefundPolicyEngine:
             eligible = False
             issues.append(f"Order status is {order['status']}, must be delivered")
         
-        # Check 3: Item-level checks
-        items_to_check = order["items"]
-        if item_ids:
-            # Normalize item IDs to handle both ITEM-001 and ITEM001 formats
-            normalized_item_ids = [item_id.replace("-", "") for item_id in item_ids]
-            items_to_check = [
-                item for item in items_to_check
-                if item["item_id"] in item_ids or item["item_id"] in normalized_item_ids
-            ]
-        
-        item_checks = []
-        total_refund_amount = 0.0
-        partial_eligible = False
-        
-        for item in items_to_check:
-            item_eligible = True
-            item_issues = []
+        # Check 3: Item-level checks (runs on the compact column arrays)
+        with span("policy.item_checks") as item_span:
+            items = line_items_view(order["items"])
+            positions = items.select(item_ids)
+            prices = items.prices
+            quantities = items.quantities
+            conditions = items.conditions
+            allowed_codes = {condition_code(c) for c in self.policy["allowed_conditions"]}
+            allowed_codes.add(condition_code("unopened"))
+            used_code = condition_code("used")
+            restocking_rate = self.policy["restocking_fee_percent"] / 100
             
-            # Condition check
-            condition = item.get("condition", "unknown")
-            condition_allowed = condition in self.policy["allowed_conditions"] or condition == "unopened"
+            item_checks = []
+            total_refund_amount = 0.0
+            partial_eligible = False
             
-            if not condition_allowed and condition == "used":
-                # Used items may be eligible with restocking fee
-                partial_eligible = True
-                restocking_fee = item["price"] * (self.policy["restocking_fee_percent"] / 100)
-                refund_amount = item["price"] - restocking_fee
-                item_issues.append(f"Item is used, {self.policy['restocking_fee_percent']}% restocking fee applies")
-            elif condition_allowed:
-                refund_amount = item["price"] * item["quantity"]
-            else:
-                item_eligible = False
-                item_issues.append(f"Item condition '{condition}' not eligible for refund")
-            
-            item_checks.append({
-                "item_id": item["item_id"],
-                "product_name": item["product_name"],
-                "condition": condition,
-                "eligible": item_eligible or partial_eligible,
-                "refund_amount": refund_amount if (item_eligible or partial_eligible) else 0,
-                "issues": item_issues
-            })
+            for i in positions:
+                item_eligible = True
+                item_issues = []
+                
+                # Condition check
+                code = conditions[i]
+                condition_allowed = code in allowed_codes
+                
+                if not condition_allowed and code == used_code:
+                    # Used items may be eligible with restocking fee
+                    partial_eligible = True
+                    restocking_fee = prices[i] * restocking_rate
+                    refund_amount = prices[i] - restocking_fee
+                    item_issues.append(f"Item is used, {self.policy['restocking_fee_percent']}% restocking fee applies")
+                elif condition_allowed:
+                    refund_amount = prices[i] * quantities[i]
+                else:
+                    item_eligible = False
+                    item_issues.append(f"Item condition '{condition_name(code)}' not eligible for refund")
+                
+                item_checks.append({
+                    "item_id": items.item_ids[i],
+                    "product_name": items.product_names[i],
+                    "condition": condition_name(code),
+                    "eligible": item_eligible or partial_eligible,
+                    "refund_amount": refund_amount if (item_eligible or partial_eligible) else 0,
+                    "issues": item_issues
+                })
+                
+                if item_eligible or partial_eligible:
+                    total_refund_amount += refund_amount
             
-            if item_eligible or partial_eligible:
-                total_refund_amount += refund_amount
+            item_span.set_attribute("items", len(item_checks))
         
         checks.append({
             "check": "item_eligibility",
@@ -0,0 +1,200 @@
+"""
+Sampling Profiler
+Samples the event loop thread's Python stack at a fixed interval and reports
+the result as collapsed stacks. Collapsed stacks are the input format of
+flamegraph.pl and speedscope. Event loop lag is measured over the same window.
+
+Samples taken while the loop waits in its selector are counted as idle and
+left out of the stacks, so the output shows where CPU time went.
+
+The profiled code is not instrumented, so the overhead is one stack walk per
+sample. The profiler is only active while a profile is being taken.
+"""
+
+from typing import Any, Dict, List, Optional
+from collections import Counter
+import asyncio
+import math
+import os
+import signal
+import sys
+import threading
+import time
+
+DEFAULT_INTERVAL = 0.005
+MAX_PROFILE_SECONDS = 120
+
+# Leaf frames that mean the event loop itself is waiting rather than running handlers
+_IDLE_FILES = (
+    "selectors.py",
+    os.path.join("asyncio", "runners.py"),
+    os.path.join("asyncio", "base_events.py"),
+)
+
+
+def _frame_label(code) -> str:
+    """Frame name in collapsed output: function (last two path parts:first line)."""
+    path = code.co_filename.replace("\\", "/")
+    short = "/".join(path.rsplit("/", 2)[-2:])
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples one thread's stack at a fixed interval.
+
+    On the main thread (where uvicorn runs the event loop), samples come from
+    a SIGPROF CPU-time timer. Samples are then spread over CPU time and are not
+    skewed toward points where the GIL happens to be released. On other
+    threads, a background thread samples sys._current_frames() on wall-clock
+    time instead.
+    """
+
+    def __init__(self, thread_id: int, interval: float = DEFAULT_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self.mode = "cpu" if self._can_use_signals() else "wall"
+        self._labels: Dict[Any, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._previous_handler = None
+
+    def _can_use_signals(self) -> bool:
+        return hasattr(signal, "setitimer") and self.thread_id == threading.main_thread().ident
+
+    def start(self) -> None:
+        if self.mode == "cpu":
+            self._previous_handler = signal.signal(signal.SIGPROF, self._on_signal)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self._thread = threading.Thread(target=self._run, name="rrva-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self.mode == "cpu":
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+        else:
+            self._stop.set()
+            if self._thread is not None:
+                self._thread.join()
+
+    def _on_signal(self, signum, frame) -> None:
+        self._record(frame)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self._record(frame)
+
+    def _record(self, frame) -> None:
+        if frame.f_code.co_filename.endswith(_IDLE_FILES):
+            # No Python code is running on the loop: waiting for I/O (or inside uvloop's C loop)
+            self.idle_samples += 1
+            return
+        labels = self._labels
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = _frame_label(code)
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        self.stacks[";".join(stack)] += 1
+        self.samples += 1
+
+    def collapsed(self) -> str:
+        """Stacks in collapsed format: root;...;leaf count per line."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_frames(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Frames ranked by self time (share of busy samples where they are the leaf)."""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = self.samples or 1
+        return [
+            {"frame": frame, "samples": count, "percent": round(100 * count / total, 2)}
+            for frame, count in leaves.most_common(limit)
+        ]
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a task that sleeps for a fixed interval."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+
+    async def run(self, seconds: float) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + seconds
+        while loop.time() < deadline:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - started - self.interval))
+
+    def summary(self) -> Dict[str, float]:
+        lags = sorted(self.lags)
+        if not lags:
+            return {"checks": 0, "mean_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        p99 = lags[max(0, math.ceil(0.99 * len(lags)) - 1)]
+        return {
+            "checks": len(lags),
+            "mean_ms": round(1000 * sum(lags) / len(lags), 3),
+            "p99_ms": round(1000 * p99, 3),
+            "max_ms": round(1000 * lags[-1], 3)
+        }
+
+
+_profile_lock = asyncio.Lock()
+
+
+def profile_in_progress() -> bool:
+    """True while a profile is being taken in this process."""
+    return _profile_lock.locked()
+
+
+async def profile_event_loop(seconds: float, interval: float = DEFAULT_INTERVAL) -> Dict[str, Any]:
+    """
+    Profile the calling event loop's thread for a number of seconds.
+
+    Args:
+        seconds: Profile duration (capped at MAX_PROFILE_SECONDS)
+        interval: Seconds between stack samples
+
+    Returns:
+        Dict with sample counts, top frames, loop lag summary and collapsed stacks
+    """
+    seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+    async with _profile_lock:
+        profiler = SamplingProfiler(threading.get_ident(), interval)
+        lag = LoopLagMonitor()
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await lag.run(seconds)
+        finally:
+            if profiler.mode == "cpu":
+                profiler.stop()
+            else:
+                await asyncio.to_thread(profiler.stop)
+        elapsed = time.perf_counter() - started
+
+    return {
+        "pid": os.getpid(),
+        "duration_seconds": round(elapsed, 3),
+        "interval_ms": interval * 1000,
+        "mode": profiler.mode,
+        "samples": profiler.samples,
+        "idle_samples": profiler.idle_samples,
+        "loop_lag": lag.summary(),
+        "top_frames": profiler.top_frames(),
+        "collapsed": profiler.collapsed()
+    }
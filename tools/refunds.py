@@ -3,20 +3,32 @@ Refund Execution Tools
 Handles refund creation, payment reversal, and receipt generation.
 """
 
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, AsyncIterable, AsyncIterator, Iterable, MutableMapping, Union
 from datetime import datetime, timedelta
-import uuid
+import asyncio
+import math
+import time
 import json
 
 from tools.orders import _sample_orders, _sample_transactions
+from tools.items import line_items_view
+from tools.tracing import traced
+from tools.ids import new_id
+from tools.state import state_map
+
+
+# Default number of orders validated and committed together by execute_bulk
+BULK_CHUNK_SIZE = 500
 
 
 class RefundExecutor:
     """Handles refund execution and receipt generation."""
     
     def __init__(self):
-        # In-memory storage for refunds (replace with database in production)
-        self._refunds: Dict[str, Dict[str, Any]] = {}
+        # Executed refunds, in the shared state backend so every worker can issue receipts
+        self._refunds: MutableMapping[str, Dict[str, Any]] = state_map("refunds")
+        # Order ID -> refund ID, claimed atomically so no order is refunded twice by any worker
+        self._order_refunds: MutableMapping[str, str] = state_map("order_refunds")
     
     async def execute(
         self,
@@ -41,65 +53,42 @@ class RefundExecutor:
         Returns:
             Dict with refund details and receipt
         """
-        # Normalize IDs (remove hyphens) to handle both formats
-        normalized_order_id = order_id.replace("-", "")
-        normalized_customer_id = customer_id.replace("-", "")
-        
-        # Try to find order with normalized ID first, then original
-        order = _sample_orders.get(normalized_order_id) or _sample_orders.get(order_id)
-        
-        if not order:
+        order, error = self._find_owned_order(order_id, customer_id)
+        if error:
             return {
                 "success": False,
-                "error": "Order not found",
+                "error": error,
                 "order_id": order_id
             }
         
-        # Verify customer ownership (check normalized or original)
-        order_customer_id = order["customer_id"]
-        if order_customer_id != normalized_customer_id and order_customer_id != customer_id:
+        # Calculate refund amount if not provided
+        if refund_amount is None:
+            refund_amount = self._calculate_refund_amount(order, item_ids)
+        error = _amount_error(refund_amount, order)
+        if error:
             return {
                 "success": False,
-                "error": "Unauthorized: Order does not belong to customer",
+                "error": error,
                 "order_id": order_id
             }
         
-        # Calculate refund amount if not provided
-        if refund_amount is None:
-            if item_ids:
-                # Normalize item IDs to handle both ITEM-001 and ITEM001 formats
-                normalized_item_ids = [item_id.replace("-", "") for item_id in item_ids]
-                refund_amount = sum(
-                    item["price"] * item["quantity"]
-                    for item in order["items"]
-                    if item["item_id"] in item_ids or item["item_id"] in normalized_item_ids
-                )
-            else:
-                refund_amount = order["total_amount"]
-        
-        # Generate refund ID
-        refund_id = f"REF{uuid.uuid4().hex[:8].upper()}"
-        
-        # Create refund record
-        refund_record = {
-            "refund_id": refund_id,
-            "order_id": order_id,
-            "customer_id": customer_id,
-            "refund_amount": refund_amount,
-            "currency": order["currency"],
-            "refund_method": refund_method,
-            "reason": reason,
-            "status": "completed",
-            "processed_at": datetime.utcnow().isoformat() + "Z",
-            "item_ids": item_ids,
-            "original_order": {
-                "order_date": order["order_date"],
-                "total_amount": order["total_amount"]
+        # Create the refund record, claim the order, then store the record
+        refund_record = self._build_refund_record(
+            order, order_id, customer_id, refund_amount, refund_method, reason, item_ids
+        )
+        refund_id = refund_record["refund_id"]
+        if not self._order_refunds.add(order["order_id"], refund_id):
+            return {
+                "success": False,
+                "error": "Order already refunded",
+                "order_id": order_id,
+                "refund_id": self._order_refunds.get(order["order_id"])
             }
-        }
-        
-        # Store refund
-        self._refunds[refund_id] = refund_record
+        try:
+            self._refunds[refund_id] = refund_record
+        except Exception:
+            self._order_refunds.pop(order["order_id"], None)
+            raise
         
         # In production, this would:
         # 1. Call payment processor API to reverse charge
@@ -121,10 +110,251 @@ class RefundExecutor:
             "receipt": receipt
         }
     
+    async def execute_bulk(
+        self,
+        orders: Union[Iterable[Any], AsyncIterable[Any]],
+        reason: str,
+        refund_method: str = "original_payment",
+        customer_id: Optional[str] = None,
+        chunk_size: int = BULK_CHUNK_SIZE
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Execute refunds for a stream of orders (e.g. a product recall).
+        
+        Orders are consumed lazily and processed in chunks: every order in a
+        chunk is validated first, then all accepted refund records are committed
+        to the store in a single write. One result is yielded per order as soon
+        as its chunk is committed, followed by a final summary with throughput.
+        
+        Every order's ownership is checked, so each entry needs a customer_id
+        (its own or the default). Each accepted order is claimed atomically in
+        the shared state before its chunk is committed, so orders that already
+        have a refund (from this run, an earlier one or another worker) are
+        skipped.
+        
+        Args:
+            orders: Order IDs, or dicts with order_id and optional customer_id,
+                refund_amount and item_ids. May be a sync or async iterable.
+            reason: Refund reason applied to every order (for audit)
+            refund_method: "original_payment" or "store_credit"
+            customer_id: Expected owner for entries that don't carry their own
+                customer_id
+            chunk_size: Number of orders validated and committed together
+        
+        Yields:
+            Dicts with "type": "result" per order, then one "type": "summary"
+        """
+        chunk_size = max(1, int(chunk_size or BULK_CHUNK_SIZE))
+        started = time.perf_counter()
+        processed = 0
+        succeeded = 0
+        total_refunded = 0.0
+        seen_orders = set()
+        
+        async for chunk in _chunked(orders, chunk_size):
+            results = []
+            pending: Dict[str, Dict[str, Any]] = {}
+            claimed_orders: List[str] = []
+            
+            # Validate ownership and amounts for the whole chunk
+            for entry in chunk:
+                result = self._prepare_bulk_entry(
+                    entry, reason, refund_method, customer_id, seen_orders
+                )
+                if result.get("success"):
+                    record = result.pop("_record")
+                    pending[record["refund_id"]] = record
+                    claimed_orders.append(result.pop("_order_key"))
+                results.append(result)
+            
+            # Group commit: one store write per chunk (claims are released if it fails)
+            try:
+                self._refunds.update(pending)
+            except Exception:
+                for order_key in claimed_orders:
+                    self._order_refunds.pop(order_key, None)
+                raise
+            
+            for result in results:
+                processed += 1
+                if result.get("success"):
+                    succeeded += 1
+                    total_refunded += result["refund_amount"]
+                yield result
+            
+            # Let interactive tool calls run between chunks
+            await asyncio.sleep(0)
+        
+        elapsed = time.perf_counter() - started
+        yield {
+            "type": "summary",
+            "processed": processed,
+            "succeeded": succeeded,
+            "failed": processed - succeeded,
+            "total_refunded": round(total_refunded, 2),
+            "elapsed_seconds": round(elapsed, 6),
+            "orders_per_second": round(processed / elapsed, 2) if elapsed > 0 else None
+        }
+    
+    def _prepare_bulk_entry(
+        self,
+        entry: Any,
+        reason: str,
+        refund_method: str,
+        default_customer_id: Optional[str],
+        seen_orders: set
+    ) -> Dict[str, Any]:
+        """Validate one bulk entry, claim its order and build its (uncommitted) refund record."""
+        if isinstance(entry, str):
+            entry = {"order_id": entry}
+        elif not isinstance(entry, dict) or not entry.get("order_id"):
+            return {
+                "type": "result",
+                "success": False,
+                "error": "Invalid entry: order_id is required",
+                "order_id": entry.get("order_id") if isinstance(entry, dict) else None
+            }
+        
+        order_id = str(entry["order_id"])
+        customer_id = entry.get("customer_id") or default_customer_id
+        if not customer_id:
+            return {
+                "type": "result",
+                "success": False,
+                "error": "customer_id is required to check order ownership",
+                "order_id": order_id
+            }
+        order, error = self._find_owned_order(order_id, customer_id)
+        if error:
+            return {"type": "result", "success": False, "error": error, "order_id": order_id}
+        
+        # The same order must not be refunded twice, in this run or across runs
+        if order["order_id"] in seen_orders:
+            return {
+                "type": "result",
+                "success": False,
+                "error": "Duplicate order in batch",
+                "order_id": order_id
+            }
+        
+        item_ids = entry.get("item_ids")
+        refund_amount = entry.get("refund_amount")
+        if refund_amount is None:
+            refund_amount = self._calculate_refund_amount(order, item_ids)
+        
+        error = _amount_error(refund_amount, order)
+        if error:
+            return {"type": "result", "success": False, "error": error, "order_id": order_id}
+        
+        seen_orders.add(order["order_id"])
+        record = self._build_refund_record(
+            order,
+            order_id,
+            customer_id,
+            refund_amount,
+            refund_method,
+            reason,
+            item_ids
+        )
+        if not self._order_refunds.add(order["order_id"], record["refund_id"]):
+            return {
+                "type": "result",
+                "success": False,
+                "error": "Order already refunded",
+                "order_id": order_id,
+                "refund_id": self._order_refunds.get(order["order_id"])
+            }
+        return {
+            "type": "result",
+            "success": True,
+            "order_id": order_id,
+            "refund_id": record["refund_id"],
+            "refund_amount": refund_amount,
+            "currency": record["currency"],
+            "status": record["status"],
+            "_record": record,
+            "_order_key": order["order_id"]
+        }
+    
+    @traced("store.order_lookup")
+    def _find_owned_order(
+        self,
+        order_id: str,
+        customer_id: Optional[str]
+    ) -> tuple:
+        """
+        Look up an order and verify ownership.
+        
+        Returns:
+            (order, None) on success, (None, error message) otherwise.
+            Ownership is only checked when customer_id is provided.
+        """
+        # Normalize IDs (remove hyphens) to handle both formats
+        normalized_order_id = order_id.replace("-", "")
+        
+        # Try to find order with normalized ID first, then original
+        order = _sample_orders.get(normalized_order_id) or _sample_orders.get(order_id)
+        
+        if not order:
+            return None, "Order not found"
+        
+        # Verify customer ownership (check normalized or original)
+        if customer_id is not None:
+            normalized_customer_id = customer_id.replace("-", "")
+            order_customer_id = order["customer_id"]
+            if order_customer_id != normalized_customer_id and order_customer_id != customer_id:
+                return None, "Unauthorized: Order does not belong to customer"
+        
+        return order, None
+    
+    def _calculate_refund_amount(
+        self,
+        order: Dict[str, Any],
+        item_ids: Optional[List[str]] = None
+    ) -> float:
+        """Calculate the refund amount for the given items, or the whole order."""
+        if item_ids:
+            # select() accepts both ITEM-001 and ITEM001 formats
+            items = line_items_view(order["items"])
+            return items.subtotal(items.select(item_ids))
+        return order["total_amount"]
+    
+    def _build_refund_record(
+        self,
+        order: Dict[str, Any],
+        order_id: str,
+        customer_id: str,
+        refund_amount: float,
+        refund_method: str,
+        reason: str,
+        item_ids: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Create a refund record (not yet stored)."""
+        # Generate refund ID
+        refund_id = new_id("REF")
+        
+        return {
+            "refund_id": refund_id,
+            "order_id": order_id,
+            "customer_id": customer_id,
+            "refund_amount": refund_amount,
+            "currency": order["currency"],
+            "refund_method": refund_method,
+            "reason": reason,
+            "status": "completed",
+            "processed_at": datetime.utcnow().isoformat() + "Z",
+            "item_ids": item_ids,
+            "original_order": {
+                "order_date": order["order_date"],
+                "total_amount": order["total_amount"]
+            }
+        }
+    
     async def get_receipt(
         self,
         refund_id: str,
-        order_id: Optional[str] = None
+        order_id: Optional[str] = None,
+        stamp: bool = True
     ) -> Dict[str, Any]:
         """
         Retrieve refund receipt.
@@ -132,6 +362,8 @@ class RefundExecutor:
         Args:
             refund_id: Refund transaction ID
             order_id: Order ID (optional, for validation)
+            stamp: Add receipt_generated_at. Stored receipts leave it out, so
+                the same refund always gives the same bytes (and one blob).
         
         Returns:
             Dict with receipt details
@@ -173,9 +405,46 @@ class RefundExecutor:
             ).isoformat() + "Z",
             "reference_number": f"REF{refund_id}",
             "items_refunded": refund.get("item_ids", []),
-            "original_order_total": order.get("total_amount", 0),
-            "receipt_generated_at": datetime.utcnow().isoformat() + "Z"
+            "original_order_total": order.get("total_amount", 0)
         }
+        if stamp:
+            receipt["receipt_generated_at"] = datetime.utcnow().isoformat() + "Z"
         
         return receipt
 
+
+def _amount_error(refund_amount: Any, order: Dict[str, Any]) -> Optional[str]:
+    """Why a refund amount is unusable (None if it is valid)."""
+    # Amount must be a finite positive number (not a bool, not NaN) and cannot exceed what was charged
+    if (
+        isinstance(refund_amount, bool)
+        or not isinstance(refund_amount, (int, float))
+        or not math.isfinite(refund_amount)
+        or refund_amount <= 0
+    ):
+        return "Invalid refund amount"
+    if refund_amount > order["total_amount"]:
+        return f"Refund amount {refund_amount} exceeds order total {order['total_amount']}"
+    return None
+
+
+async def _chunked(
+    items: Union[Iterable[Any], AsyncIterable[Any]],
+    size: int
+) -> AsyncIterator[List[Any]]:
+    """Group a sync or async iterable into lists of at most `size` items."""
+    chunk: List[Any] = []
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    else:
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
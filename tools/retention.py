@@ -0,0 +1,548 @@
+"""
+Storage Retention
+Background rotation, archival and expiry of the audit artifacts in storage/.
+
+Each pass (every interval_seconds, in a daemon thread of the server):
+1. Rotates traces.jsonl into traces/traces-<time>.jsonl once it is larger
+   than trace_rotate_mb or the last rotation is a day old.
+2. Deletes archives and files older than their artifact type's window, and
+   the index rows of decisions and transcripts older than their window
+   (analytics rollups are kept).
+3. Rolls files older than archive_after_days into one zip per artifact type
+   and day: archive/<type dir>/<YYYY-mm-dd>-<n>.zip. The zip is written
+   under a temporary name, fsynced and renamed before any original is removed.
+   Codec-compressed artifacts and audio are stored as-is and plain JSON is
+   deflated. Single members can be read without unpacking the archive.
+4. In blob mode, archives session manifests that have not changed for
+   archive_after_days, with the blobs they list. A blob is removed only when
+   no remaining manifest lists it and it has not been stored again since the
+   cutoff (BlobStore.put refreshes its mtime).
+
+Index rows of archived files are pointed at "<archive>::<member>", which
+AuditLogger.read_artifact (read_archived) reads back.
+
+Live writes are never blocked: only files older than the cutoff are touched,
+index changes commit in small batches, and archive reads and writes go through
+a token bucket capped at max_io_mb_per_sec. When several workers share the
+storage directory, an exclusive lock on storage/.retention.lock lets only one
+of them run a pass.
+
+Configuration ("retention" in mcp_config.json):
+    enabled               run passes in the background (default false)
+    interval_seconds      time between passes (default 3600)
+    archive_after_days    age at which files are archived (default 7)
+    max_io_mb_per_sec     archive I/O budget (default 5, 0 for unlimited)
+    trace_rotate_mb       traces.jsonl size that triggers a rotation (default 64)
+    windows_days          days to keep each artifact type (null keeps it forever):
+                          audio, transcript, decision_log, receipt, trace, manifest
+
+Usage:
+    python -m tools.retention run --dry-run
+    python -m tools.retention run
+    python -m tools.retention status
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+
+from tools.audit_index import AuditIndex
+from tools.blobstore import manifest_lock
+from tools.paths import STORAGE_DIR, load_config_section
+from tools.transcript_search import TranscriptIndex
+
+# Exclusive lock between worker processes (POSIX only)
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+DEFAULT_CONFIG = {
+    "enabled": False,
+    "interval_seconds": 3600,
+    "archive_after_days": 7,
+    "max_io_mb_per_sec": 5,
+    "trace_rotate_mb": 64,
+    "windows_days": {
+        "audio": 90,
+        "transcript": 365,
+        "decision_log": 2555,
+        "receipt": 2555,
+        "trace": 14
+    }
+}
+
+# Artifact type -> directory (under storage/ and storage/archive/) of its files
+ARTIFACT_DIRS = {
+    "audio": "audio",
+    "transcript": "transcripts",
+    "decision_log": "decision_logs",
+    "receipt": "receipts",
+    "trace": "traces"
+}
+
+ARCHIVE_DIR = "archive"
+# Separates an archive path from the member name in relocated index paths
+ARCHIVE_SEPARATOR = "::"
+LOCK_FILE = ".retention.lock"
+TRACE_ROTATE_SECONDS = 86400
+STARTUP_DELAY_SECONDS = 60
+COPY_CHUNK = 1 << 20
+RELOCATE_BATCH = 500
+
+# Files that are already compressed are stored in the zip without deflating them again
+_COMPRESSED_SUFFIXES = (".zst", ".zz", ".gz")
+# In-progress writes (audio .part files, atomic-write temporaries)
+_PARTIAL_SUFFIXES = (".part", ".tmp")
+
+
+class RetentionStopped(Exception):
+    """Raised inside a pass when the manager is stopped."""
+
+
+class IORateLimiter:
+    """Token bucket over archive bytes read and written (one second of burst)."""
+
+    def __init__(self, bytes_per_sec: float, stop: Optional[threading.Event] = None):
+        self.rate = bytes_per_sec
+        self.allowance = bytes_per_sec
+        self.updated = time.monotonic()
+        self.stop = stop or threading.Event()
+
+    def consume(self, nbytes: int) -> None:
+        """Account for nbytes of I/O, sleeping while over budget."""
+        if self.stop.is_set():
+            raise RetentionStopped()
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self.allowance = min(self.rate, self.allowance + (now - self.updated) * self.rate)
+        self.updated = now
+        self.allowance -= nbytes
+        if self.allowance < 0 and self.stop.wait(-self.allowance / self.rate):
+            raise RetentionStopped()
+
+
+def load_retention_config() -> Dict[str, Any]:
+    """DEFAULT_CONFIG overlaid with the "retention" section of mcp_config.json."""
+    section = load_config_section("retention")
+    return {
+        **DEFAULT_CONFIG,
+        **section,
+        "windows_days": {**DEFAULT_CONFIG["windows_days"], **section.get("windows_days", {})}
+    }
+
+
+def read_archived(path: str) -> bytes:
+    """Bytes of an archived artifact, addressed as "<archive>::<member>"."""
+    archive_path, member = path.split(ARCHIVE_SEPARATOR, 1)
+    with zipfile.ZipFile(archive_path) as archive:
+        return archive.read(member)
+
+
+def _day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None).isoformat() + "Z"
+
+
+def fsync_dir(directory: Path) -> None:
+    """Persist a directory's entries (renames and new files) where the platform supports it."""
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _stored_files(directory: Path) -> Iterator[Tuple[Path, float, int]]:
+    """(path, mtime, size) of the finished artifact files in a directory."""
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.name.startswith(".") or entry.name.endswith(_PARTIAL_SUFFIXES) or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            yield Path(entry.path), stat.st_mtime, stat.st_size
+
+
+def _unlink_if_unchanged(path: Path, mtime: float) -> bool:
+    """Remove a file unless it was rewritten since it was listed."""
+    try:
+        if os.stat(path).st_mtime != mtime:
+            return False
+        os.unlink(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+class RetentionManager:
+    """Rotates, archives and expires stored artifacts (see module docstring)."""
+
+    def __init__(self, storage_dir: Path = STORAGE_DIR, config: Optional[Dict[str, Any]] = None):
+        self.storage_dir = Path(storage_dir)
+        self.config = config or load_retention_config()
+        self.archive_dir = self.storage_dir / ARCHIVE_DIR
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.config.get("enabled"))
+
+    def window_days(self, artifact_type: str) -> Optional[float]:
+        """Days to keep an artifact type (None keeps it forever)."""
+        windows = self.config["windows_days"]
+        if artifact_type == "manifest" and "manifest" not in windows:
+            # Manifests outlive every artifact they list
+            kept = [windows.get(t) for t in ("transcript", "decision_log", "receipt")]
+            return None if None in kept else max(kept)
+        return windows.get(artifact_type)
+
+    # Background thread
+
+    def start(self) -> None:
+        """Run passes every interval_seconds in a daemon thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rrva-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the thread (a pass in progress is abandoned at its next chunk of I/O)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        delay = min(STARTUP_DELAY_SECONDS, self.config["interval_seconds"])
+        while not self._stop.wait(delay):
+            try:
+                self.run_once()
+            except RetentionStopped:
+                return
+            except Exception as e:
+                # Keep the thread alive: the next pass may succeed
+                print(f"Warning: retention pass failed: {e!r}")
+            delay = self.config["interval_seconds"]
+
+    # Passes
+
+    def run_once(self, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Run one retention pass.
+
+        Args:
+            dry_run: Only report what would be rotated, archived and deleted
+
+        Returns:
+            Dict with what the pass did, or skipped=True if another process holds the lock
+        """
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.storage_dir / LOCK_FILE, "a") as lock:
+            if FCNTL_AVAILABLE:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return {"skipped": True, "reason": "another process is running a retention pass"}
+            started = time.perf_counter()
+            now = time.time()
+            report: Dict[str, Any] = {
+                "started_at": _iso(now),
+                "dry_run": dry_run,
+                "rotated_traces": [],
+                "expired_files": defaultdict(int),
+                "expired_archives": [],
+                "expired_index_rows": {},
+                "archived_files": defaultdict(int),
+                "archived_bytes": 0,
+                "archives_written": [],
+                "removed_blobs": 0,
+                "relocated_index_rows": {}
+            }
+            limiter = IORateLimiter(self.config["max_io_mb_per_sec"] * 1024 * 1024, self._stop)
+            relocated: Dict[str, Dict[str, str]] = {"decision_log": {}, "transcript": {}}
+
+            self._rotate_traces(now, report, dry_run)
+            self._expire(now, report, dry_run)
+            self._archive_files(now, limiter, relocated, report, dry_run)
+            self._archive_manifests(now, limiter, relocated, report, dry_run)
+            if not dry_run:
+                self._relocate(relocated, report)
+
+            report["expired_files"] = dict(report["expired_files"])
+            report["archived_files"] = dict(report["archived_files"])
+            report["seconds"] = round(time.perf_counter() - started, 3)
+            if not dry_run:
+                self.last_report = report
+            return report
+
+    def _rotate_traces(self, now: float, report: Dict[str, Any], dry_run: bool) -> None:
+        """Move traces.jsonl aside (the exporter opens the file per write, so a rename is safe)."""
+        trace_file = Path(os.getenv("RRVA_TRACE_FILE", self.storage_dir / "traces.jsonl"))
+        try:
+            size = trace_file.stat().st_size
+        except FileNotFoundError:
+            return
+        if size == 0:
+            return
+        segments = [mtime for _, mtime, _ in _stored_files(self.storage_dir / ARTIFACT_DIRS["trace"])]
+        last_rotation = max(segments, default=0.0)
+        if size < self.config["trace_rotate_mb"] * 1024 * 1024 and now - last_rotation < TRACE_ROTATE_SECONDS:
+            return
+        target = self.storage_dir / ARTIFACT_DIRS["trace"] / (
+            f"traces-{datetime.fromtimestamp(now, timezone.utc).strftime('%Y%m%dT%H%M%S')}.jsonl"
+        )
+        report["rotated_traces"].append(str(target))
+        if not dry_run:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(trace_file, target)
+
+    def _expire(self, now: float, report: Dict[str, Any], dry_run: bool) -> None:
+        """Delete files, archives and index rows older than their type's window."""
+        removed: Dict[str, List[str]] = defaultdict(list)
+        for artifact_type, directory in [*ARTIFACT_DIRS.items(), ("manifest", "manifests")]:
+            window = self.window_days(artifact_type)
+            if window is None:
+                continue
+            cutoff = now - window * 86400
+            if artifact_type != "manifest":
+                # Manifests are archived (with their blobs) rather than deleted in place
+                for path, mtime, _ in _stored_files(self.storage_dir / directory):
+                    if mtime < cutoff and (dry_run or _unlink_if_unchanged(path, mtime)):
+                        report["expired_files"][artifact_type] += 1
+                        removed[artifact_type].append(str(path))
+            for path, _, _ in _stored_files(self.archive_dir / directory):
+                if path.suffix == ".zip" and path.name[:10] < _day(cutoff):
+                    report["expired_archives"].append(str(path))
+                    removed[artifact_type].append(f"{path}{ARCHIVE_SEPARATOR}")
+                    if not dry_run:
+                        path.unlink(missing_ok=True)
+        if dry_run:
+            return
+
+        # Rows of removed files and archives, then rows older than the window
+        for name, artifact_type, index in self._indexes():
+            deleted = index.delete_paths(removed[artifact_type]) if removed[artifact_type] else 0
+            window = self.window_days(artifact_type)
+            if window is not None:
+                deleted += index.delete_before(_iso(now - window * 86400))
+            report["expired_index_rows"][name] = deleted
+
+    def _indexes(self) -> List[Tuple[str, str, Any]]:
+        """(name, artifact type, index) of the indexes that exist in the storage directory."""
+        indexes = []
+        for name, artifact_type, filename, cls in (
+            ("decisions", "decision_log", "audit_index.db", AuditIndex),
+            ("transcripts", "transcript", "transcript_index.db", TranscriptIndex)
+        ):
+            if (self.storage_dir / filename).exists():
+                indexes.append((name, artifact_type, cls(self.storage_dir / filename)))
+        return indexes
+
+    def _write_archive(self, directory: Path, day: str, members: List[Tuple[Path, str]], limiter: IORateLimiter) -> Path:
+        """Write files into a new zip for a day: temporary name, fsync, then rename into place."""
+        directory.mkdir(parents=True, exist_ok=True)
+        n = 0
+        while (directory / f"{day}-{n}.zip").exists():
+            n += 1
+        path = directory / f"{day}-{n}.zip"
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        try:
+            with zipfile.ZipFile(tmp_path, "w") as archive:
+                for source, name in members:
+                    info = zipfile.ZipInfo.from_file(source, name)
+                    stored = directory.name == ARTIFACT_DIRS["audio"] or source.name.endswith(_COMPRESSED_SUFFIXES)
+                    info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+                    with open(source, "rb") as src, archive.open(info, "w") as dst:
+                        while True:
+                            chunk = src.read(COPY_CHUNK)
+                            if not chunk:
+                                break
+                            limiter.consume(2 * len(chunk))
+                            dst.write(chunk)
+            with open(tmp_path, "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            fsync_dir(directory)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return path
+
+    def _archive_files(
+        self,
+        now: float,
+        limiter: IORateLimiter,
+        relocated: Dict[str, Dict[str, str]],
+        report: Dict[str, Any],
+        dry_run: bool
+    ) -> None:
+        """Roll each type's files older than archive_after_days into per-day zips."""
+        cutoff = now - self.config["archive_after_days"] * 86400
+        for artifact_type, directory in ARTIFACT_DIRS.items():
+            by_day: Dict[str, List[Tuple[Path, float, int]]] = defaultdict(list)
+            for path, mtime, size in _stored_files(self.storage_dir / directory):
+                if mtime < cutoff:
+                    by_day[_day(mtime)].append((path, mtime, size))
+            for day, files in sorted(by_day.items()):
+                report["archived_files"][artifact_type] += len(files)
+                report["archived_bytes"] += sum(size for _, _, size in files)
+                if dry_run:
+                    continue
+                archive = self._write_archive(
+                    self.archive_dir / directory, day, [(path, path.name) for path, _, _ in files], limiter
+                )
+                report["archives_written"].append(str(archive))
+                for path, mtime, _ in files:
+                    if _unlink_if_unchanged(path, mtime) and artifact_type in relocated:
+                        relocated[artifact_type][str(path)] = f"{archive}{ARCHIVE_SEPARATOR}{path.name}"
+
+    def _archive_manifests(
+        self,
+        now: float,
+        limiter: IORateLimiter,
+        relocated: Dict[str, Dict[str, str]],
+        report: Dict[str, Any],
+        dry_run: bool
+    ) -> None:
+        """Archive idle session manifests with their blobs, then remove blobs no live manifest lists."""
+        manifest_dir = self.storage_dir / "manifests"
+        blob_dir = self.storage_dir / "blobs"
+        cutoff = now - self.config["archive_after_days"] * 86400
+        live = set()
+        expired: Dict[str, List[Tuple[Path, float, Dict[str, Any]]]] = defaultdict(list)
+        for path, mtime, _ in _stored_files(manifest_dir):
+            try:
+                with open(path) as f:
+                    artifacts = json.load(f).get("artifacts", [])
+            except (OSError, ValueError):
+                continue
+            if mtime < cutoff:
+                expired[_day(mtime)].append((path, mtime, artifacts))
+            else:
+                live.update(entry["sha256"] for entry in artifacts)
+
+        for day, manifests in sorted(expired.items()):
+            blobs: Dict[str, Dict[str, Path]] = defaultdict(dict)
+            for _, _, artifacts in manifests:
+                for entry in artifacts:
+                    digest = entry["sha256"]
+                    blob_path = next((blob_dir / digest[:2]).glob(f"{digest}.json*"), None)
+                    if blob_path is not None and entry.get("type") in ARTIFACT_DIRS:
+                        blobs[entry["type"]][digest] = blob_path
+            report["archived_files"]["manifest"] += len(manifests)
+            for artifact_type, paths in blobs.items():
+                report["archived_files"][artifact_type] += len(paths)
+                report["archived_bytes"] += sum(os.path.getsize(path) for path in paths.values())
+            if dry_run:
+                continue
+
+            archived_blobs: Dict[str, str] = {}
+            for artifact_type, paths in blobs.items():
+                members = [(path, f"blobs/{path.parent.name}/{path.name}") for path in paths.values()]
+                archive = self._write_archive(self.archive_dir / ARTIFACT_DIRS[artifact_type], day, members, limiter)
+                report["archives_written"].append(str(archive))
+                for path, member in members:
+                    archived_blobs[str(path)] = f"{archive}{ARCHIVE_SEPARATOR}{member}"
+            archive = self._write_archive(
+                self.archive_dir / "manifests", day,
+                [(path, f"manifests/{path.name}") for path, _, _ in manifests], limiter
+            )
+            report["archives_written"].append(str(archive))
+
+            for path, mtime, artifacts in manifests:
+                # Under the manifest lock, so a concurrent store either lands first (and is seen) or after
+                with manifest_lock(path):
+                    unlinked = _unlink_if_unchanged(path, mtime)
+                if not unlinked:
+                    # Stored to again since it was listed: its blobs are live
+                    live.update(entry["sha256"] for entry in artifacts)
+            for artifact_type, paths in blobs.items():
+                for digest, path in paths.items():
+                    if digest in live:
+                        continue
+                    try:
+                        mtime = os.stat(path).st_mtime
+                    except FileNotFoundError:
+                        continue
+                    if mtime < cutoff and _unlink_if_unchanged(path, mtime):
+                        report["removed_blobs"] += 1
+                        if artifact_type in relocated:
+                            relocated[artifact_type][str(path)] = archived_blobs[str(path)]
+
+    def _relocate(self, relocated: Dict[str, Dict[str, str]], report: Dict[str, Any]) -> None:
+        """Point index rows of archived files at their archive members."""
+        for name, artifact_type, index in self._indexes():
+            items = list(relocated[artifact_type].items())
+            if not items:
+                continue
+            report["relocated_index_rows"][name] = sum(
+                index.relocate(dict(items[i:i + RELOCATE_BATCH])) for i in range(0, len(items), RELOCATE_BATCH)
+            )
+
+    # Status
+
+    def status(self) -> Dict[str, Any]:
+        """Files and archives per artifact type, with the configuration and the last pass."""
+        types = {}
+        for artifact_type, directory in [*ARTIFACT_DIRS.items(), ("manifest", "manifests")]:
+            files = list(_stored_files(self.storage_dir / directory))
+            archives = [f for f in _stored_files(self.archive_dir / directory) if f[0].suffix == ".zip"]
+            types[artifact_type] = {
+                "files": len(files),
+                "file_bytes": sum(size for _, _, size in files),
+                "oldest_file": _iso(min(mtime for _, mtime, _ in files)) if files else None,
+                "archives": len(archives),
+                "archive_bytes": sum(size for _, _, size in archives),
+                "oldest_archive": min(path.name[:10] for path, _, _ in archives) if archives else None,
+                "window_days": self.window_days(artifact_type)
+            }
+        return {
+            "storage_dir": str(self.storage_dir),
+            "config": self.config,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "types": types,
+            "last_pass": self.last_report,
+            "retrieved_at": datetime.utcnow().isoformat() + "Z"
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rotate, archive and expire stored audit artifacts")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    run = subcommands.add_parser("run", help="Run one retention pass")
+    run.add_argument("--storage", default=str(STORAGE_DIR), help="Storage directory")
+    run.add_argument("--dry-run", action="store_true", help="Report what would change without changing it")
+    status = subcommands.add_parser("status", help="Show files and archives per artifact type")
+    status.add_argument("--storage", default=str(STORAGE_DIR), help="Storage directory")
+    args = parser.parse_args()
+
+    manager = RetentionManager(Path(args.storage))
+    if args.command == "run":
+        print(json.dumps(manager.run_once(dry_run=args.dry_run), indent=2))
+    else:
+        print(json.dumps(manager.status(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+"""
+Shared State Backends
+Key/value storage for state that must be visible to every server worker:
+pending OTPs and executed refunds.
+
+Backends implement a small Redis-compatible subset (get/set with TTL/delete,
+set-if-absent, atomic counters, prefix scans). The available backends are:
+- memory: in-process dict, the default for a single worker (also the test fake)
+- sqlite: a WAL-mode SQLite file shared by all workers on one host
+- redis: any Redis-compatible server (needs the optional `redis` package)
+
+Services use StateMap, a dict-like view of one namespace with JSON-encoded
+values. Code written against plain dicts keeps working. Values are copies:
+after changing a value read from a StateMap, assign it back. Read-modify-write
+races between workers are avoided with increment() and add() (set-if-absent,
+for claiming a key), which every backend applies atomically.
+
+Configuration (environment):
+    RRVA_STATE_BACKEND   memory (default), sqlite or redis
+    RRVA_STATE_PATH      SQLite file (default storage/state.db)
+    RRVA_REDIS_URL       Redis URL (default redis://localhost:6379/0)
+"""
+
+from typing import Any, Dict, Iterator, List, MutableMapping, Optional, Tuple
+from abc import ABC, abstractmethod
+from pathlib import Path
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from tools.paths import STORAGE_DIR
+
+# Redis client (optional, only needed for RRVA_STATE_BACKEND=redis)
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+DEFAULT_STATE_PATH = STORAGE_DIR / "state.db"
+DEFAULT_REDIS_URL = "redis://localhost:6379/0"
+
+
+class StateBackend(ABC):
+    """Interface shared by the state backends (string keys and values)."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        ...
+
+    def set_many(self, items: List[Tuple[str, str]], ttl: Optional[float] = None) -> None:
+        for key, value in items:
+            self.set(key, value, ttl)
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """Atomically set key only if it is missing (or expired); True if it was set."""
+
+    @abstractmethod
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """
+        Atomically add amount to an integer value and return the new value.
+
+        A missing (or expired) key starts at 0, and ttl applies from its creation.
+        """
+
+    def exists(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    @abstractmethod
+    def keys(self, prefix: str) -> List[str]:
+        ...
+
+    def count(self, prefix: str) -> int:
+        return len(self.keys(prefix))
+
+    def flush(self) -> None:
+        """Make completed writes durable (at shutdown). Nothing to do by default."""
+
+
+class InMemoryBackend(StateBackend):
+    """Process-local backend; also the fake used in tests and single-worker mode."""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[str, Optional[float]]] = {}
+
+    def _live(self, key: str) -> Optional[str]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, key: str) -> Optional[str]:
+        return self._live(key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self._data[key] = (value, time.time() + ttl if ttl else None)
+
+    def delete(self, key: str) -> bool:
+        return self._data.pop(key, None) is not None
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        if self._live(key) is not None:
+            return False
+        self.set(key, value, ttl)
+        return True
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        current = self._live(key)
+        if current is None:
+            value = amount
+            expires_at = time.time() + ttl if ttl else None
+        else:
+            value = int(current) + amount
+            expires_at = self._data[key][1]
+        self._data[key] = (str(value), expires_at)
+        return value
+
+    def keys(self, prefix: str) -> List[str]:
+        return [key for key in list(self._data) if key.startswith(prefix) and self._live(key) is not None]
+
+
+class SQLiteBackend(StateBackend):
+    """
+    Backend in a SQLite database file shared by every worker process.
+
+    WAL mode lets readers proceed while a worker writes; busy_timeout makes
+    concurrent writers wait instead of failing. Each process (and thread)
+    opens its own connection.
+    """
+
+    # Purge expired rows every this many writes
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: Path = DEFAULT_STATE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, isolation_level=None, timeout=5.0)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _after_write(self, count: int = 1) -> None:
+        self._writes += count
+        if self._writes >= self.PURGE_EVERY:
+            self._writes = 0
+            self._connection().execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+    def flush(self) -> None:
+        self._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self._connection().execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl if ttl else None)
+        )
+        self._after_write()
+
+    def set_many(self, items: List[Tuple[str, str]], ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                [(key, value, expires_at) for key, value in items]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        self._after_write(len(items))
+
+    def delete(self, key: str) -> bool:
+        cursor = self._connection().execute("DELETE FROM kv WHERE key = ?", (key,))
+        return cursor.rowcount > 0
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        # One statement: inserts, or replaces only an expired row
+        cursor = self._connection().execute(
+            """
+            INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at
+                WHERE kv.expires_at IS NOT NULL AND kv.expires_at <= ?
+            """,
+            (key, value, now + ttl if ttl else None, now)
+        )
+        self._after_write()
+        return cursor.rowcount > 0
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.time()
+        # One statement, so concurrent workers cannot lose an increment; an expired row restarts at amount
+        row = self._connection().execute(
+            """
+            INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                value = CASE WHEN kv.expires_at IS NOT NULL AND kv.expires_at <= ?
+                    THEN excluded.value ELSE CAST(kv.value AS INTEGER) + excluded.value END,
+                expires_at = CASE WHEN kv.expires_at IS NOT NULL AND kv.expires_at <= ?
+                    THEN excluded.expires_at ELSE kv.expires_at END
+            RETURNING value
+            """,
+            (key, amount, now + ttl if ttl else None, now, now)
+        ).fetchone()
+        self._after_write()
+        return int(row[0])
+
+    def _prefix_range(self, prefix: str) -> Tuple[str, str, float]:
+        # Keys starting with prefix sort in [prefix, prefix + U+10FFFF)
+        return prefix, prefix + "\U0010ffff", time.time()
+
+    def keys(self, prefix: str) -> List[str]:
+        rows = self._connection().execute(
+            "SELECT key FROM kv WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?)",
+            self._prefix_range(prefix)
+        )
+        return [row[0] for row in rows]
+
+    def count(self, prefix: str) -> int:
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM kv WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?)",
+            self._prefix_range(prefix)
+        ).fetchone()[0]
+
+
+class RedisBackend(StateBackend):
+    """Backend on a Redis-compatible server."""
+
+    def __init__(self, url: str = DEFAULT_REDIS_URL):
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("RRVA_STATE_BACKEND=redis requires the redis package (pip install redis)")
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._client.get(key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self._client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    def set_many(self, items: List[Tuple[str, str]], ttl: Optional[float] = None) -> None:
+        pipeline = self._client.pipeline(transaction=False)
+        for key, value in items:
+            pipeline.set(key, value, px=int(ttl * 1000) if ttl else None)
+        pipeline.execute()
+
+    def delete(self, key: str) -> bool:
+        return bool(self._client.delete(key))
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        return bool(self._client.set(key, value, px=int(ttl * 1000) if ttl else None, nx=True))
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        pipeline = self._client.pipeline(transaction=True)
+        if ttl:
+            # Creates the key with its expiry only if it does not exist yet
+            pipeline.set(key, 0, px=int(ttl * 1000), nx=True)
+        pipeline.incrby(key, amount)
+        return int(pipeline.execute()[-1])
+
+    def exists(self, key: str) -> bool:
+        return bool(self._client.exists(key))
+
+    def keys(self, prefix: str) -> List[str]:
+        return list(self._client.scan_iter(match=f"{prefix}*", count=1000))
+
+
+class StateMap(MutableMapping):
+    """Dict-like view of one namespace of a backend, with JSON values."""
+
+    def __init__(self, backend: StateBackend, namespace: str, ttl: Optional[float] = None):
+        self.backend = backend
+        self.prefix = f"rrva:{namespace}:"
+        self.ttl = ttl
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.backend.get(self.prefix + key)
+        if value is None:
+            raise KeyError(key)
+        return json.loads(value)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.backend.get(self.prefix + key)
+        return json.loads(value) if value is not None else default
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.backend.set(self.prefix + key, json.dumps(value), self.ttl)
+
+    def __delitem__(self, key: str) -> None:
+        if not self.backend.delete(self.prefix + key):
+            raise KeyError(key)
+
+    def pop(self, key: str, *default: Any) -> Any:
+        """Remove and return an entry; never fails if another worker removed it first."""
+        value = self.backend.get(self.prefix + key)
+        self.backend.delete(self.prefix + key)
+        if value is None:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        return json.loads(value)
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self.backend.exists(self.prefix + key)
+
+    def __iter__(self) -> Iterator[str]:
+        start = len(self.prefix)
+        return iter([key[start:] for key in self.backend.keys(self.prefix)])
+
+    def __len__(self) -> int:
+        return self.backend.count(self.prefix)
+
+    def add(self, key: str, value: Any) -> bool:
+        """Atomically store an entry only if it is missing; False if another writer has it."""
+        return self.backend.add(self.prefix + key, json.dumps(value), self.ttl)
+
+    def increment(self, key: str, amount: int = 1) -> int:
+        """Atomically add to an integer entry (0 if missing) and return the new value."""
+        return self.backend.incr(self.prefix + key, amount, self.ttl)
+
+    def update(self, other=(), **kwargs) -> None:
+        """Write many entries at once (one transaction/pipeline where the backend supports it)."""
+        items = dict(other, **kwargs)
+        self.backend.set_many([(self.prefix + key, json.dumps(value)) for key, value in items.items()], self.ttl)
+
+
+_backend: Optional[StateBackend] = None
+
+
+def get_backend() -> StateBackend:
+    """Return the process-wide backend selected by RRVA_STATE_BACKEND."""
+    global _backend
+    if _backend is None:
+        kind = os.getenv("RRVA_STATE_BACKEND", "memory")
+        if kind == "sqlite":
+            _backend = SQLiteBackend(Path(os.getenv("RRVA_STATE_PATH", str(DEFAULT_STATE_PATH))))
+        elif kind == "redis":
+            _backend = RedisBackend(os.getenv("RRVA_REDIS_URL", DEFAULT_REDIS_URL))
+        elif kind == "memory":
+            _backend = InMemoryBackend()
+        else:
+            raise ValueError(f"Unknown RRVA_STATE_BACKEND: {kind}")
+    return _backend
+
+
+def flush() -> None:
+    """Flush the process-wide backend, if one was opened."""
+    if _backend is not None:
+        _backend.flush()
+
+
+def state_map(namespace: str, ttl: Optional[float] = None) -> StateMap:
+    """Return a dict-like view of one namespace in the configured backend."""
+    return StateMap(get_backend(), namespace, ttl)
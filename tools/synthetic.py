@@ -0,0 +1,337 @@
+"""
+Synthetic Dataset Generator
+Deterministic, seeded generator that scales customers, orders, line items and
+transactions to production size.
+
+Every customer is generated from its own RNG (seed + customer index), so the
+dataset is identical no matter how it is sharded across worker processes.
+Records are streamed: shards are written as JSONL files one customer at a
+time, and load_dataset() streams them back into the in-memory stores read by
+the services.
+
+Usage:
+    python -m tools.synthetic --customers 1000000 --out data/synthetic --workers 8
+    RRVA_DATASET_DIR=data/synthetic python mcp_server_http.py
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+import argparse
+import json
+import os
+import random
+import time
+
+from tools.identity import register_customer
+from tools.orders import register_order, register_transaction
+
+# Shape of the generated data
+FIRST_NAMES = [
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda",
+    "David", "Elizabeth", "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica",
+    "Thomas", "Sarah", "Carlos", "Karen", "Priya", "Wei", "Aisha", "Mateo",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson",
+    "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee", "Patel", "Chen", "Nguyen",
+]
+# Reserved example domains (RFC 2606), so generated addresses can never reach a real inbox
+EMAIL_DOMAINS = ["example.com", "example.org", "example.net"]
+PRODUCTS = [
+    ("Wireless Headphones", 99.99), ("USB-C Cable", 12.99), ("Phone Case", 24.99),
+    ("Smart Watch", 299.99), ("Bluetooth Speaker", 79.99), ("Laptop Stand", 49.99),
+    ("Mechanical Keyboard", 129.99), ("Wireless Mouse", 39.99), ("Webcam", 89.99),
+    ("Monitor", 249.99), ("Tablet", 399.99), ("Charging Dock", 59.99),
+    ("Fitness Tracker", 149.99), ("Portable SSD", 119.99), ("Noise Cancelling Earbuds", 199.99),
+]
+CITIES = [
+    ("New York", "NY", "10001"), ("Los Angeles", "CA", "90001"), ("Chicago", "IL", "60601"),
+    ("Houston", "TX", "77001"), ("Phoenix", "AZ", "85001"), ("Seattle", "WA", "98101"),
+    ("Denver", "CO", "80201"), ("Miami", "FL", "33101"), ("Boston", "MA", "02101"),
+]
+# (value, weight) mixes
+CONDITION_MIX = [("unopened", 62), ("used", 20), ("defective", 9), ("wrong_item", 4), ("damaged", 5)]
+STATUS_MIX = [("delivered", 86), ("shipped", 6), ("pending", 3), ("returned", 5)]
+# Monthly order volume weights (Jan..Dec): holiday peak, summer dip
+MONTH_WEIGHTS = [8, 6, 7, 7, 8, 7, 6, 7, 8, 9, 13, 14]
+
+# Orders per customer follow a Pareto distribution: most customers have a
+# handful of orders, a few heavy hitters have thousands
+PARETO_ALPHA = 1.3
+MAX_ORDERS_PER_CUSTOMER = 5000
+MAX_ITEMS_PER_ORDER = 8
+
+
+def _weighted(mix: List[Tuple[str, int]]) -> Tuple[List[str], List[int]]:
+    return [value for value, _ in mix], [weight for _, weight in mix]
+
+
+_CONDITIONS, _CONDITION_WEIGHTS = _weighted(CONDITION_MIX)
+_STATUSES, _STATUS_WEIGHTS = _weighted(STATUS_MIX)
+
+
+def _order_date(rng: random.Random, start: datetime, days: int) -> datetime:
+    """Pick an order timestamp: seasonal month mix, recent years weighted higher."""
+    while True:
+        offset = int(days * (rng.random() ** 0.7))  # skew towards the end of the range
+        date = start + timedelta(days=offset)
+        # Accept/reject on the month weight to shape seasonality
+        if rng.random() * max(MONTH_WEIGHTS) <= MONTH_WEIGHTS[date.month - 1]:
+            break
+    # Daytime-heavy hour distribution
+    hour = min(23, max(0, int(rng.gauss(14, 4))))
+    return date.replace(hour=hour, minute=rng.randrange(60), second=rng.randrange(60))
+
+
+def generate_customer(
+    index: int,
+    seed: int = 42,
+    start_date: str = "2023-01-01",
+    days: int = 1000
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Generate one customer with their orders and transactions.
+
+    Args:
+        index: Customer index (determines the IDs and the RNG stream)
+        seed: Dataset seed
+        start_date: First possible order date (YYYY-mm-dd)
+        days: Length of the order date range in days
+
+    Returns:
+        (customer, orders, transactions)
+    """
+    rng = random.Random(f"{seed}:{index}")
+    start = datetime.fromisoformat(start_date)
+    customer_id = f"CUST{index:08d}"
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    last_four = f"{rng.randrange(10000):04d}"
+    city, state, zip_code = rng.choice(CITIES)
+    address = {
+        "street": f"{rng.randint(1, 9999)} {rng.choice(LAST_NAMES)} St",
+        "city": city,
+        "state": state,
+        "zip": zip_code
+    }
+
+    order_count = min(MAX_ORDERS_PER_CUSTOMER, int(rng.paretovariate(PARETO_ALPHA)))
+    orders = []
+    transactions = []
+    for n in range(order_count):
+        order_id = f"ORD{index:08d}{n:04d}"
+        order_date = _order_date(rng, start, days)
+        status = rng.choices(_STATUSES, _STATUS_WEIGHTS)[0]
+        items = []
+        for i in range(min(MAX_ITEMS_PER_ORDER, int(rng.expovariate(0.6)) + 1)):
+            product_name, list_price = rng.choice(PRODUCTS)
+            items.append({
+                "item_id": f"ITEM{index:08d}{n:04d}{i:02d}",
+                "product_name": product_name,
+                "quantity": 1 if rng.random() < 0.8 else rng.randint(2, 4),
+                "price": round(list_price * rng.uniform(0.8, 1.1), 2),
+                "condition": rng.choices(_CONDITIONS, _CONDITION_WEIGHTS)[0],
+                "fulfillment_status": status
+            })
+        total = round(sum(item["price"] * item["quantity"] for item in items), 2)
+        orders.append({
+            "order_id": order_id,
+            "customer_id": customer_id,
+            "order_date": order_date.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "status": status,
+            "total_amount": total,
+            "currency": "USD",
+            "items": items,
+            "shipping_address": address,
+            "payment_method": "card",
+            "last_four": last_four
+        })
+
+        charged_at = order_date + timedelta(seconds=rng.randint(5, 120))
+        transactions.append({
+            "transaction_id": f"TXN{index:08d}{n:04d}0",
+            "order_id": order_id,
+            "type": "charge",
+            "amount": total,
+            "currency": "USD",
+            "status": "completed",
+            "timestamp": charged_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "payment_method": "card",
+            "last_four": last_four
+        })
+        if status == "returned":
+            refunded_at = charged_at + timedelta(days=rng.randint(3, 40))
+            transactions.append({
+                "transaction_id": f"TXN{index:08d}{n:04d}1",
+                "order_id": order_id,
+                "type": "refund",
+                "amount": -total,
+                "currency": "USD",
+                "status": "completed",
+                "timestamp": refunded_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "payment_method": "card",
+                "last_four": last_four
+            })
+
+    customer = {
+        "customer_id": customer_id,
+        "email": f"{first.lower()}.{last.lower()}{index}@{rng.choice(EMAIL_DOMAINS)}",
+        "phone": f"+1-555-{rng.randrange(10000):04d}",
+        "name": f"{first} {last}",
+        "orders": [order["order_id"] for order in orders],
+        "last_four": last_four
+    }
+    return customer, orders, transactions
+
+
+def iter_customers(
+    start: int,
+    stop: int,
+    seed: int = 42
+) -> Iterator[Tuple[Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]]]]:
+    """Stream (customer, orders, transactions) for customer indexes [start, stop)."""
+    for index in range(start, stop):
+        yield generate_customer(index, seed)
+
+
+def write_shard(
+    out_dir: str,
+    shard: int,
+    start: int,
+    stop: int,
+    seed: int = 42
+) -> Dict[str, int]:
+    """
+    Write one shard as customers/orders/transactions JSONL files.
+
+    Returns:
+        Dict with record counts for the shard
+    """
+    out = Path(out_dir)
+    counts = {"customers": 0, "orders": 0, "items": 0, "transactions": 0}
+    with open(out / f"customers-{shard:05d}.jsonl", "w") as customers_file, \
+            open(out / f"orders-{shard:05d}.jsonl", "w") as orders_file, \
+            open(out / f"transactions-{shard:05d}.jsonl", "w") as transactions_file:
+        for customer, orders, transactions in iter_customers(start, stop, seed):
+            customers_file.write(json.dumps(customer) + "\n")
+            for order in orders:
+                orders_file.write(json.dumps(order) + "\n")
+                counts["items"] += len(order["items"])
+            for transaction in transactions:
+                transactions_file.write(json.dumps(transaction) + "\n")
+            counts["customers"] += 1
+            counts["orders"] += len(orders)
+            counts["transactions"] += len(transactions)
+    return counts
+
+
+def write_dataset(
+    out_dir: str,
+    customers: int,
+    seed: int = 42,
+    workers: Optional[int] = None,
+    shard_size: int = 50000
+) -> Dict[str, Any]:
+    """
+    Generate a dataset in parallel, one process per shard.
+
+    Args:
+        out_dir: Output directory (created if missing)
+        customers: Number of customers to generate
+        seed: Dataset seed
+        workers: Worker processes (default: CPU count)
+        shard_size: Customers per shard file
+
+    Returns:
+        Dict with total record counts and generation time
+    """
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    shards = [
+        (shard, start, min(start + shard_size, customers))
+        for shard, start in enumerate(range(0, customers, shard_size))
+    ]
+    totals = {"customers": 0, "orders": 0, "items": 0, "transactions": 0}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [
+            pool.submit(write_shard, out_dir, shard, start, stop, seed)
+            for shard, start, stop in shards
+        ]
+        for future in futures:
+            for key, value in future.result().items():
+                totals[key] += value
+
+    manifest = {
+        "seed": seed,
+        "shards": len(shards),
+        "counts": totals,
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "elapsed_seconds": round(time.perf_counter() - started, 3)
+    }
+    with open(Path(out_dir) / "manifest.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_customers(customers: int, seed: int = 42, start: int = 0) -> Dict[str, int]:
+    """Generate customers directly into the in-memory stores (no files)."""
+    counts = {"customers": 0, "orders": 0, "transactions": 0}
+    for customer, orders, transactions in iter_customers(start, start + customers, seed):
+        for order in orders:
+            register_order(order)
+        for transaction in transactions:
+            register_transaction(transaction)
+        register_customer(customer)
+        counts["customers"] += 1
+        counts["orders"] += len(orders)
+        counts["transactions"] += len(transactions)
+    return counts
+
+
+def _read_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_dataset(directory: str) -> Dict[str, int]:
+    """
+    Stream a generated dataset from JSONL shards into the in-memory stores.
+
+    Orders are registered before transactions so transactions can be
+    indexed by customer.
+    """
+    path = Path(directory)
+    counts = {"customers": 0, "orders": 0, "transactions": 0}
+    for orders_file in sorted(path.glob("orders-*.jsonl")):
+        shard = orders_file.stem.split("-", 1)[1]
+        for order in _read_jsonl(orders_file):
+            register_order(order)
+            counts["orders"] += 1
+        for transaction in _read_jsonl(path / f"transactions-{shard}.jsonl"):
+            register_transaction(transaction)
+            counts["transactions"] += 1
+        for customer in _read_jsonl(path / f"customers-{shard}.jsonl"):
+            register_customer(customer)
+            counts["customers"] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic RRVA dataset")
+    parser.add_argument("--customers", type=int, default=100000, help="Number of customers")
+    parser.add_argument("--out", required=True, help="Output directory for JSONL shards")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--shard-size", type=int, default=50000, help="Customers per shard")
+    args = parser.parse_args()
+
+    manifest = write_dataset(args.out, args.customers, args.seed, args.workers, args.shard_size)
+    print(json.dumps(manifest, indent=2))
+
+
+if __name__ == "__main__":
+    main()
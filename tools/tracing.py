@@ -0,0 +1,391 @@
+"""
+Request Tracing
+Lightweight spans for tool calls and the store, policy, email and audit work
+they do, exported as JSON lines or as OTLP/JSON to a collector.
+
+The current span lives in a contextvar. Child spans therefore nest
+correctly across awaits, and concurrent calls on the same event loop never
+see each other's spans. The sampling decision is made once, when a trace's
+root span starts. Spans of unsampled traces are no-ops, so with the default
+sample rate of 0 the cost is one contextvar lookup per span.
+
+Configuration (environment):
+    RRVA_TRACE_SAMPLE_RATE     Fraction of traces to record, 0.0-1.0 (default 0)
+    RRVA_TRACE_EXPORTER        "jsonl" (default) or "otlp"
+    RRVA_TRACE_FILE            JSONL output path (default storage/traces.jsonl)
+    RRVA_TRACE_OTLP_ENDPOINT   OTLP/HTTP JSON endpoint (default http://localhost:4318/v1/traces)
+
+Local collector stub (writes received OTLP spans as JSON lines):
+    python -m tools.tracing --port 4318 --output storage/traces.jsonl
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+from contextvars import ContextVar
+from pathlib import Path
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+from tools.paths import STORAGE_DIR
+
+DEFAULT_TRACE_FILE = STORAGE_DIR / "traces.jsonl"
+DEFAULT_OTLP_ENDPOINT = "http://localhost:4318/v1/traces"
+SERVICE_NAME = "rrva-mcp-server"
+
+
+class Span:
+    """One timed operation within a trace."""
+
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_id", "attributes",
+        "start_ns", "end_ns", "status", "_started", "_root", "_finished"
+    )
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        if parent is None:
+            self.trace_id = f"{random.getrandbits(128):032x}"
+            self.parent_id = None
+            self._root = self
+            self._finished: List["Span"] = []
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+            self._root = parent._root
+        self.attributes = attributes
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self._started = time.perf_counter_ns()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_ns,
+            "duration_ms": round(self.duration_ms, 4),
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+
+class _NoopSpan:
+    """Stand-in yielded for unsampled traces."""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+# Current span; _NOOP while inside an unsampled trace
+_current_span: ContextVar[Any] = ContextVar("rrva_current_span", default=None)
+
+
+class JsonlExporter:
+    """Appends finished spans to a JSON lines file, one trace at a time."""
+
+    def __init__(self, path: Path = DEFAULT_TRACE_FILE):
+        self.path = Path(path)
+
+    def export(self, spans: List[Span]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write("".join(json.dumps(span.to_dict()) + "\n" for span in spans))
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans: List[Span]) -> Dict[str, Any]:
+    """Build an OTLP/JSON ExportTraceServiceRequest body."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": "rrva.tracing"},
+                "spans": [
+                    {
+                        "traceId": span.trace_id,
+                        "spanId": span.span_id,
+                        "parentSpanId": span.parent_id or "",
+                        "name": span.name,
+                        "kind": 1,
+                        "startTimeUnixNano": str(span.start_ns),
+                        "endTimeUnixNano": str(span.end_ns),
+                        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+                        "status": {"code": 2 if span.status == "error" else 1}
+                    }
+                    for span in spans
+                ]
+            }]
+        }]
+    }
+
+
+class OtlpExporter:
+    """
+    Posts traces as OTLP/HTTP JSON from a background thread.
+
+    export() only enqueues, so the event loop never waits on the collector.
+    Traces are dropped when the queue is full or the collector is unreachable.
+    """
+
+    def __init__(self, endpoint: str = DEFAULT_OTLP_ENDPOINT, max_queue: int = 1000, timeout: float = 2.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.dropped = 0
+        self._queue: "queue.Queue[List[Span]]" = queue.Queue(maxsize=max_queue)
+        threading.Thread(target=self._run, name="rrva-otlp-exporter", daemon=True).start()
+
+    def export(self, spans: List[Span]) -> None:
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        import urllib.request
+
+        while True:
+            spans = self._queue.get()
+            request = urllib.request.Request(
+                self.endpoint,
+                data=json.dumps(to_otlp(spans)).encode(),
+                headers={"Content-Type": "application/json"}
+            )
+            try:
+                urllib.request.urlopen(request, timeout=self.timeout).close()
+            except OSError:
+                self.dropped += 1
+            finally:
+                self._queue.task_done()
+
+    def flush(self, timeout: float = 5.0) -> int:
+        """Wait (up to timeout) for queued traces to be posted; returns how many are still queued."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self._queue.unfinished_tasks
+
+
+class Tracer:
+    """Creates spans and hands each finished, sampled trace to the exporter."""
+
+    def __init__(self, sample_rate: float = 0.0, exporter=None):
+        self.sample_rate = sample_rate
+        self.exporter = exporter or JsonlExporter()
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        """Configure sampling and export from RRVA_TRACE_* environment variables."""
+        sample_rate = float(os.getenv("RRVA_TRACE_SAMPLE_RATE", "0") or 0)
+        if os.getenv("RRVA_TRACE_EXPORTER", "jsonl") == "otlp":
+            exporter = OtlpExporter(os.getenv("RRVA_TRACE_OTLP_ENDPOINT", DEFAULT_OTLP_ENDPOINT))
+        else:
+            exporter = JsonlExporter(Path(os.getenv("RRVA_TRACE_FILE", str(DEFAULT_TRACE_FILE))))
+        return cls(sample_rate=sample_rate, exporter=exporter)
+
+    def flush(self, timeout: float = 5.0) -> int:
+        """Send queued traces before shutdown; returns how many were left unsent."""
+        flush = getattr(self.exporter, "flush", None)
+        return flush(timeout) if flush is not None else 0
+
+    def span(self, name: str, **attributes: Any):
+        """
+        Time a block as a span (a new trace if no span is active).
+
+        Use as a context manager; it yields the span, or a no-op stand-in when
+        the trace is not sampled.
+        """
+        parent = _current_span.get()
+        if parent is _NOOP:
+            return _NOOP_SCOPE
+        if parent is None:
+            if self.sample_rate <= 0.0:
+                return _NOOP_SCOPE
+            if not self._sample():
+                return _UnsampledScope()
+        return _SpanScope(self, name, parent, attributes)
+
+    def _sample(self) -> bool:
+        rate = self.sample_rate
+        return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+    def _finish(self, span: Span) -> None:
+        span.end_ns = span.start_ns + (time.perf_counter_ns() - span._started)
+        root = span._root
+        root._finished.append(span)
+        if span is root:
+            try:
+                self.exporter.export(root._finished)
+            except OSError:
+                pass
+
+
+class _SpanScope:
+    """Context manager that makes a recorded span current for its block."""
+
+    __slots__ = ("tracer", "span", "token")
+
+    def __init__(self, tracer: Tracer, name: str, parent: Optional[Span], attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.span = Span(name, parent, attributes)
+
+    def __enter__(self) -> Span:
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.span.status = "error"
+            self.span.attributes["error"] = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self.token)
+        self.tracer._finish(self.span)
+
+
+class _UnsampledScope:
+    """Marks a whole unsampled trace so its child spans stay no-ops."""
+
+    __slots__ = ("token",)
+
+    def __enter__(self) -> _NoopSpan:
+        self.token = _current_span.set(_NOOP)
+        return _NOOP
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _current_span.reset(self.token)
+
+
+class _NoopScope:
+    """Shared context manager for spans that are not recorded."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> _NoopSpan:
+        return _NOOP
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP_SCOPE = _NoopScope()
+
+tracer = Tracer.from_env()
+
+
+def span(name: str, **attributes: Any):
+    """Time a block as a span of the current trace (see Tracer.span)."""
+    return tracer.span(name, **attributes)
+
+
+def current_span():
+    """Return the active span (None outside a trace, a no-op stand-in if unsampled)."""
+    return _current_span.get()
+
+
+def traced(name: str) -> Callable:
+    """Decorator that runs a function (sync or async) inside a span."""
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracingMiddleware:
+    """ASGI middleware that opens a root span per HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with tracer.span(f"{scope['method']} {scope['path']}", **{"http.method": scope["method"]}) as request_span:
+            if request_span is _NOOP:
+                await self.app(scope, receive, send)
+                return
+
+            async def traced_send(message):
+                if message["type"] == "http.response.start":
+                    request_span.set_attribute("http.status_code", message["status"])
+                await send(message)
+
+            await self.app(scope, receive, traced_send)
+
+
+def _collector_handler(output: Path):
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with open(output, "a") as f:
+                for resource in body.get("resourceSpans", []):
+                    for scope in resource.get("scopeSpans", []):
+                        for otlp_span in scope.get("spans", []):
+                            f.write(json.dumps(otlp_span) + "\n")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    import argparse
+    from http.server import HTTPServer
+
+    parser = argparse.ArgumentParser(description="Minimal OTLP/HTTP JSON collector that writes spans to a file")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--output", default=str(DEFAULT_TRACE_FILE))
+    args = parser.parse_args()
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    print(f"Collecting OTLP spans on http://localhost:{args.port}/v1/traces -> {output}")
+    HTTPServer(("", args.port), _collector_handler(output)).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
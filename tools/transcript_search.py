@@ -0,0 +1,521 @@
+"""
+Transcript Search
+Full-text index (SQLite FTS5) over call transcripts.
+
+store_artifact adds every transcript to the index as it is stored, one row
+per conversation turn, so quality review can find calls where the customer
+said "chargeback" or "talk to a lawyer" without reading storage/transcripts.
+Queries support quoted phrases, a speaker filter (customer / agent), and
+return calls ranked by BM25 with a highlighted snippet of each matching turn.
+
+Query syntax (search_transcripts tool, GET /transcripts/search):
+    chargeback lawyer        turns containing both words
+    "talk to a lawyer"       the exact phrase
+    match="any"              turns containing any of the words / phrases
+
+Each turn's FTS rowid encodes its transcript, turn number and speaker, so
+speaker filters and per-transcript grouping never read the stored turn text.
+
+Rebuild the index from existing transcripts (files and blob manifests) with:
+    python -m tools.transcript_search rebuild --storage storage
+"""
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from tools.ids import session_from_stem
+from tools.paths import STORAGE_DIR
+
+DEFAULT_INDEX_PATH = STORAGE_DIR / "transcript_index.db"
+
+# Keys a transcript's turns may be stored under, and the keys of each turn
+TURN_LIST_KEYS = ("conversation", "messages", "turns", "transcript")
+SPEAKER_KEYS = ("speaker", "role")
+TEXT_KEYS = ("text", "content", "message")
+
+# Speaker filter codes (chat-style roles map to the same speakers)
+SPEAKER_CODES = {"customer": 1, "user": 1, "agent": 2, "assistant": 2}
+
+# A turn's FTS rowid is (transcript id << 14) | (turn << 2) | speaker code, so
+# the transcript and speaker of a match are known without reading the row.
+TURN_BITS = 12
+SPEAKER_BITS = 2
+MAX_TURNS = 1 << TURN_BITS
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 200
+# Broad queries are ranked among the newest matching turns only
+MAX_SCORED_TURNS = 20000
+SNIPPET_TOKENS = 16
+REBUILD_BATCH = 500
+
+_TRANSCRIPT_SHIFT = TURN_BITS + SPEAKER_BITS
+_SPEAKER_MASK = (1 << SPEAKER_BITS) - 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    customer_id TEXT,
+    stored_at TEXT,
+    path TEXT,
+    turn_count INTEGER NOT NULL,
+    UNIQUE (session_id, sha256)
+);
+CREATE INDEX IF NOT EXISTS transcripts_customer ON transcripts (customer_id);
+CREATE INDEX IF NOT EXISTS transcripts_path ON transcripts (path);
+CREATE VIRTUAL TABLE IF NOT EXISTS turns USING fts5(
+    text,
+    speaker UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# Quoted phrases or bare words in a query
+_QUERY_TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def extract_turns(transcript: Any) -> List[Tuple[str, str]]:
+    """
+    (speaker, text) pairs of a transcript.
+
+    Accepts the agent's {"conversation": [{"speaker", "text"}, ...]} format,
+    chat-style {"messages": [{"role", "content"}]} and plain text.
+    """
+    if isinstance(transcript, str):
+        return [("unknown", transcript)] if transcript.strip() else []
+    items: Any = transcript
+    if isinstance(transcript, dict):
+        items = next((transcript[key] for key in TURN_LIST_KEYS if isinstance(transcript.get(key), (list, str))), [])
+        if isinstance(items, str):
+            return extract_turns(items)
+    turns = []
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, str):
+            turns.append(("unknown", item))
+            continue
+        if not isinstance(item, dict):
+            continue
+        speaker = next((item[key] for key in SPEAKER_KEYS if item.get(key)), "unknown")
+        text = next((item[key] for key in TEXT_KEYS if isinstance(item.get(key), str)), "")
+        if text.strip():
+            turns.append((str(speaker).lower(), text))
+    return turns
+
+
+def build_match(query: str, match: str = "all") -> str:
+    """
+    FTS5 MATCH expression for a search query.
+
+    Every word and quoted phrase is passed to FTS5 as a quoted string, so
+    user input can't inject FTS5 operators.
+
+    Raises:
+        ValueError: if the query has no searchable terms
+    """
+    terms = []
+    for phrase, word in _QUERY_TOKEN.findall(query or ""):
+        term = (phrase or word).strip()
+        if term:
+            terms.append('"' + term.replace('"', '""') + '"')
+    if not terms:
+        raise ValueError("Search query is empty")
+    return (" OR " if match == "any" else " AND ").join(terms)
+
+
+def _turn_rowid(transcript_id: int, turn: int, speaker: str) -> int:
+    return (transcript_id << _TRANSCRIPT_SHIFT) | (turn << SPEAKER_BITS) | SPEAKER_CODES.get(speaker, 0)
+
+
+class TranscriptIndex:
+    """
+    Full-text transcript index in a SQLite database shared by every worker.
+
+    Opened on first use, in WAL mode, with one connection per process (and thread).
+    """
+
+    def __init__(self, path: Path = DEFAULT_INDEX_PATH):
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, isolation_level=None, timeout=5.0)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _insert(
+        self,
+        connection: sqlite3.Connection,
+        session_id: str,
+        transcript: Any,
+        metadata: Optional[Dict[str, Any]],
+        path: Optional[str],
+        sha256: Optional[str]
+    ) -> bool:
+        if sha256 is None:
+            sha256 = hashlib.sha256(json.dumps(transcript, sort_keys=True).encode("utf-8")).hexdigest()
+        metadata = metadata or {}
+        # Turns past MAX_TURNS are not searchable
+        turns = extract_turns(transcript)[:MAX_TURNS]
+        cursor = connection.execute(
+            "INSERT OR IGNORE INTO transcripts (session_id, sha256, customer_id, stored_at, path, turn_count) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (session_id, sha256, metadata.get("customer_id"),
+             metadata.get("stored_at") or (transcript.get("stored_at") if isinstance(transcript, dict) else None),
+             path, len(turns))
+        )
+        if cursor.rowcount == 0:
+            # Same transcript already indexed for this session (retried end_call)
+            return False
+        transcript_id = cursor.lastrowid
+        connection.executemany(
+            "INSERT INTO turns (rowid, text, speaker) VALUES (?, ?, ?)",
+            [(_turn_rowid(transcript_id, number, speaker), text, speaker) for number, (speaker, text) in enumerate(turns)]
+        )
+        return True
+
+    def add(
+        self,
+        session_id: str,
+        transcript: Any,
+        metadata: Optional[Dict[str, Any]] = None,
+        path: Optional[str] = None,
+        sha256: Optional[str] = None
+    ) -> bool:
+        """
+        Index one transcript.
+
+        Args:
+            session_id: Session ID
+            transcript: Transcript payload (see extract_turns)
+            metadata: Artifact metadata (customer_id is indexed)
+            path: Where the transcript is stored
+            sha256: Content hash (computed if not given)
+
+        Returns:
+            False if this session's transcript with the same content was already indexed
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            added = self._insert(connection, session_id, transcript, metadata, path, sha256)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return added
+
+    def add_many(self, transcripts: Iterable[Tuple[str, Any, Optional[Dict[str, Any]], Optional[str], Optional[str]]]) -> int:
+        """Index (session_id, transcript, metadata, path, sha256) tuples in one transaction."""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            added = sum(self._insert(connection, *item) for item in transcripts)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return added
+
+    def search(
+        self,
+        query: str,
+        speaker: Optional[str] = None,
+        customer_id: Optional[str] = None,
+        match: str = "all",
+        limit: int = DEFAULT_LIMIT,
+        offset: int = 0
+    ) -> Dict[str, Any]:
+        """
+        Find transcripts with turns matching a query, best match first.
+
+        A transcript's score is the BM25 score of its best matching turn
+        (higher is better); ties go to the transcript with more matching
+        turns. Queries matching more than MAX_SCORED_TURNS turns are ranked
+        among the newest MAX_SCORED_TURNS matches ("ranked_newest": true).
+
+        Args:
+            query: Words and quoted phrases
+            speaker: Only match turns by this speaker (customer, agent)
+            customer_id: Only search this customer's transcripts
+            match: "all" (every term in one turn) or "any"
+            limit: Transcripts per page (at most MAX_LIMIT)
+            offset: Transcripts to skip
+
+        Returns:
+            Dict with ranked results (session, score, matching turns with
+            snippets) and the total number of matching transcripts
+
+        Raises:
+            ValueError: for an empty or invalid query, or an unknown speaker
+        """
+        expression = build_match(query, match)
+        limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+        offset = max(0, int(offset or 0))
+        filters = ""
+        params: List[Any] = [expression]
+        if speaker:
+            if speaker.lower() not in SPEAKER_CODES:
+                raise ValueError(f"Unknown speaker: {speaker}")
+            filters += f" AND (rowid & {_SPEAKER_MASK}) = ?"
+            params.append(SPEAKER_CODES[speaker.lower()])
+        if customer_id is not None:
+            filters += f" AND (rowid >> {_TRANSCRIPT_SHIFT}) IN (SELECT id FROM transcripts WHERE customer_id = ?)"
+            params.append(customer_id)
+
+        connection = self._connection()
+        try:
+            ranked = connection.execute(
+                # MATERIALIZED keeps bm25() out of the aggregate (SQLite would flatten the subquery)
+                "WITH hits AS MATERIALIZED ("
+                f"SELECT rowid >> {_TRANSCRIPT_SHIFT} AS transcript_id, bm25(turns) AS score "
+                f"FROM turns WHERE turns MATCH ?{filters} ORDER BY rowid DESC LIMIT {MAX_SCORED_TURNS}) "
+                "SELECT transcript_id, MIN(score) AS score, COUNT(*) AS hits, "
+                "COUNT(*) OVER () AS total, (SELECT COUNT(*) FROM hits) AS scored "
+                "FROM hits GROUP BY transcript_id ORDER BY score, hits DESC, transcript_id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+            ranked_newest = bool(ranked) and ranked[0]["scored"] >= MAX_SCORED_TURNS
+            if ranked and not ranked_newest:
+                total_count = ranked[0]["total"]
+            else:
+                total_count = connection.execute(
+                    f"SELECT COUNT(DISTINCT rowid >> {_TRANSCRIPT_SHIFT}) FROM turns WHERE turns MATCH ?{filters}",
+                    params
+                ).fetchone()[0]
+                ranked_newest = total_count > 0 and ranked_newest
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"Invalid search query: {e}")
+
+        ids = [row["transcript_id"] for row in ranked]
+        transcripts = {
+            row["id"]: row for row in connection.execute(
+                f"SELECT * FROM transcripts WHERE id IN ({', '.join('?' * len(ids))})", ids
+            )
+        }
+        results = []
+        for row in ranked:
+            transcript = transcripts[row["transcript_id"]]
+            results.append({
+                "session_id": transcript["session_id"],
+                "customer_id": transcript["customer_id"],
+                "stored_at": transcript["stored_at"],
+                "path": transcript["path"],
+                "score": round(-row["score"], 4),
+                "match_count": row["hits"],
+                "matches": self._matches(connection, row["transcript_id"], expression, params[1:2] if speaker else [])
+            })
+        return {
+            "query": query,
+            "speaker": speaker,
+            "results": results,
+            "total_count": total_count,
+            "returned_count": len(results),
+            "has_more": offset + len(results) < total_count,
+            "ranked_newest": ranked_newest
+        }
+
+    @staticmethod
+    def _matches(
+        connection: sqlite3.Connection,
+        transcript_id: int,
+        expression: str,
+        speaker_code: List[int]
+    ) -> List[Dict[str, Any]]:
+        """Matching turns of one transcript, with highlighted snippets."""
+        first = transcript_id << _TRANSCRIPT_SHIFT
+        speaker_filter = f" AND (rowid & {_SPEAKER_MASK}) = ?" if speaker_code else ""
+        return [
+            {"turn": (row["rowid"] >> SPEAKER_BITS) & (MAX_TURNS - 1), "speaker": row["speaker"], "snippet": row["snippet"]}
+            for row in connection.execute(
+                f"SELECT rowid, speaker, snippet(turns, 0, '[', ']', '...', {SNIPPET_TOKENS}) AS snippet "
+                f"FROM turns WHERE turns MATCH ? AND rowid BETWEEN ? AND ?{speaker_filter} ORDER BY rowid",
+                [expression, first, first + (1 << _TRANSCRIPT_SHIFT) - 1] + speaker_code
+            )
+        ]
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM transcripts").fetchone()[0]
+
+    def optimize(self) -> None:
+        """Merge the FTS index segments (after a bulk load)."""
+        self._connection().execute("INSERT INTO turns (turns) VALUES ('optimize')")
+
+    def checkpoint(self) -> None:
+        """Copy the WAL into the database file and fsync it (at shutdown)."""
+        self._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def relocate(self, paths: Dict[str, str]) -> int:
+        """Point transcripts at new locations ({old path: new path}, e.g. after archiving)."""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            moved = sum(
+                connection.execute("UPDATE transcripts SET path = ? WHERE path = ?", (new, old)).rowcount
+                for old, new in paths.items()
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return moved
+
+    def delete_before(self, stored_at: str, batch: int = REBUILD_BATCH) -> int:
+        """Delete transcripts (and their turns) stored before an ISO timestamp, a batch per transaction."""
+        return self._delete_where("stored_at < ?", (stored_at,), batch)
+
+    def delete_paths(self, prefixes: List[str]) -> int:
+        """Delete transcripts stored at paths starting with any prefix (an expired file or "<archive>::")."""
+        return sum(
+            self._delete_where("path >= ? AND path < ?", (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)))
+            for prefix in prefixes
+        )
+
+    def _delete_where(self, condition: str, params: Tuple, batch: int = REBUILD_BATCH) -> int:
+        connection = self._connection()
+        deleted = 0
+        while True:
+            ids = [row[0] for row in connection.execute(
+                f"SELECT id FROM transcripts WHERE {condition} LIMIT ?", (*params, batch)
+            )]
+            if not ids:
+                return deleted
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany(
+                    "DELETE FROM turns WHERE rowid BETWEEN ? AND ?",
+                    [(i << _TRANSCRIPT_SHIFT, ((i + 1) << _TRANSCRIPT_SHIFT) - 1) for i in ids]
+                )
+                connection.executemany("DELETE FROM transcripts WHERE id = ?", [(i,) for i in ids])
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            deleted += len(ids)
+
+    def clear(self) -> None:
+        connection = self._connection()
+        connection.execute("DELETE FROM turns")
+        connection.execute("DELETE FROM transcripts")
+
+    def rebuild(self, storage_dir: Path, read: Optional[Callable[[Path], Any]] = None) -> Dict[str, Any]:
+        """
+        Replace the index contents with every stored transcript.
+
+        Reads timestamped files in storage/transcripts and transcript entries
+        of the session manifests (blob store).
+
+        Args:
+            storage_dir: Storage directory
+            read: Function that loads one file (default: tools.compression.read_json)
+
+        Returns:
+            Dict with counts of indexed and skipped transcripts
+        """
+        if read is None:
+            from tools.compression import read_json as read
+        started = time.perf_counter()
+        self.clear()
+        indexed = skipped = 0
+        batch: List[Tuple] = []
+        for item in _stored_transcripts(Path(storage_dir), read):
+            if item is None:
+                skipped += 1
+                continue
+            batch.append(item)
+            if len(batch) >= REBUILD_BATCH:
+                indexed += self.add_many(batch)
+                batch = []
+        if batch:
+            indexed += self.add_many(batch)
+        self.optimize()
+        return {
+            "indexed": indexed,
+            "skipped": skipped,
+            "index_path": str(self.path),
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+
+
+def _stored_transcripts(storage_dir: Path, read: Callable[[Path], Any]) -> Iterator[Optional[Tuple]]:
+    """(session_id, transcript, metadata, path, sha256) for each stored transcript (None if unreadable)."""
+    for path in sorted((storage_dir / "transcripts").glob("*.json*")):
+        try:
+            transcript = read(path)
+        except (ValueError, OSError, RuntimeError):
+            yield None
+            continue
+        if not isinstance(transcript, dict):
+            yield None
+            continue
+        session_id = str(transcript.get("session_id") or session_from_stem(path.name.split(".json", 1)[0]))
+        yield session_id, transcript, transcript.get("metadata"), str(path), None
+
+    for manifest_path in sorted((storage_dir / "manifests").glob("*.json")):
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (ValueError, OSError):
+            yield None
+            continue
+        for entry in manifest.get("artifacts", []):
+            if entry.get("type") != "transcript":
+                continue
+            digest = entry["sha256"]
+            blob_path = next(
+                (path for path in (storage_dir / "blobs" / digest[:2]).glob(f"{digest}.json*")), None
+            )
+            try:
+                transcript = read(blob_path)
+            except (TypeError, ValueError, OSError, RuntimeError):
+                yield None
+                continue
+            metadata = {**entry.get("metadata", {}), "stored_at": entry.get("stored_at")}
+            yield manifest["session_id"], transcript, metadata, str(blob_path), digest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcript full-text index")
+    parser.add_argument("--storage", default=str(STORAGE_DIR), help="Storage directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("rebuild", help="Rebuild the index from stored transcripts")
+    search = subparsers.add_parser("search", help="Search the index")
+    search.add_argument("query", help='Words and "quoted phrases"')
+    search.add_argument("--speaker", default=None, help="Only match turns by this speaker")
+    search.add_argument("--any", action="store_true", help="Match any term instead of all")
+    search.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    args = parser.parse_args()
+
+    storage_dir = Path(args.storage)
+    index = TranscriptIndex(storage_dir / "transcript_index.db")
+    if args.command == "rebuild":
+        from tools.compression import Compressor, read_json
+
+        compressor = Compressor("none", storage_dir / "dictionaries")
+        result = index.rebuild(storage_dir, read=lambda path: read_json(path, compressor))
+        print(f"Indexed {result['indexed']} transcripts ({result['skipped']} skipped) "
+              f"in {result['seconds']}s -> {result['index_path']}")
+    else:
+        result = index.search(args.query, args.speaker, match="any" if args.any else "all", limit=args.limit)
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
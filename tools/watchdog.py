@@ -0,0 +1,175 @@
+"""
+Event Loop Watchdog
+Detects blocking work on the event loop: synchronous I/O or long CPU work
+inside async tool handlers that stalls every other request.
+
+A heartbeat task wakes up every `interval` and records how late it was
+(event loop lag). A watchdog thread notices when the heartbeat stops for
+longer than `threshold`. While the loop is still blocked, the thread samples
+the loop thread's stack. The samples give the tool being handled (the name
+argument of call_tool) and the repository code that was running most often.
+When the loop recovers, the stall is logged and counted in metrics.
+"""
+
+from typing import Any, Deque, Dict, List, Optional
+from collections import Counter, deque
+from pathlib import Path
+import asyncio
+import logging
+import sys
+import threading
+import time
+
+from tools.metrics import MetricsRegistry, metrics as default_metrics
+
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = str(Path(__file__).resolve().parent.parent)
+DEFAULT_THRESHOLD = 0.1
+DEFAULT_INTERVAL = 0.02
+
+# Frames whose `name` local is the tool being handled
+_DISPATCH_FUNCTIONS = ("call_tool", "_dispatch_tool")
+
+
+class BlockingEvent:
+    """One stall of the event loop, built from stack samples taken while it lasts."""
+
+    __slots__ = ("tool", "location", "leaf", "samples", "detected_at", "blocked_seconds")
+
+    def __init__(self):
+        self.tool = "none"
+        self.location = "unknown"
+        self.leaf = "unknown"
+        self.samples: Counter = Counter()
+        self.detected_at = time.time()
+        self.blocked_seconds = 0.0
+
+    def add_sample(self, frame) -> None:
+        """Attribute one stack sample: the tool being handled and the innermost repository frame."""
+        leaf = _describe(frame)
+        location = None
+        while frame is not None:
+            code = frame.f_code
+            if location is None and code.co_filename.startswith(REPO_ROOT):
+                location = _describe(frame)
+            if code.co_name in _DISPATCH_FUNCTIONS:
+                name = frame.f_locals.get("name")
+                if isinstance(name, str):
+                    self.tool = name
+                    break
+            frame = frame.f_back
+        self.samples[(location or leaf, leaf)] += 1
+        # Report the location seen in most samples
+        (self.location, self.leaf), _ = self.samples.most_common(1)[0]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "tool": self.tool,
+            "location": self.location,
+            "leaf": self.leaf,
+            "samples": sum(self.samples.values()),
+            "blocked_ms": round(self.blocked_seconds * 1000, 3)
+        }
+
+
+def _describe(frame) -> str:
+    code = frame.f_code
+    path = code.co_filename
+    if path.startswith(REPO_ROOT):
+        path = path[len(REPO_ROOT) + 1:]
+    return f"{path}:{frame.f_lineno} ({code.co_name})"
+
+
+class LoopWatchdog:
+    """Measures event loop lag and reports stalls longer than a threshold."""
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        interval: float = DEFAULT_INTERVAL,
+        registry: MetricsRegistry = default_metrics,
+        history: int = 100
+    ):
+        self.threshold = threshold
+        self.interval = interval
+        self.registry = registry
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.events: Deque[BlockingEvent] = deque(maxlen=history)
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = 0.0
+        self._stall: Optional[BlockingEvent] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        """Start watching the running event loop."""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="rrva-loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+
+    def recent_events(self) -> List[Dict[str, Any]]:
+        return [event.to_dict() for event in self.events]
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self._last_beat = now
+            stall = self._stall
+            if stall is not None:
+                self._stall = None
+                stall.blocked_seconds = lag
+                self._report(stall)
+
+    def _watch(self) -> None:
+        stall = None
+        stalled_beat = None
+        while not self._stop.wait(self.interval / 2):
+            beat = self._last_beat
+            if time.monotonic() - beat < self.interval + self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None or frame.f_code.co_filename.endswith("selectors.py"):
+                # The loop is waiting for I/O; the delay comes from another thread holding the GIL
+                continue
+            if stalled_beat != beat:
+                stall = BlockingEvent()
+                stalled_beat = beat
+            stall.add_sample(frame)
+            if self._last_beat == beat:
+                self._stall = stall
+
+    def _report(self, event: BlockingEvent) -> None:
+        self.events.append(event)
+        self.registry.increment(
+            "event_loop_blocked_total", "Event loop stalls longer than the watchdog threshold.", tool=event.tool
+        )
+        self.registry.increment(
+            "event_loop_blocked_seconds_total", "Time the event loop spent blocked in reported stalls.",
+            amount=event.blocked_seconds, tool=event.tool
+        )
+        logger.warning(
+            "Event loop blocked for %.1fms in tool %s at %s (leaf: %s)",
+            event.blocked_seconds * 1000, event.tool, event.location, event.leaf
+        )